@@ -1,10 +1,45 @@
-from fast_alpr import ALPR
+"""
+Leitura de matrículas em imagens pela linha de comandos, com o mesmo serviço ALPR do
+servidor (alpr_service.AlprService e a configuração do main.py: ALPR_DETECTOR_MODEL,
+ALPR_OCR_MODEL, ALPR_CASCADE, ...). Importar este módulo não carrega nenhum modelo.
 
-alpr = ALPR(
-    detector_model="yolo-v9-t-384-license-plate-end2end",
-    ocr_model="cct-s-v1-global-model",
-)
+Uso:
+    python alpr.py assets/test_image.png [outra.jpg ...]
+"""
+import argparse
 
-# The "assets/test_image.png" can be found in repo root dir
-#alpr_results = alpr.predict("assets/test_image.png")
-#print(alpr_results)
\ No newline at end of file
+import cv2
+
+from alpr_service import normalize_confidence
+
+
+def main_cli():
+    parser = argparse.ArgumentParser(description="Lê as matrículas de uma ou mais imagens.")
+    parser.add_argument("images", nargs="+", help="Ficheiros de imagem")
+    args = parser.parse_args()
+
+    import main  # configuração e alpr_engine do servidor
+
+    for path in args.images:
+        image = cv2.imread(path)
+        if image is None:
+            print(f"[ERRO] Não foi possível ler a imagem: {path}")
+            continue
+        results = main.alpr_engine.recognize(image, "cli")
+        if results is None:
+            print("[ERRO] ALPR indisponível (fast_alpr não instalado ou ENABLE_ALPR=false)")
+            return
+        if not results:
+            print(f"{path}: nenhuma matrícula")
+        for result in results:
+            text = result.ocr.text if result.ocr is not None else None
+            ocr_conf = normalize_confidence(result.ocr.confidence) if result.ocr is not None else None
+            det_conf = normalize_confidence(result.detection.confidence)
+            det_label = f"{det_conf:.2f}" if det_conf is not None else "-"
+            ocr_label = f"{ocr_conf:.2f}" if ocr_conf is not None else "-"
+            print(f"{path}: {text} (deteção {det_label}, OCR {ocr_label})")
+    print(main.alpr_engine.latency_stats())
+
+
+if __name__ == "__main__":
+    main_cli()
@@ -0,0 +1,924 @@
+"""
+Serviço ALPR (fast-alpr) do processo: o AlprService é o único dono do modelo e é usado pelo
+monitor das vagas, pelas cancelas (/api/entry, /api/exit) e pelo ESP32 das vagas
+(/api/parking-spot-occupied); cada processo carrega os modelos uma só vez.
+
+Camada de batching para as vagas do monitor:
+
+Quando várias vagas ficam ocupadas ao mesmo tempo (arranque, autocarro a descarregar),
+cada crop era um alpr.predict() separado. O AlprBatcher junta os crops que chegam dentro
+de uma janela curta (ALPR_BATCH_WINDOW_MS) e corre o detetor e o OCR ONNX sobre o batch
+inteiro; cada pedido recebe o seu resultado num Future, como o ThreadPoolExecutor de antes.
+
+    submit(vaga, crop) -> Future[(vaga, [ALPRResult, ...] | None)]
+
+Com ALPR_EXECUTOR=process os batches correm num AlprProcessPool: cada processo carrega o
+seu próprio ALPR no arranque (sem disputar o GIL nem partilhar um modelo entre threads) e
+recebe os crops por memória partilhada, sem serializar os arrays.
+
+CascadeAlpr (ALPR_CASCADE=true): detetor pequeno primeiro; só as leituras com confiança de
+deteção ou de OCR abaixo dos limiares voltam a correr com o detetor grande.
+
+BoundedExecutor: executor das imagens das cancelas (/api/entry, /api/exit), fora do event
+loop e com admissão limitada; quando está cheio o pedido é recusado (503 + Retry-After)
+em vez de se acumular.
+
+AlprResultCache: cache de leituras por hash perceptual (pHash) do crop da vaga. Se uma
+vaga oscila livre/ocupada com o mesmo carro, o crop é quase igual e reutiliza-se a
+matrícula lida antes em vez de correr o ALPR outra vez.
+"""
+import math
+import multiprocessing
+import os
+import threading
+import time
+import traceback
+from collections import OrderedDict, deque
+from concurrent.futures import Executor, Future, ProcessPoolExecutor, ThreadPoolExecutor
+from multiprocessing import shared_memory
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+import cv2
+import numpy as np
+
+try:
+    from fast_alpr.alpr import ALPR, ALPRResult  # type: ignore
+    from fast_alpr.base import OcrResult  # type: ignore
+    from fast_alpr.default_detector import DefaultDetector  # type: ignore
+    from fast_alpr.default_ocr import DefaultOCR  # type: ignore
+except ImportError:  # pragma: no cover - fast_alpr opcional
+    ALPR = ALPRResult = OcrResult = DefaultDetector = DefaultOCR = None
+
+
+def normalize_confidence(value: Any) -> Optional[float]:
+    """Confiança do fast-alpr (valor único ou lista por carácter) num só float (média)."""
+    if value is None:
+        return None
+    if isinstance(value, (int, float)):
+        return float(value)
+    if isinstance(value, (list, tuple)):
+        vals = [float(v) for v in value if v is not None]
+        if not vals:
+            return None
+        return sum(vals) / len(vals)
+    return None
+
+
+def _clip_plate(image: np.ndarray, detection) -> np.ndarray:
+    bbox = detection.bounding_box
+    x1, y1 = max(bbox.x1, 0), max(bbox.y1, 0)
+    x2, y2 = min(bbox.x2, image.shape[1]), min(bbox.y2, image.shape[0])
+    return image[y1:y2, x1:x2]
+
+
+def detect_batch(alpr, images: Sequence[np.ndarray]) -> List[list]:
+    """Deteções de matrículas para cada imagem; uma chamada ao detetor se for o DefaultDetector."""
+    detector = alpr.detector
+    if DefaultDetector is not None and isinstance(detector, DefaultDetector) and len(images) > 1:
+        return list(detector.detector.predict(list(images)))
+    return [detector.predict(image) for image in images]
+
+
+def ocr_batch(alpr, plates: Sequence[np.ndarray]) -> List[Optional[Any]]:
+    """OCR de todos os crops de matrícula numa única sessão ONNX (DefaultOCR) ou um a um."""
+    if not plates:
+        return []
+    ocr = alpr.ocr
+    if DefaultOCR is None or not isinstance(ocr, DefaultOCR) or len(plates) == 1:
+        return [ocr.predict(plate) for plate in plates]
+
+    model = ocr.ocr_model
+    mode = model.config.image_color_mode
+    if mode == "grayscale":
+        inputs = [cv2.cvtColor(p, cv2.COLOR_BGR2GRAY) for p in plates]
+    elif mode == "rgb":
+        inputs = [cv2.cvtColor(p, cv2.COLOR_BGR2RGB) for p in plates]
+    else:
+        inputs = list(plates)
+
+    results = []
+    for prediction in model.run(inputs, return_confidence=True):
+        char_probs = prediction.char_probs
+        results.append(OcrResult(
+            text=prediction.plate,
+            confidence=0.0 if char_probs is None else [float(x) for x in char_probs.tolist()],
+            region=prediction.region,
+            region_confidence=prediction.region_prob,
+        ))
+    return results
+
+
+def plate_detections(results) -> List[Dict[str, Any]]:
+    """Caixas e confianças das leituras em JSON (guardadas na sessão em vez da imagem anotada)."""
+    detections = []
+    for result in results or []:
+        bbox = result.detection.bounding_box
+        ocr = result.ocr
+        detections.append({
+            "bbox": [int(bbox.x1), int(bbox.y1), int(bbox.x2), int(bbox.y2)],
+            "det_conf": normalize_confidence(result.detection.confidence),
+            "plate": ocr.text if ocr is not None else None,
+            "ocr_conf": normalize_confidence(ocr.confidence) if ocr is not None else None,
+        })
+    return detections
+
+
+def draw_plate_detections(image: np.ndarray, detections: Sequence[Dict[str, Any]]) -> np.ndarray:
+    """Desenha (in-place) as caixas e matrículas de plate_detections(), no estilo do fast-alpr."""
+    font_scale = min(1.25, max(0.4, image.shape[1] / 1000))
+    thickness = 1 if font_scale < 0.75 else 2
+    for detection in detections:
+        x1, y1, x2, y2 = detection["bbox"]
+        cv2.rectangle(image, (x1, y1), (x2, y2), (36, 255, 12), 2)
+        if not detection.get("plate"):
+            continue
+        label = detection["plate"]
+        if detection.get("ocr_conf") is not None:
+            label += f" {detection['ocr_conf'] * 100:.0f}%"
+        (_, text_height), _ = cv2.getTextSize(label, cv2.FONT_HERSHEY_SIMPLEX, font_scale, thickness)
+        y = y1 - 10 if y1 - 10 - text_height >= 0 else y2 + text_height + 10
+        cv2.putText(image, label, (x1, y), cv2.FONT_HERSHEY_SIMPLEX, font_scale, (0, 0, 0), thickness + 3, cv2.LINE_AA)
+        cv2.putText(image, label, (x1, y), cv2.FONT_HERSHEY_SIMPLEX, font_scale, (255, 255, 255), thickness, cv2.LINE_AA)
+    return image
+
+
+def predict_batch(alpr, images: Sequence[np.ndarray]) -> List[list]:
+    """Equivalente a [alpr.predict(img) for img in images] com o detetor e o OCR em batch."""
+    if isinstance(alpr, CascadeAlpr):
+        return alpr.predict_batch(images)
+    detections = detect_batch(alpr, images)
+    plates, owners = [], []
+    for index, (image, image_detections) in enumerate(zip(images, detections)):
+        for detection in image_detections:
+            plate = _clip_plate(image, detection)
+            if plate.size == 0:
+                continue
+            plates.append(plate)
+            owners.append((index, detection))
+
+    results: List[list] = [[] for _ in images]
+    for (index, detection), ocr_result in zip(owners, ocr_batch(alpr, plates)):
+        results[index].append(ALPRResult(detection=detection, ocr=ocr_result))
+    return results
+
+
+class CascadeAlpr:
+    """
+    Dois níveis de ALPR com a mesma interface (predict):
+    - fast: detetor pequeno (ex.: yolo-v9-t-384) + OCR;
+    - full: detetor grande (ex.: yolo-v9-s-608) + OCR, só para as imagens em que a 1ª leitura
+      não tem matrícula ou tem confiança de deteção < min_det_conf ou de OCR < min_ocr_conf.
+    stats(): por nível, imagens processadas, leituras aceites (taxa de acerto) e latência média.
+    """
+
+    def __init__(self, fast, full, min_det_conf: float = 0.6, min_ocr_conf: float = 0.8):
+        self.fast = fast
+        self.full = full
+        self.min_det_conf = min_det_conf
+        self.min_ocr_conf = min_ocr_conf
+        self._lock = threading.Lock()
+        self._tiers = {name: {"images": 0, "accepted": 0, "seconds": 0.0} for name in ("fast", "full")}
+
+    @property
+    def tiers(self) -> list:
+        return [self.fast, self.full]
+
+    def accepts(self, results: Optional[list]) -> bool:
+        if not results:
+            return False
+        first = results[0]
+        ocr = getattr(first, "ocr", None)
+        if ocr is None or not ocr.text:
+            return False
+        det_conf = normalize_confidence(getattr(first.detection, "confidence", None))
+        ocr_conf = normalize_confidence(ocr.confidence)
+        return (det_conf or 0.0) >= self.min_det_conf and (ocr_conf or 0.0) >= self.min_ocr_conf
+
+    def _run_tier(self, name: str, alpr, images: Sequence[np.ndarray]) -> List[list]:
+        start = time.perf_counter()
+        results = predict_batch(alpr, images)
+        elapsed = time.perf_counter() - start
+        accepted = sum(1 for r in results if self.accepts(r))
+        with self._lock:
+            tier = self._tiers[name]
+            tier["images"] += len(images)
+            tier["accepted"] += accepted
+            tier["seconds"] += elapsed
+        return results
+
+    def predict_batch(self, images: Sequence[np.ndarray]) -> List[list]:
+        results = self._run_tier("fast", self.fast, images)
+        escalate = [i for i, r in enumerate(results) if not self.accepts(r)]
+        if escalate:
+            full_results = self._run_tier("full", self.full, [images[i] for i in escalate])
+            for index, full in zip(escalate, full_results):
+                # o detetor grande pode também não ler nada: manter a leitura fraca do pequeno
+                if full and getattr(full[0], "ocr", None) is not None and full[0].ocr.text:
+                    results[index] = full
+        return results
+
+    def predict(self, frame: np.ndarray) -> list:
+        return self.predict_batch([frame])[0]
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            result = {}
+            for name, tier in self._tiers.items():
+                images = tier["images"]
+                result[name] = {
+                    "images": images,
+                    "accepted": tier["accepted"],
+                    "hit_rate": round(tier["accepted"] / images, 3) if images else 0.0,
+                    "avg_ms": round(1000.0 * tier["seconds"] / images, 2) if images else 0.0,
+                }
+            fast_images = self._tiers["fast"]["images"]
+            result["escalation_rate"] = round(self._tiers["full"]["images"] / fast_images, 3) if fast_images else 0.0
+        result["min_det_conf"] = self.min_det_conf
+        result["min_ocr_conf"] = self.min_ocr_conf
+        return result
+
+
+def merge_cascade_stats(stats: Sequence[Dict[str, Any]]) -> Dict[str, Any]:
+    """Soma os contadores de várias CascadeAlpr.stats() (ex.: um por processo do pool)."""
+    result: Dict[str, Any] = {}
+    for name in ("fast", "full"):
+        images = sum(s[name]["images"] for s in stats)
+        accepted = sum(s[name]["accepted"] for s in stats)
+        total_ms = sum(s[name]["avg_ms"] * s[name]["images"] for s in stats)
+        result[name] = {
+            "images": images,
+            "accepted": accepted,
+            "hit_rate": round(accepted / images, 3) if images else 0.0,
+            "avg_ms": round(total_ms / images, 2) if images else 0.0,
+        }
+    fast_images = result["fast"]["images"]
+    result["escalation_rate"] = round(result["full"]["images"] / fast_images, 3) if fast_images else 0.0
+    result["min_det_conf"] = stats[0]["min_det_conf"]
+    result["min_ocr_conf"] = stats[0]["min_ocr_conf"]
+    return result
+
+
+def build_alpr(
+    detector_model: str,
+    ocr_model: str,
+    detector_providers=None,
+    ocr_providers=None,
+    ocr_device: str = "auto",
+    cascade_detector_model: Optional[str] = None,
+    cascade_ocr_model: Optional[str] = None,
+    cascade_min_det_conf: float = 0.6,
+    cascade_min_ocr_conf: float = 0.8,
+    sess_options=None,
+):
+    """
+    ALPR do fast-alpr, ou CascadeAlpr se cascade_detector_model for dado (o nível rápido usa
+    cascade_ocr_model, ou partilha o OCR do nível completo se for o mesmo modelo).
+    """
+    full = ALPR(
+        detector_model=detector_model,
+        ocr_model=ocr_model,
+        detector_providers=detector_providers,
+        ocr_providers=ocr_providers,
+        ocr_device=ocr_device,
+        detector_sess_options=sess_options,
+        ocr_sess_options=sess_options,
+    )
+    if not cascade_detector_model:
+        return full
+
+    fast_ocr = None if cascade_ocr_model and cascade_ocr_model != ocr_model else full.ocr
+    fast = ALPR(
+        detector_model=cascade_detector_model,
+        ocr=fast_ocr,
+        ocr_model=cascade_ocr_model or ocr_model,
+        detector_providers=detector_providers,
+        ocr_providers=ocr_providers,
+        ocr_device=ocr_device,
+        detector_sess_options=sess_options,
+        ocr_sess_options=sess_options,
+    )
+    return CascadeAlpr(fast, full, cascade_min_det_conf, cascade_min_ocr_conf)
+
+
+def warm_up_alpr(alpr) -> float:
+    """
+    Inferência de aquecimento no detetor e no OCR (a primeira chamada a cada sessão ONNX
+    aloca buffers e é muito mais lenta). Devolve a duração em segundos.
+    """
+    start = time.perf_counter()
+    for tier in getattr(alpr, "tiers", [alpr]):
+        tier.detector.predict(np.zeros((384, 384, 3), dtype=np.uint8))
+        tier.ocr.predict(np.zeros((64, 128, 3), dtype=np.uint8))
+    return time.perf_counter() - start
+
+
+# ------------------------------------------------------------
+# Pool de processos (ALPR_EXECUTOR=process)
+# ------------------------------------------------------------
+_worker_alpr = None  # instância ALPR do processo worker
+
+
+def alpr_session_options(intra_op_threads: int):
+    """SessionOptions do onnxruntime com N threads intra-op (None = valores por omissão)."""
+    if intra_op_threads <= 0:
+        return None
+    import onnxruntime as ort
+
+    options = ort.SessionOptions()
+    options.intra_op_num_threads = intra_op_threads
+    options.inter_op_num_threads = 1
+    return options
+
+
+def _init_alpr_worker(alpr_kwargs: Dict[str, Any], intra_op_threads: int):
+    """Initializer de cada processo: carrega e aquece o ALPR uma vez."""
+    global _worker_alpr
+    try:
+        start = time.perf_counter()
+        _worker_alpr = build_alpr(**alpr_kwargs, sess_options=alpr_session_options(intra_op_threads))
+        load_seconds = time.perf_counter() - start
+        warmup_seconds = warm_up_alpr(_worker_alpr)
+        print(
+            f"[INFO] Worker ALPR {os.getpid()} pronto: modelo {load_seconds:.2f}s, aquecimento {warmup_seconds:.2f}s "
+            f"(intra-op threads: {intra_op_threads or 'auto'})"
+        )
+    except Exception as exc:
+        print(f"[WARN] Worker ALPR {os.getpid()} falhou a carregar o modelo: {exc}")
+        _worker_alpr = None
+
+
+def _predict_shared(shm_name: str, layout: List[Tuple[int, Tuple[int, ...]]]):
+    """
+    Corre no worker: crops lidos diretamente do bloco partilhado (views, sem cópia).
+    Devolve (resultados, pid, contadores da cascata ou None).
+    """
+    if _worker_alpr is None:
+        return None, os.getpid(), None
+    shm = shared_memory.SharedMemory(name=shm_name)
+    try:
+        images = [np.ndarray(shape, dtype=np.uint8, buffer=shm.buf, offset=offset) for offset, shape in layout]
+        results = predict_batch(_worker_alpr, images)
+        del images
+    finally:
+        shm.close()
+    tier_stats = _worker_alpr.stats() if isinstance(_worker_alpr, CascadeAlpr) else None
+    return results, os.getpid(), tier_stats
+
+
+def _release_shared(shm: shared_memory.SharedMemory):
+    shm.close()
+    shm.unlink()
+
+
+class AlprProcessPool:
+    """
+    N processos (spawn), cada um com o seu ALPR. submit(crops) copia os crops para um bloco
+    de memória partilhada e devolve um Future com [[ALPRResult, ...] por crop] (ou None se o
+    worker não tiver modelo); os resultados são pequenos (texto, confianças, bbox).
+    cascade_stats(): contadores da CascadeAlpr somados de todos os workers.
+    """
+
+    def __init__(self, workers: int, alpr_kwargs: Dict[str, Any], intra_op_threads: int = 0):
+        self.workers = max(1, workers)
+        self._executor = ProcessPoolExecutor(
+            max_workers=self.workers,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_init_alpr_worker,
+            initargs=(alpr_kwargs, intra_op_threads),
+        )
+        self._stats_lock = threading.Lock()
+        self._worker_stats: Dict[int, Dict[str, Any]] = {}
+
+    def warm_up(self) -> List[Future]:
+        """Arranca já todos os processos (o ProcessPoolExecutor só os cria quando há trabalho)."""
+        return [self._executor.submit(os.getpid) for _ in range(self.workers)]
+
+    def submit(self, crops: Sequence[np.ndarray]) -> Future:
+        crops = [np.ascontiguousarray(crop, dtype=np.uint8) for crop in crops]
+        layout, size = [], 0
+        for crop in crops:
+            layout.append((size, crop.shape))
+            size += crop.nbytes
+        shm = shared_memory.SharedMemory(create=True, size=max(1, size))
+        try:
+            for crop, (offset, shape) in zip(crops, layout):
+                np.ndarray(shape, dtype=np.uint8, buffer=shm.buf, offset=offset)[...] = crop
+            future = self._executor.submit(_predict_shared, shm.name, layout)
+        except Exception:
+            _release_shared(shm)
+            raise
+
+        outer: Future = Future()
+
+        def done(f: Future):
+            _release_shared(shm)
+            try:
+                results, pid, tier_stats = f.result()
+            except Exception as exc:
+                outer.set_exception(exc)
+                return
+            if tier_stats is not None:
+                with self._stats_lock:
+                    self._worker_stats[pid] = tier_stats
+            outer.set_result(results)
+
+        future.add_done_callback(done)
+        return outer
+
+    def cascade_stats(self) -> Optional[Dict[str, Any]]:
+        with self._stats_lock:
+            per_worker = list(self._worker_stats.values())
+        return merge_cascade_stats(per_worker) if per_worker else None
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+
+class AlprBatcher:
+    """
+    Junta pedidos de ALPR numa janela de window segundos (ou até max_batch) e corre-os em
+    batch no executor (ou no pool de processos, se for dado). Os Futures nunca falham: em
+    erro o resultado é (vaga, None). Os callbacks dos Futures correm sempre no executor.
+    """
+
+    def __init__(
+        self,
+        get_alpr: Callable[[], Any],
+        executor: Executor,
+        window: float = 0.05,
+        max_batch: int = 16,
+        pool: Optional[AlprProcessPool] = None,
+    ):
+        self.get_alpr = get_alpr
+        self.executor = executor
+        self.pool = pool
+        self.window = max(0.0, window)
+        self.max_batch = max(1, max_batch)
+        self._cond = threading.Condition()
+        self._items: List[Tuple[str, np.ndarray, Future]] = []
+        self.batches = 0
+        self.items_processed = 0
+        self.max_batch_seen = 0
+        self._thread = threading.Thread(target=self._collect_loop, name="alpr-batcher", daemon=True)
+        self._thread.start()
+
+    def submit(self, name: str, crop: np.ndarray) -> Future:
+        future: Future = Future()
+        with self._cond:
+            self._items.append((name, crop, future))
+            self._cond.notify()
+        return future
+
+    def stats(self) -> Dict[str, Any]:
+        with self._cond:
+            queued = len(self._items)
+        return {
+            "batches": self.batches,
+            "items": self.items_processed,
+            "avg_batch": round(self.items_processed / self.batches, 2) if self.batches else 0.0,
+            "max_batch": self.max_batch_seen,
+            "queued": queued,
+            "window_ms": round(self.window * 1000.0, 1),
+            "executor": "process" if self.pool is not None else "thread",
+        }
+
+    def _collect_loop(self):
+        while True:
+            with self._cond:
+                self._cond.wait_for(lambda: bool(self._items))
+                deadline = time.monotonic() + self.window
+                while len(self._items) < self.max_batch:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self._cond.wait(remaining)
+                batch = self._items[:self.max_batch]
+                del self._items[:self.max_batch]
+            self._dispatch(batch)
+
+    def _dispatch(self, batch: List[Tuple[str, np.ndarray, Future]]):
+        if self.pool is None:
+            self.executor.submit(self._run_batch, batch)
+            return
+        try:
+            future = self.pool.submit([crop for _, crop, _ in batch])
+        except Exception as exc:
+            print(f"[WARN] Pool ALPR indisponível ({len(batch)} crops): {exc}")
+            self.executor.submit(self._finish, batch, None)
+            return
+        future.add_done_callback(lambda f: self.executor.submit(self._finish, batch, self._pool_results(f, len(batch))))
+
+    @staticmethod
+    def _pool_results(future: Future, count: int) -> Optional[List[list]]:
+        try:
+            return future.result()
+        except Exception as exc:
+            print(f"[WARN] ALPR em batch falhou no worker ({count} crops): {exc}")
+            return None
+
+    def _run_batch(self, batch: List[Tuple[str, np.ndarray, Future]]):
+        results = None
+        alpr = self.get_alpr()
+        if alpr is not None:
+            try:
+                results = predict_batch(alpr, [crop for _, crop, _ in batch])
+            except Exception as exc:
+                print(f"[WARN] ALPR em batch falhou ({len(batch)} crops): {exc}")
+                traceback.print_exc()
+        self._finish(batch, results)
+
+    def _finish(self, batch: List[Tuple[str, np.ndarray, Future]], results: Optional[List[list]]):
+        if results is None:
+            results = [None] * len(batch)
+        self.batches += 1
+        self.items_processed += len(batch)
+        self.max_batch_seen = max(self.max_batch_seen, len(batch))
+        if len(batch) > 1:
+            print(f"[INFO] ALPR em batch: {len(batch)} vagas ({', '.join(name for name, _, _ in batch)})")
+        for (name, _, future), result in zip(batch, results):
+            future.set_result((name, result))
+
+
+# ------------------------------------------------------------
+# Cache por hash perceptual
+# ------------------------------------------------------------
+HASH_BITS = 64
+
+
+def perceptual_hash(image: np.ndarray) -> int:
+    """pHash de 64 bits: DCT 32x32 em tons de cinzento, bloco 8x8 de baixas frequências vs mediana."""
+    gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY) if image.ndim == 3 else image
+    small = cv2.resize(gray, (32, 32), interpolation=cv2.INTER_AREA).astype(np.float32)
+    low = cv2.dct(small)[:8, :8].flatten()
+    bits = low > np.median(low[1:])  # ignora o termo DC na mediana
+    return int.from_bytes(np.packbits(bits).tobytes(), "big")
+
+
+def hamming_distance(a: int, b: int) -> int:
+    return bin(a ^ b).count("1")
+
+
+class AlprResultCache:
+    """
+    Leituras de matrícula por vaga, indexadas pelo pHash do crop.
+    - lookup(): reutiliza a leitura se houver um hash da mesma vaga a <= max_distance bits
+    - LRU por vaga (per_spot) e global (max_entries), com TTL em segundos
+    - distances: histograma da distância ao candidato mais próximo em cada lookup, para
+      afinar max_distance (hits reais ficam tipicamente em poucos bits)
+    """
+
+    def __init__(self, max_distance: int = 6, ttl: float = 600.0, per_spot: int = 4, max_entries: int = 256):
+        self.max_distance = max_distance
+        self.ttl = ttl
+        self.per_spot = max(1, per_spot)
+        self.max_entries = max(1, max_entries)
+        self._lock = threading.Lock()
+        # (vaga, hash) -> (timestamp, evento); a ordem é a do LRU global
+        self._entries: "OrderedDict[Tuple[str, int], Tuple[float, Dict[str, Any]]]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.expired = 0
+        self.evictions = 0
+        self.stores = 0
+        self.distances: Dict[int, int] = {}
+
+    def lookup(self, spot: str, crop_hash: int) -> Optional[Dict[str, Any]]:
+        now = time.time()
+        with self._lock:
+            best_key, best_distance = None, HASH_BITS + 1
+            for key in [k for k in self._entries if k[0] == spot]:
+                stored_at, _ = self._entries[key]
+                if now - stored_at > self.ttl:
+                    del self._entries[key]
+                    self.expired += 1
+                    continue
+                distance = hamming_distance(key[1], crop_hash)
+                if distance < best_distance:
+                    best_key, best_distance = key, distance
+
+            if best_key is not None:
+                self.distances[best_distance] = self.distances.get(best_distance, 0) + 1
+            if best_key is None or best_distance > self.max_distance:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._entries.move_to_end(best_key)
+            event = dict(self._entries[best_key][1])
+        event["cache_distance"] = best_distance
+        return event
+
+    def store(self, spot: str, crop_hash: int, event: Dict[str, Any]):
+        with self._lock:
+            key = (spot, crop_hash)
+            self._entries[key] = (time.time(), dict(event))
+            self._entries.move_to_end(key)
+            self.stores += 1
+
+            spot_keys = [k for k in self._entries if k[0] == spot]
+            for old in spot_keys[: max(0, len(spot_keys) - self.per_spot)]:
+                del self._entries[old]
+                self.evictions += 1
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 3) if lookups else 0.0,
+                "expired": self.expired,
+                "evictions": self.evictions,
+                "stores": self.stores,
+                "max_distance": self.max_distance,
+                "ttl_seconds": self.ttl,
+                "nearest_distance_histogram": dict(sorted(self.distances.items())),
+            }
+
+
+# ------------------------------------------------------------
+# Executor limitado para o ALPR das cancelas
+# ------------------------------------------------------------
+class QueueFullError(Exception):
+    """O BoundedExecutor já tem workers + max_queue pedidos; retry_after em segundos."""
+
+    def __init__(self, retry_after: int):
+        super().__init__(f"fila cheia, tentar de novo em {retry_after}s")
+        self.retry_after = retry_after
+
+
+class BoundedExecutor:
+    """
+    ThreadPoolExecutor que aceita no máximo workers pedidos a correr + max_queue à espera.
+    submit() lança QueueFullError quando está cheio. Mede a espera na fila e o tempo de
+    execução (últimos 200 pedidos) para o /api/alpr/stats e para estimar o Retry-After.
+    """
+
+    def __init__(self, workers: int, max_queue: int, name: str = "bounded"):
+        self.workers = max(1, workers)
+        self.max_queue = max(0, max_queue)
+        self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix=name)
+        self._slots = threading.BoundedSemaphore(self.workers + self.max_queue)
+        self._lock = threading.Lock()
+        self._waits: deque = deque(maxlen=200)
+        self._runs: deque = deque(maxlen=200)
+        self.in_flight = 0  # à espera + a correr
+        self.running = 0
+        self.submitted = 0
+        self.rejected = 0
+        self.completed = 0
+
+    def retry_after(self) -> int:
+        """Estimativa (s) até haver vaga: tempo médio de execução x pedidos à frente / workers."""
+        with self._lock:
+            avg_run = sum(self._runs) / len(self._runs) if self._runs else 1.0
+            ahead = max(1, self.in_flight - self.workers + 1)
+        return max(1, math.ceil(avg_run * ahead / self.workers))
+
+    def submit(self, fn: Callable[..., Any], *args) -> Future:
+        if not self._slots.acquire(blocking=False):
+            with self._lock:
+                self.rejected += 1
+            raise QueueFullError(self.retry_after())
+        enqueued = time.perf_counter()
+        with self._lock:
+            self.in_flight += 1
+            self.submitted += 1
+
+        def run():
+            started = time.perf_counter()
+            with self._lock:
+                self.running += 1
+                self._waits.append(started - enqueued)
+            try:
+                return fn(*args)
+            finally:
+                with self._lock:
+                    self.running -= 1
+                    self._runs.append(time.perf_counter() - started)
+
+        future = self._executor.submit(run)
+        future.add_done_callback(self._on_done)
+        return future
+
+    def _on_done(self, _future: Future):
+        with self._lock:
+            self.in_flight -= 1
+            self.completed += 1
+        self._slots.release()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            waits = sorted(self._waits)
+            runs = list(self._runs)
+            result = {
+                "workers": self.workers,
+                "max_queue": self.max_queue,
+                "queued": max(0, self.in_flight - self.running),
+                "running": self.running,
+                "submitted": self.submitted,
+                "completed": self.completed,
+                "rejected": self.rejected,
+            }
+        result["wait_ms_avg"] = round(1000.0 * sum(waits) / len(waits), 2) if waits else 0.0
+        result["wait_ms_p95"] = round(1000.0 * waits[min(len(waits) - 1, int(0.95 * len(waits)))], 2) if waits else 0.0
+        result["run_ms_avg"] = round(1000.0 * sum(runs) / len(runs), 2) if runs else 0.0
+        return result
+
+
+# ------------------------------------------------------------
+# Serviço ALPR do processo
+# ------------------------------------------------------------
+class AlprService:
+    """
+    Dono único do ALPR num processo: carrega o modelo uma vez (com lock), aquece-o e reporta
+    o estado de readiness, e junta os executores que o usam:
+
+        get()                     -> ALPR/CascadeAlpr do processo (None se desativado ou falhou)
+        submit_crop(vaga, crop)   -> Future[(vaga, [ALPRResult, ...] | None)]   monitor (AlprBatcher)
+        submit(fn, *args)         -> Future no BoundedExecutor (cancelas, ESP32 das vagas);
+                                     QueueFullError se estiver cheio
+        recognize(imagem, origem) -> [ALPRResult, ...] síncrono, mede a latência por origem
+
+    Com executor="process" os crops do monitor correm no AlprProcessPool (um modelo por
+    worker); get() continua a servir as imagens das cancelas no processo principal. Com
+    workers=0 não há batcher (processos sem monitor de vagas).
+    """
+
+    def __init__(
+        self,
+        build_kwargs: Dict[str, Any],
+        enabled: bool = True,
+        workers: int = 1,
+        executor: str = "thread",
+        intra_op_threads: int = 0,
+        batch_window: float = 0.05,
+        max_batch: int = 16,
+        request_workers: int = 1,
+        request_queue: int = 4,
+        warmup: bool = True,
+    ):
+        self.build_kwargs = dict(build_kwargs)
+        self.enabled = enabled and ALPR is not None
+        self._lock = threading.Lock()
+        self._alpr = None
+        self._stats_lock = threading.Lock()
+        self._latency: Dict[str, deque] = {}
+        self._calls: Dict[str, int] = {}
+        self._readiness: Dict[str, Any] = {
+            "state": "pending" if self.enabled and warmup else ("lazy" if self.enabled else "disabled"),
+            "load_seconds": None,
+            "warmup_seconds": None,
+            "pool_seconds": None,
+            "error": None,
+        }
+
+        self.executor: Optional[ThreadPoolExecutor] = (
+            ThreadPoolExecutor(max_workers=workers, thread_name_prefix="alpr") if self.enabled and workers > 0 else None
+        )
+        self.pool: Optional[AlprProcessPool] = (
+            AlprProcessPool(workers, self.build_kwargs, intra_op_threads)
+            if self.executor is not None and executor == "process" else None
+        )
+        self.batcher: Optional[AlprBatcher] = (
+            AlprBatcher(self.get, self.executor, batch_window, max_batch, self.pool)
+            if self.executor is not None else None
+        )
+        self.requests = BoundedExecutor(request_workers, request_queue, name="gate-alpr")
+
+    # ---------------- modelo ----------------
+    def get(self):
+        if not self.enabled:
+            return None
+        if self._alpr is not None:
+            return self._alpr
+        with self._lock:
+            if self._alpr is None:
+                try:
+                    print("[INFO] Inicializando ALPR...")
+                    self._alpr = build_alpr(**self.build_kwargs)
+                except Exception as exc:  # pragma: no cover - falha de inicialização
+                    print(f"[WARN] Falha ao inicializar ALPR: {exc}")
+                    return None
+        return self._alpr
+
+    def _set_readiness(self, **changes):
+        with self._stats_lock:
+            self._readiness.update(changes)
+
+    def readiness(self) -> Dict[str, Any]:
+        with self._stats_lock:
+            return dict(self._readiness)
+
+    def is_ready(self) -> bool:
+        return self.readiness()["state"] in ("ready", "lazy", "disabled")
+
+    def warm_up(self):
+        """
+        Carrega o modelo do processo e corre a inferência de aquecimento (e espera pelos
+        workers do pool, que aquecem o seu próprio modelo no initializer).
+        """
+        if not self.enabled:
+            self._set_readiness(state="failed", error="fast_alpr não instalado" if ALPR is None else "ALPR desativado")
+            return
+        self._set_readiness(state="loading")
+        pool_futures = self.pool.warm_up() if self.pool is not None else []
+
+        start = time.perf_counter()
+        alpr = self.get()
+        load_seconds = round(time.perf_counter() - start, 3)
+        if alpr is None:
+            self._set_readiness(state="failed", load_seconds=load_seconds, error="falha ao inicializar o ALPR")
+            return
+        try:
+            warmup_seconds = round(warm_up_alpr(alpr), 3)
+        except Exception as exc:
+            print(f"[WARN] Falha no aquecimento do ALPR: {exc}")
+            self._set_readiness(state="failed", load_seconds=load_seconds, error=f"aquecimento: {exc}")
+            return
+        print(f"[INFO] ALPR pronto: modelo {load_seconds:.2f}s, aquecimento {warmup_seconds:.2f}s")
+        self._set_readiness(load_seconds=load_seconds, warmup_seconds=warmup_seconds)
+
+        if pool_futures:
+            try:
+                for future in pool_futures:
+                    future.result()
+            except Exception as exc:
+                print(f"[WARN] Pool ALPR não arrancou: {exc}")
+                self._set_readiness(state="failed", error=f"pool: {exc}")
+                return
+            pool_seconds = round(time.perf_counter() - start, 3)
+            print(f"[INFO] Pool ALPR: {self.pool.workers} processos prontos em {pool_seconds:.2f}s")
+            self._set_readiness(pool_seconds=pool_seconds)
+        self._set_readiness(state="ready")
+
+    # ---------------- inferência ----------------
+    def _record(self, source: str, seconds: float):
+        with self._stats_lock:
+            self._latency.setdefault(source, deque(maxlen=200)).append(seconds)
+            self._calls[source] = self._calls.get(source, 0) + 1
+
+    def recognize(self, image: np.ndarray, source: str = "gate") -> Optional[list]:
+        """predict() com o modelo do processo; None se o ALPR não estiver disponível."""
+        alpr = self.get()
+        if alpr is None:
+            return None
+        start = time.perf_counter()
+        try:
+            return alpr.predict(image)
+        finally:
+            self._record(source, time.perf_counter() - start)
+
+    def submit(self, fn: Callable[..., Any], *args) -> Future:
+        return self.requests.submit(fn, *args)
+
+    def submit_crop(self, name: str, crop: np.ndarray) -> Future:
+        """Crop de uma vaga do monitor para o AlprBatcher (latência inclui a janela do batch)."""
+        start = time.perf_counter()
+        future = self.batcher.submit(name, crop)
+        future.add_done_callback(lambda _f: self._record("monitor", time.perf_counter() - start))
+        return future
+
+    # ---------------- métricas ----------------
+    def cascade_stats(self) -> Optional[Dict[str, Any]]:
+        """Contadores por nível da cascata: modelo do processo + workers do pool."""
+        stats = []
+        if isinstance(self._alpr, CascadeAlpr):
+            stats.append(self._alpr.stats())
+        pool_stats = self.pool.cascade_stats() if self.pool is not None else None
+        if pool_stats is not None:
+            stats.append(pool_stats)
+        return merge_cascade_stats(stats) if stats else None
+
+    def latency_stats(self) -> Dict[str, Dict[str, Any]]:
+        with self._stats_lock:
+            samples = {source: sorted(values) for source, values in self._latency.items()}
+            calls = dict(self._calls)
+        return {
+            source: {
+                "calls": calls[source],
+                "avg_ms": round(1000.0 * sum(values) / len(values), 2),
+                "p95_ms": round(1000.0 * values[min(len(values) - 1, int(0.95 * len(values)))], 2),
+            }
+            for source, values in samples.items()
+        }
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "enabled": self.enabled,
+            "executor": "process" if self.pool is not None else "thread",
+            "model": self.readiness(),
+            "latency": self.latency_stats(),
+            "batcher": self.batcher.stats() if self.batcher else None,
+            "gate": self.requests.stats(),
+            "cascade": self.cascade_stats(),
+        }
+
+    def shutdown(self):
+        if self.pool is not None:
+            self.pool.shutdown()
+        if self.executor is not None:
+            self.executor.shutdown(wait=False)
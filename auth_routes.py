@@ -35,6 +35,7 @@ router = APIRouter()
 # Referência ao pool de BD (será injetada pelo main.py)
 db_pool: Optional[asyncpg.Pool] = None
 _refresh_reservations_callback = None
+_refresh_users_callback = None
 
 def set_db_pool(pool: asyncpg.Pool):
     """Injetar o pool de BD."""
@@ -46,6 +47,19 @@ def set_refresh_reservations_callback(callback):
     global _refresh_reservations_callback
     _refresh_reservations_callback = callback
 
+def set_refresh_users_callback(callback):
+    """Define o callback para atualizar o cache de utilizadores/matrículas."""
+    global _refresh_users_callback
+    _refresh_users_callback = callback
+
+async def _trigger_users_refresh():
+    """Chama o callback para atualizar o cache de utilizadores (veículo adicionado/removido)."""
+    if _refresh_users_callback:
+        try:
+            await _refresh_users_callback()
+        except Exception as e:
+            print(f"[WARN] Erro ao atualizar cache de utilizadores: {e}")
+
 async def _trigger_reservations_refresh():
     """Chama o callback para atualizar o cache de reservas."""
     if _refresh_reservations_callback:
@@ -190,6 +204,7 @@ async def create_vehicle(payload: VehiclePayload, authorization: Optional[str] =
     
     user = require_auth(authorization)
     vehicle = await add_vehicle(db_pool, user["user_id"], payload)
+    await _trigger_users_refresh()
     return {"vehicle": vehicle}
 
 
@@ -203,6 +218,7 @@ async def remove_vehicle(vehicle_id: int, authorization: Optional[str] = Header(
     success = await delete_vehicle(db_pool, user["user_id"], vehicle_id)
     if not success:
         raise HTTPException(status_code=404, detail="Veículo não encontrado")
+    await _trigger_users_refresh()
     return {"message": "Veículo removido"}
 
 
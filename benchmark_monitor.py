@@ -0,0 +1,110 @@
+"""
+Benchmark reprodutível do pipeline do monitor (captura -> inferência -> render) sobre um
+ficheiro de vídeo, sem servidor: corre um número fixo de frames sem pacing e sem descartes
+entre estágios e imprime o FPS ponta-a-ponta e os tempos por estágio.
+
+Usa a mesma configuração do servidor (variáveis de ambiente do main.py: SPOT_BACKEND,
+MODEL_FILE, INCREMENTAL_INFERENCE, ...). Por omissão a inferência corre em todos os frames
+(scheduler fixo) para os números não dependerem do scheduler adaptativo.
+
+Uso:
+    python benchmark_monitor.py --frames 1000
+    python benchmark_monitor.py --source parking_demo.mp4 --frames 500 --render
+    SPOT_BACKEND=roi MODEL_FILE=spot_roi_model.pth python benchmark_monitor.py --json
+"""
+import argparse
+import json
+import multiprocessing
+import queue
+import threading
+from pathlib import Path
+
+import main
+from camera_registry import CameraConfig
+from camera_worker import run_camera_worker
+
+
+def run_benchmark(source: str, spots_file: Path, frames: int, scheduler: str, every_n: int, render: bool):
+    settings = main.camera_worker_settings(main.get_torch_device())
+    settings.update(
+        file_playback="max",
+        benchmark_frames=frames,
+        scheduler=scheduler,
+        process_every_n=every_n,
+    )
+    if render:
+        settings["stream_max_fps"] = 0  # renderizar todos os frames
+
+    camera = CameraConfig("benchmark", source, spots_file, qualify_names=False)
+    results = queue.Queue(maxsize=main.CAMERA_RESULTS_QUEUE_SIZE)
+    frames_out = queue.Queue(maxsize=2)
+    viewers = multiprocessing.Value("i", 1 if render else 0)
+    stop_event = threading.Event()
+
+    worker = threading.Thread(
+        target=run_camera_worker,
+        args=(camera, settings, results, frames_out, viewers, stop_event),
+        daemon=True,
+    )
+    worker.start()
+
+    # consumir as filas como o servidor faria (o render descarta os frames já reduzidos)
+    report = None
+    while True:
+        try:
+            frames_out.get_nowait()
+        except queue.Empty:
+            pass
+        try:
+            message = results.get(timeout=0.05)
+        except queue.Empty:
+            if not worker.is_alive():
+                break
+            continue
+        if message["type"] == "benchmark":
+            report = message["report"]
+        elif message["type"] == "error":
+            print(f"[ERRO] {message['error']}")
+        elif message["type"] == "stopped":
+            break
+    stop_event.set()
+    return report
+
+
+def print_report(report):
+    print(f"\n{report['frames']} frames em {report['seconds']:.2f}s = {report['fps']:.1f} FPS ponta-a-ponta "
+          f"({report['inferences']} inferências)")
+    print(f"{'estágio':<10} {'n':>6} {'fps':>8} {'avg ms':>8} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'descartes':>9}")
+    for stage, stats in report["stages"].items():
+        print(
+            f"{stage:<10} {stats['processed']:>6} {stats['throughput_fps']:>8.1f} {stats['avg_ms']:>8.2f} "
+            f"{stats.get('p50_ms', 0):>8.2f} {stats.get('p95_ms', 0):>8.2f} {stats.get('p99_ms', 0):>8.2f} {stats['dropped']:>9}"
+        )
+
+
+def main_cli():
+    parser = argparse.ArgumentParser(description="Benchmark do pipeline do monitor sobre um ficheiro de vídeo.")
+    parser.add_argument("--source", default=main.VIDEO_SOURCE, help="Ficheiro de vídeo (default: VIDEO_SOURCE)")
+    parser.add_argument("--spots", default=str(main.SPOTS_FILE))
+    parser.add_argument("--frames", type=int, default=1000)
+    parser.add_argument("--scheduler", default="fixed", choices=["fixed", "adaptive"])
+    parser.add_argument("--every-n", type=int, default=1, help="Com --scheduler fixed: inferência a cada N frames")
+    parser.add_argument("--render", action="store_true", help="Incluir o estágio de render (como com um viewer no /video_feed)")
+    parser.add_argument("--json", action="store_true", help="Imprimir o relatório em JSON")
+    args = parser.parse_args()
+
+    if not Path(args.source).is_file():
+        print(f"[ERRO] O benchmark precisa de um ficheiro de vídeo: {args.source}")
+        return
+    report = run_benchmark(args.source, Path(args.spots), args.frames, args.scheduler, args.every_n, args.render)
+    if report is None:
+        print("[ERRO] O benchmark não terminou (ver erros acima)")
+        return
+    if args.json:
+        print(json.dumps(report, indent=2))
+    else:
+        print_report(report)
+
+
+if __name__ == "__main__":
+    main_cli()
@@ -0,0 +1,107 @@
+"""
+Registo de câmaras do monitor de estacionamento.
+
+Sem CAMERAS_FILE o servidor usa uma única câmara "default" com VIDEO_SOURCE e SPOTS_FILE
+(nomes de vagas sem prefixo, como até aqui). Com CAMERAS_FILE (JSON):
+
+    {
+      "cameras": [
+        {"id": "center", "source": "http://10.0.0.21", "spots_file": "spots_center.json"},
+        {"id": "entry_gate", "source": "rtsp://...", "spots_file": "spots_entry.json",
+         "reference_size": {"width": 1280, "height": 720}}
+      ]
+    }
+
+Os nomes das vagas ficam como no ficheiro de vagas, porque são a chave das reservas
+("<vaga>_<data>") e do campo spot das sessões na base de dados; têm por isso de ser únicos
+entre câmaras. Com "qualify_names": true a câmara passa a usar "<camera>:<vaga>"
+(ex.: "center:vaga01"), e as reservas dessas vagas têm de usar o nome completo.
+"""
+import json
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+SPOT_NAME_SEPARATOR = ":"
+DEFAULT_CAMERA_ID = "default"
+
+
+class CameraConfig:
+    def __init__(
+        self,
+        camera_id: str,
+        source: str,
+        spots_file: Path,
+        reference_size: Optional[Tuple[int, int]] = None,
+        qualify_names: bool = False,
+    ):
+        self.camera_id = camera_id
+        self.source = source
+        self.spots_file = Path(spots_file)
+        self.reference_size = reference_size
+        self.qualify_names = qualify_names
+
+    def qualify(self, spot_name: str) -> str:
+        if not self.qualify_names:
+            return spot_name
+        return f"{self.camera_id}{SPOT_NAME_SEPARATOR}{spot_name}"
+
+    @property
+    def source_is_file(self) -> bool:
+        return isinstance(self.source, str) and Path(self.source).is_file()
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "id": self.camera_id,
+            "source": self.source,
+            "spots_file": str(self.spots_file),
+            "reference_size": list(self.reference_size) if self.reference_size else None,
+            "qualify_names": self.qualify_names,
+        }
+
+
+def _parse_reference_size(value: Any) -> Optional[Tuple[int, int]]:
+    if not value:
+        return None
+    if isinstance(value, dict):
+        return int(value["width"]), int(value["height"])
+    width, height = value
+    return int(width), int(height)
+
+
+def load_camera_registry(cameras_file: Optional[str], default_source: str, default_spots_file: Path) -> List[CameraConfig]:
+    """Lê o registo de câmaras; sem ficheiro devolve a câmara "default" (compatível com VIDEO_SOURCE/SPOTS_FILE)."""
+    if not cameras_file:
+        return [CameraConfig(DEFAULT_CAMERA_ID, default_source, default_spots_file, qualify_names=False)]
+
+    path = Path(cameras_file)
+    if not path.exists():
+        raise FileNotFoundError(f"Registo de câmaras não encontrado: {path}")
+
+    with open(path, "r", encoding="utf-8") as f:
+        payload = json.load(f)
+
+    cameras: List[CameraConfig] = []
+    seen = set()
+    for entry in payload.get("cameras", []):
+        camera_id = str(entry["id"]).strip()
+        if not camera_id or SPOT_NAME_SEPARATOR in camera_id:
+            raise ValueError(f"ID de câmara inválido: {entry['id']!r}")
+        if camera_id in seen:
+            raise ValueError(f"ID de câmara duplicado: {camera_id}")
+        seen.add(camera_id)
+
+        spots_file = Path(entry.get("spots_file", default_spots_file))
+        if not spots_file.is_absolute() and not spots_file.exists():
+            spots_file = path.parent / spots_file
+        cameras.append(CameraConfig(
+            camera_id,
+            str(entry.get("source", default_source)),
+            spots_file,
+            reference_size=_parse_reference_size(entry.get("reference_size")),
+            qualify_names=bool(entry.get("qualify_names", False)),
+        ))
+
+    if not cameras:
+        raise ValueError(f"Nenhuma câmara definida em {path}")
+    print(f"[INFO] Registo de câmaras: {', '.join(c.camera_id for c in cameras)}")
+    return cameras
@@ -0,0 +1,392 @@
+"""
+Worker de uma câmara: captura + inferência (+ frames para o stream) de uma única fonte.
+
+Corre numa thread do servidor (CAMERA_PIPELINE_MODE=thread) ou num processo próprio
+(CAMERA_PIPELINE_MODE=process, evita o GIL com várias câmaras). Comunica com o main.py
+apenas por mensagens (dicts) em duas filas:
+
+    results: {"type": "ready", "spots": [...], "frame_size": (w, h)}
+             {"type": "result", "timestamp", "probs", "classified", "occupied", "crops", "alpr_pending",
+              "signatures", "stats", "scheduler"}  (signatures: vaga -> assinatura de aparência das vagas
+              ocupadas, a cada PLATE_TRACK_INTERVAL; {} nos outros resultados)
+             {"type": "alpr_crop", "spot", "crop", "sharpness", "frames"}  (crop mais nítido após a entrada
+              ou após um pedido em crop_requests)
+             {"type": "benchmark", "report": {...}}  (FILE_PLAYBACK=max com BENCHMARK_FRAMES, ver MonitorPipeline.report())
+             {"type": "health", "health": {...}}  (a cada HEALTH_INTERVAL, ver CaptureSupervisor.health())
+             {"type": "error", "error": str} / {"type": "stopped"}
+    frames:  {"frame": np.ndarray já reduzido para o stream, "timestamp", "stale": bool}
+
+e, no sentido inverso, crop_requests: (vaga, forçada) a reler pelo ALPR; normalmente vagas ocupadas
+(PlateTracker do servidor), ou vagas forçadas como ocupadas via /api/debug/spot (forçada=True), que
+são recortadas mesmo que o classificador as dê como livres.
+
+Este módulo não importa o main.py para poder ser carregado num processo "spawn".
+"""
+import queue
+import threading
+import time
+import traceback
+from typing import Any, Dict, Optional
+
+import cv2
+import numpy as np
+import torch
+
+from camera_registry import CameraConfig
+from capture_supervisor import CaptureSupervisor
+from esp32_capture_wrapper import decode_jpeg, get_video_capture
+from frame_buffer import FrameRingBuffer, SharpestCropSelector
+from monitor_pipeline import MonitorPipeline, create_scheduler
+from plate_tracker import appearance_signature
+from spot_inference import create_backend
+from spot_vision import (
+    OccupancySmoother,
+    SpotChangeGate,
+    SpotOccupancyClassifier,
+    choose_decode_reduction,
+    extract_spot_crop,
+    load_spots,
+    reduced_frame_size,
+    scale_spots,
+)
+
+RESULT_PUT_TIMEOUT = 1.0
+HEALTH_INTERVAL = 1.0
+DEFAULT_FILE_FPS = 30.0  # quando o ficheiro não declara FPS
+
+
+def load_camera_spots(camera: CameraConfig):
+    """Carrega as vagas da câmara com nomes qualificados; reference_size do registo tem prioridade."""
+    spots, ref = load_spots(camera.spots_file)
+    for spot in spots:
+        spot["name"] = camera.qualify(spot["name"])
+    return spots, camera.reference_size or ref
+
+
+def _put_result(results, message: Dict[str, Any], camera_id: str):
+    try:
+        results.put(message, timeout=RESULT_PUT_TIMEOUT)
+    except queue.Full:
+        print(f"[WARN] [{camera_id}] Fila de resultados cheia; resultado descartado.")
+
+
+def _stream_frame(frame: np.ndarray, max_width: int) -> np.ndarray:
+    h, w = frame.shape[:2]
+    if 0 < max_width < w:
+        size = (max_width, int(round(h * max_width / w)))
+        frame = cv2.resize(frame, size, interpolation=cv2.INTER_AREA)
+    return frame
+
+
+def _decode_reduction(settings: Dict[str, Any], backend, spots, ref, full_size) -> int:
+    """Fator de decode reduzido: DECODE_REDUCTION fixo ou "auto" a partir do tamanho das vagas."""
+    value = str(settings.get("decode_reduction", "auto")).strip().lower()
+    if value != "auto":
+        return int(value) if int(value) in (1, 2, 4, 8) else 1
+    full_spots = scale_spots(spots, ref, full_size)
+    return choose_decode_reduction(
+        full_spots,
+        min_spot_size=settings["decode_min_spot_size"],
+        min_frame_width=getattr(backend, "input_width", 0),
+        frame_width=full_size[0],
+    )
+
+
+def _file_playback(camera: CameraConfig, settings: Dict[str, Any], source_fps: float) -> Dict[str, Any]:
+    """
+    Ritmo de leitura de fontes ficheiro (FILE_PLAYBACK):
+      "realtime": ao FPS do ficheiro, como uma câmara ao vivo
+      "max":      o mais rápido possível; com BENCHMARK_FRAMES > 0 corre esse número de
+                  frames sem descartes entre estágios e termina com um relatório
+    """
+    if not camera.source_is_file:
+        return {"pace_fps": 0.0, "max_frames": 0, "lossless": False}
+    mode = str(settings.get("file_playback", "realtime")).strip().lower()
+    if mode == "max":
+        frames = max(0, int(settings.get("benchmark_frames", 0)))
+        return {"pace_fps": 0.0, "max_frames": frames, "lossless": frames > 0}
+    return {"pace_fps": source_fps if source_fps > 0 else DEFAULT_FILE_FPS, "max_frames": 0, "lossless": False}
+
+
+def run_camera_worker(
+    camera: CameraConfig,
+    settings: Dict[str, Any],
+    results,
+    frames,
+    viewers,
+    stop_event,
+    include_frame: bool = False,
+    crop_requests=None,
+):
+    """
+    settings: configuração do monitor (ver main.camera_worker_settings()).
+    viewers: multiprocessing.Value com o número de viewers do /video_feed desta câmara.
+    include_frame: envia também o frame completo em cada resultado (só em modo thread,
+    onde passa por referência), para o servidor poder recortar vagas forçadas via debug.
+    crop_requests: fila (opcional) de (vaga, forçada) para as quais o servidor quer um novo crop para o ALPR.
+    """
+    camera_id = camera.camera_id
+    cap = None
+    pipeline_ref: Dict[str, MonitorPipeline] = {}
+    try:
+        backend = create_backend(
+            settings["backend"],
+            settings["model_file"],
+            torch.device(settings["device"]),
+            intra_threads=settings["intra_op_threads"],
+            inter_threads=settings["inter_op_threads"],
+        )
+
+        spots, ref = load_camera_spots(camera)
+        capture_mode = settings.get("capture_mode", "auto")
+        cap = CaptureSupervisor(
+            camera.source,
+            lambda source: get_video_capture(source, mode=capture_mode),
+            loop_file=camera.source_is_file,
+            backoff_initial=settings["capture_backoff_initial"],
+            backoff_max=settings["capture_backoff_max"],
+            stale_after=settings["capture_stale_seconds"],
+            max_read_failures=settings["capture_max_read_failures"],
+            name=camera_id,
+        )
+        max_width = settings["stream_max_width"]
+
+        def supervise():
+            # saúde da fonte + último frame válido (assinalado) enquanto a captura está em baixo
+            while not stop_event.wait(HEALTH_INTERVAL):
+                health = cap.health()
+                try:
+                    results.put_nowait({"type": "health", "health": health})
+                except queue.Full:
+                    pass
+                if health["stale"] and viewers.value > 0:
+                    frame, ts = cap.last_good_frame()
+                    if frame is not None:
+                        try:
+                            frames.put_nowait({"frame": _stream_frame(frame, max_width), "timestamp": ts, "stale": True})
+                        except queue.Full:
+                            pass
+            cap.stop()
+            pipeline = pipeline_ref.get("pipeline")
+            if pipeline is not None:
+                pipeline.stop()
+
+        threading.Thread(target=supervise, name=f"{camera_id}-supervisor", daemon=True).start()
+        if not cap.connect():
+            return
+
+        full_size = (int(cap.get(cv2.CAP_PROP_FRAME_WIDTH)), int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT)))
+        print(f"[INFO] [{camera_id}] Vídeo: {full_size[0]}x{full_size[1]}")
+
+        # Decode JPEG reduzido (só fontes ESP32); o ALPR recorta do JPEG descodificado por inteiro
+        reduction = _decode_reduction(settings, backend, spots, ref, full_size)
+        if reduction > 1 and not cap.set_decode_reduction(reduction):
+            reduction = 1
+        full_spots = scale_spots(spots, ref, full_size) if reduction > 1 else None
+        scaled_spots = scale_spots(spots, ref, full_size, reduction=reduction)
+        fw, fh = reduced_frame_size(full_size, reduction)
+        smoother = OccupancySmoother(
+            len(scaled_spots),
+            settings["history_len"],
+            settings["enter_threshold"],
+            settings["exit_threshold"],
+            settings["min_dwell"],
+        )
+        change_gate = (
+            SpotChangeGate(settings["change_gate_delta"], settings["full_refresh_seconds"])
+            if settings["incremental"] else None
+        )
+        classifier = SpotOccupancyClassifier(backend, scaled_spots, smoother, change_gate)
+
+        _put_result(results, {
+            "type": "ready",
+            "frame_size": (fw, fh),
+            "spots": [
+                {
+                    "name": spot["name"],
+                    "points": spot["points"],
+                    "reserved": spot["reserved"],
+                    "authorized": spot["authorized"],
+                }
+                for spot in scaled_spots
+            ],
+        }, camera_id)
+
+        scheduler = create_scheduler(
+            settings["scheduler"],
+            every_n=settings["process_every_n"],
+            source_fps=cap.get(cv2.CAP_PROP_FPS),
+            min_interval=settings["min_interval"],
+            max_interval=settings["max_interval"],
+            cpu_budget=settings["cpu_budget"],
+            activity_window=settings["activity_window"],
+        )
+        print(f"[INFO] [{camera_id}] Scheduler de inferência: {scheduler.mode}")
+
+        last_occupied = np.zeros(len(scaled_spots), dtype=bool)
+        pipeline = None
+
+        def alpr_crops(frame: np.ndarray, encoded: Optional[bytes], indices) -> Dict[str, np.ndarray]:
+            """Crops para o ALPR; com decode reduzido descodifica o JPEG original por inteiro."""
+            crop_frame, crop_spots = frame, scaled_spots
+            if full_spots is not None and encoded is not None:
+                full_frame = decode_jpeg(encoded)
+                if full_frame is not None:
+                    crop_frame, crop_spots = full_frame, full_spots
+            crops = {}
+            for i in indices:
+                crop = extract_spot_crop(crop_frame, crop_spots[i]["points"])
+                if crop is not None:
+                    crops[scaled_spots[i]["name"]] = crop
+            return crops
+
+        # Crop mais nítido nos N frames seguintes à entrada (ALPR_SHARPNESS_FRAMES=0 desliga)
+        sharpness_frames = settings["alpr_sharpness_frames"]
+        selector = None
+        on_capture = None
+        if sharpness_frames > 0:
+            ring = FrameRingBuffer(max(settings["alpr_frame_buffer"], sharpness_frames + 1))
+
+            def emit_crop(spot_index: int, seq: int, score: float, scored: int):
+                frame = ring.get(seq)
+                if frame is None:
+                    return
+                crop = alpr_crops(frame, ring.encoded(seq), [spot_index]).get(scaled_spots[spot_index]["name"])
+                if crop is not None:
+                    _put_result(results, {
+                        "type": "alpr_crop",
+                        "spot": scaled_spots[spot_index]["name"],
+                        "crop": crop,
+                        "sharpness": round(score, 1),
+                        "frames": scored,
+                    }, camera_id)
+
+            selector = SharpestCropSelector(ring, [spot["bbox"] for spot in scaled_spots], sharpness_frames, emit_crop)
+
+            def on_capture(packet: Dict[str, Any]):
+                packet["ring_seq"] = ring.push(packet["frame"], packet.get("encoded"))
+                selector.on_frame()
+
+        spot_indices = {spot["name"]: i for i, spot in enumerate(scaled_spots)}
+        track_interval = settings.get("plate_track_interval", 0.0)
+        track_state = {"last": 0.0}
+
+        def occupied_signatures(frame: np.ndarray, timestamp: float) -> Dict[str, np.ndarray]:
+            """
+            Assinaturas de aparência das vagas ocupadas (no frame reduzido), a cada track_interval.
+            Sem a margem do crop do ALPR, para um carro na vaga ao lado não contar como mudança.
+            """
+            if track_interval <= 0 or timestamp - track_state["last"] < track_interval:
+                return {}
+            track_state["last"] = timestamp
+            signatures = {}
+            for i in np.flatnonzero(last_occupied):
+                signature = appearance_signature(extract_spot_crop(frame, scaled_spots[i]["points"], expand_ratio=1.0))
+                if signature is not None:
+                    signatures[scaled_spots[i]["name"]] = signature
+            return signatures
+
+        def serve_crop_requests(packet: Dict[str, Any]):
+            """Novas leituras pedidas pelo servidor: crop mais nítido dos próximos frames (ou o atual)."""
+            while crop_requests is not None:
+                try:
+                    name, forced = crop_requests.get_nowait()
+                except queue.Empty:
+                    return
+                i = spot_indices.get(name)
+                if i is None or not (forced or last_occupied[i]):
+                    continue
+                if selector is not None:
+                    selector.start(i, packet["ring_seq"])
+                    continue
+                crop = alpr_crops(packet["frame"], packet.get("encoded"), [i]).get(name)
+                if crop is not None:
+                    _put_result(results, {"type": "alpr_crop", "spot": name, "crop": crop, "sharpness": None, "frames": 1}, camera_id)
+
+        def process(packet: Dict[str, Any]) -> int:
+            frame = packet["frame"]
+            result = classifier.classify(frame, packet["timestamp"])
+            occupied = result["occupied"]
+            entered = np.flatnonzero(occupied & ~last_occupied)
+            transitions = int((occupied != last_occupied).sum())
+
+            crops = {}
+            pending = []
+            if selector is not None:
+                for i in np.flatnonzero(last_occupied & ~occupied):
+                    selector.cancel(int(i))
+                for i in entered:
+                    selector.start(int(i), packet["ring_seq"])
+                    pending.append(scaled_spots[i]["name"])
+            elif entered.size:
+                crops = alpr_crops(frame, packet.get("encoded"), entered)
+            last_occupied[:] = occupied
+            serve_crop_requests(packet)
+
+            message = {
+                "type": "result",
+                "timestamp": packet["timestamp"],
+                "crops": crops,
+                "alpr_pending": pending,
+                "signatures": occupied_signatures(frame, packet["timestamp"]),
+                "stats": pipeline.stats_snapshot(),
+                "scheduler": pipeline.scheduler_snapshot(),
+                **result,
+            }
+            if include_frame:
+                message["frame"] = frame
+            _put_result(results, message, camera_id)
+            return transitions
+
+        render_interval = 1.0 / settings["stream_max_fps"] if settings["stream_max_fps"] > 0 else 0.0
+        render_state = {"last": 0.0}
+
+        def render_wanted() -> bool:
+            if viewers.value <= 0:
+                return False
+            now = time.time()
+            if now - render_state["last"] < render_interval:
+                return False
+            render_state["last"] = now
+            return True
+
+        def render(packet: Dict[str, Any]):
+            frame = _stream_frame(packet["frame"], max_width)
+            try:
+                frames.put_nowait({"frame": frame, "timestamp": packet["timestamp"], "stale": False})
+            except queue.Full:
+                pass
+
+        playback = _file_playback(camera, settings, cap.get(cv2.CAP_PROP_FPS))
+        if playback["max_frames"]:
+            print(f"[INFO] [{camera_id}] Benchmark: {playback['max_frames']} frames, sem pacing nem descartes")
+        elif playback["pace_fps"]:
+            print(f"[INFO] [{camera_id}] Reprodução do ficheiro em tempo real ({playback['pace_fps']:.1f} FPS)")
+
+        pipeline = MonitorPipeline(
+            cap,
+            process,
+            render,
+            loop_file=camera.source_is_file,
+            scheduler=scheduler,
+            should_render=render_wanted,
+            on_capture=on_capture,
+            name=camera_id,
+            **playback,
+        )
+        pipeline_ref["pipeline"] = pipeline
+        if not stop_event.is_set():
+            pipeline.run()
+            if playback["max_frames"]:
+                report = pipeline.report()
+                print(f"[INFO] [{camera_id}] Benchmark: {report['frames']} frames em {report['seconds']:.2f}s "
+                      f"= {report['fps']:.1f} FPS ponta-a-ponta ({report['inferences']} inferências)")
+                _put_result(results, {"type": "benchmark", "report": report}, camera_id)
+    except Exception as exc:
+        traceback.print_exc()
+        _put_result(results, {"type": "error", "error": str(exc)}, camera_id)
+    finally:
+        if cap is not None:
+            cap.release()
+        _put_result(results, {"type": "stopped"}, camera_id)
+        print(f"[INFO] [{camera_id}] Monitor parado.")
@@ -0,0 +1,282 @@
+"""
+Supervisor da captura de uma câmara: envolve o objeto devolvido por get_video_capture()
+e mantém a fonte viva em ligações instáveis (Wi-Fi da ESP32, RTSP).
+
+- abertura e falhas de leitura não matam o monitor: volta a ligar com backoff exponencial
+  (backoff_initial, 2x, 4x, ... até backoff_max) até conseguir ou até stop();
+- health(): estado da fonte (idade do último frame, religações, falhas de leitura/decode);
+- last_good_frame(): último frame válido, para o servidor poder mostrá-lo assinalado como
+  antigo em vez de servir estado velho sem o dizer;
+- set_decode_reduction(): decode JPEG reduzido nos leitores ESP32, reaplicado em cada religação.
+
+Interface compatível com cv2.VideoCapture (read/get/set/isOpened/release), por isso o
+MonitorPipeline usa-o sem alterações.
+"""
+import threading
+import time
+import traceback
+from typing import Any, Callable, Dict, Optional, Tuple
+
+import cv2
+import numpy as np
+
+from spot_vision import reduced_frame_size
+
+STATE_CONNECTING = "connecting"
+STATE_ONLINE = "online"
+STATE_RECONNECTING = "reconnecting"
+STATE_STOPPED = "stopped"
+
+
+class CaptureSupervisor:
+    def __init__(
+        self,
+        source: Any,
+        open_fn: Callable[[Any], Any],
+        loop_file: bool = False,
+        backoff_initial: float = 1.0,
+        backoff_max: float = 30.0,
+        stale_after: float = 5.0,
+        max_read_failures: int = 3,
+        name: str = "camera",
+    ):
+        """
+        open_fn: função que abre a fonte (ex.: get_video_capture) e devolve um objeto tipo cv2.VideoCapture.
+        loop_file: ficheiros em loop; o fim do ficheiro não conta como falha (o pipeline rebobina).
+        max_read_failures: leituras falhadas seguidas antes de fechar e voltar a abrir a fonte.
+        """
+        self.source = source
+        self.open_fn = open_fn
+        self.loop_file = loop_file
+        self.backoff_initial = max(0.1, backoff_initial)
+        self.backoff_max = max(self.backoff_initial, backoff_max)
+        self.stale_after = stale_after
+        self.max_read_failures = max(1, max_read_failures)
+        self.name = name
+
+        self._cap = None
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._state = STATE_CONNECTING
+        self._state_since = time.time()
+        self._attempt = 0
+        self._next_retry: Optional[float] = None
+        self._frame_size: Optional[Tuple[int, int]] = None
+        self._full_size: Optional[Tuple[int, int]] = None
+        self._decode_reduction = 1
+        self._encoded: Optional[bytes] = None
+        self._size_warned = False
+
+        self._last_frame: Optional[np.ndarray] = None
+        self._last_frame_time: Optional[float] = None
+        self.frames = 0
+        self.reconnects = 0
+        self.read_failures = 0
+        self._consecutive_failures = 0
+        self._decode_failures = 0
+        self._decode_failures_closed = 0  # decode_errors de ligações anteriores
+        self.last_error: Optional[str] = None
+
+    # ---------------- ligação ----------------
+    def _set_state(self, state: str):
+        if state != self._state:
+            self._state = state
+            self._state_since = time.time()
+
+    def _open_once(self) -> bool:
+        try:
+            cap = self.open_fn(self.source)
+        except Exception as exc:
+            self.last_error = f"open: {exc}"
+            traceback.print_exc()
+            return False
+        if cap is None or not cap.isOpened():
+            self.last_error = f"não abriu: {self.source}"
+            if cap is not None:
+                cap.release()
+            return False
+
+        if self._decode_reduction > 1 and hasattr(cap, "set_decode_reduction"):
+            cap.set_decode_reduction(self._decode_reduction)
+        size = (int(cap.get(cv2.CAP_PROP_FRAME_WIDTH)), int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT)))
+        with self._lock:
+            self._cap = cap
+            if self._frame_size is None:
+                self._frame_size = self._full_size = size
+            self._attempt = 0
+            self._next_retry = None
+            self._consecutive_failures = 0
+            self._set_state(STATE_ONLINE)
+        return True
+
+    def _close(self):
+        with self._lock:
+            cap, self._cap = self._cap, None
+        if cap is None:
+            return
+        stats = getattr(cap, "stats", None)
+        if callable(stats):
+            self._decode_failures_closed += int(stats().get("decode_errors", 0))
+        try:
+            cap.release()
+        except Exception:
+            pass
+
+    def connect(self) -> bool:
+        """Abre a fonte, repetindo com backoff exponencial. Só devolve False se stop() for chamado."""
+        while not self._stop.is_set():
+            if self._open_once():
+                return True
+            delay = min(self.backoff_initial * (2 ** self._attempt), self.backoff_max)
+            self._attempt += 1
+            with self._lock:
+                self._next_retry = time.time() + delay
+            print(f"[WARN] [{self.name}] Fonte indisponível ({self.last_error}); nova tentativa em {delay:.1f}s")
+            self._stop.wait(delay)
+        return False
+
+    def _reconnect(self, reason: str) -> bool:
+        print(f"[WARN] [{self.name}] Captura perdida ({reason}); a religar...")
+        self.last_error = reason
+        self._close()
+        with self._lock:
+            self._set_state(STATE_RECONNECTING)
+        self.reconnects += 1
+        ok = self.connect()
+        if ok:
+            print(f"[INFO] [{self.name}] Captura restabelecida (religação #{self.reconnects})")
+        return ok
+
+    # ---------------- API compatível com cv2.VideoCapture ----------------
+    def read(self) -> Tuple[bool, Optional[np.ndarray]]:
+        """
+        Devolve o próximo frame; em falhas volta a ligar (bloqueia a thread de captura, não o servidor).
+        Devolve (False, None) só no fim de um ficheiro ou depois de stop().
+        """
+        while not self._stop.is_set():
+            cap = self._cap
+            if cap is None:
+                if not self._reconnect(self.last_error or "sem ligação"):
+                    break
+                continue
+
+            try:
+                ret, frame = cap.read()
+            except Exception as exc:
+                ret, frame = False, None
+                self.last_error = f"read: {exc}"
+
+            if ret and frame is not None:
+                last_encoded = getattr(cap, "last_encoded", None)
+                self._encoded = last_encoded() if last_encoded is not None else None
+                return True, self._accept(frame)
+            if self._stop.is_set():
+                break
+            if ret and frame is None:
+                self._decode_failures += 1
+            if self.loop_file:
+                return False, None  # fim do ficheiro: o pipeline rebobina
+
+            self.read_failures += 1
+            self._consecutive_failures += 1
+            if self._consecutive_failures >= self.max_read_failures:
+                if not self._reconnect(f"{self._consecutive_failures} leituras falhadas seguidas"):
+                    break
+        return False, None
+
+    def _accept(self, frame: np.ndarray) -> np.ndarray:
+        size = (frame.shape[1], frame.shape[0])
+        if self._frame_size is not None and size != self._frame_size:
+            # a fonte voltou com outra resolução: manter a geometria das vagas válida
+            # (o 1º frame de uma religação pode vir sem redução: redimensionar sem aviso)
+            if not self._size_warned and size != self._full_size:
+                print(f"[WARN] [{self.name}] Resolução mudou de {self._frame_size} para {size}; frames redimensionados")
+                self._size_warned = True
+            frame = cv2.resize(frame, self._frame_size, interpolation=cv2.INTER_AREA)
+        now = time.time()
+        with self._lock:
+            self._last_frame = frame
+            self._last_frame_time = now
+            self._consecutive_failures = 0
+            self.frames += 1
+            self._set_state(STATE_ONLINE)
+        return frame
+
+    def isOpened(self) -> bool:
+        return self._cap is not None
+
+    def get(self, prop_id: int) -> float:
+        if self._frame_size is not None:
+            if prop_id == cv2.CAP_PROP_FRAME_WIDTH:
+                return float(self._frame_size[0])
+            if prop_id == cv2.CAP_PROP_FRAME_HEIGHT:
+                return float(self._frame_size[1])
+        cap = self._cap
+        return float(cap.get(prop_id)) if cap is not None else 0.0
+
+    def set(self, prop_id: int, value: float) -> bool:
+        cap = self._cap
+        return bool(cap.set(prop_id, value)) if cap is not None else False
+
+    def set_decode_reduction(self, reduction: int) -> bool:
+        """
+        Pede aos leitores ESP32 frames descodificados a 1/reduction (IMREAD_REDUCED_COLOR_*).
+        Devolve False se a fonte não for JPEG (ficheiro, RTSP, webcam): aí fica a resolução completa.
+        """
+        cap = self._cap
+        if cap is None or self._full_size is None or not hasattr(cap, "set_decode_reduction"):
+            return False
+        if not cap.set_decode_reduction(reduction):
+            return False
+        with self._lock:
+            self._decode_reduction = reduction
+            self._frame_size = reduced_frame_size(self._full_size, reduction)
+        return True
+
+    def last_encoded(self) -> Optional[bytes]:
+        """JPEG original do último frame devolvido por read() (None se a fonte não for JPEG)."""
+        return self._encoded
+
+    def stop(self):
+        """Interrompe o backoff e faz read() devolver False."""
+        self._stop.set()
+
+    def release(self):
+        self.stop()
+        self._close()
+        with self._lock:
+            self._set_state(STATE_STOPPED)
+
+    # ---------------- saúde ----------------
+    def last_good_frame(self) -> Tuple[Optional[np.ndarray], Optional[float]]:
+        with self._lock:
+            return self._last_frame, self._last_frame_time
+
+    def health(self) -> Dict[str, Any]:
+        now = time.time()
+        with self._lock:
+            cap = self._cap
+            age = None if self._last_frame_time is None else now - self._last_frame_time
+            next_retry = None if self._next_retry is None else max(0.0, self._next_retry - now)
+            state = self._state
+            since = self._state_since
+
+        decode_failures = self._decode_failures + self._decode_failures_closed
+        stats = getattr(cap, "stats", None)
+        if callable(stats):
+            decode_failures += int(stats().get("decode_errors", 0))
+
+        stale = state != STATE_ONLINE or age is None or age > self.stale_after
+        return {
+            "state": state,
+            "state_since": round(since, 3),
+            "online": state == STATE_ONLINE,
+            "stale": stale,
+            "last_frame_age": round(age, 3) if age is not None else None,
+            "frames": self.frames,
+            "reconnects": self.reconnects,
+            "read_failures": self.read_failures,
+            "decode_failures": decode_failures,
+            "last_error": self.last_error,
+            "next_retry_in": round(next_retry, 2) if next_retry is not None else None,
+        }
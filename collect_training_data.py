@@ -206,6 +206,10 @@ def main():
         
         frame_id = datetime.now().strftime("%Y%m%d_%H%M%S")
         frame_count += 1
+
+        # Frame completo (usado pelo train_roi_model.py com os labels das vagas)
+        os.makedirs(f"{DATASET_DIR}/frames", exist_ok=True)
+        cv2.imwrite(f"{DATASET_DIR}/frames/{frame_id}.jpg", frame)
         
         # Para cada vaga
         for spot in scaled_spots:
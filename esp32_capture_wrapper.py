@@ -1,12 +1,238 @@
 """
-Wrapper para ler frames da ESP32-CAM de forma compatível com OpenCV.
-Usa HTTP GET requests individuais em vez de MJPEG stream.
+Wrappers para ler frames da ESP32-CAM de forma compatível com OpenCV.
+- ESP32StreamReader: uma ligação persistente ao /stream (multipart MJPEG), com parsing do
+  boundary e decode numa thread de prefetch; read() devolve o frame mais recente.
+- ESP32CaptureWrapper: fallback com HTTP GET individuais ao /capture.
+Ambos podem descodificar o JPEG já reduzido (set_decode_reduction: IMREAD_REDUCED_COLOR_2/4/8)
+e guardam os bytes do último frame lido (last_encoded) para um decode completo a pedido (ALPR).
 """
 import cv2
 import numpy as np
 import urllib.request
+import threading
 import time
-from typing import Optional, Tuple
+from typing import Dict, Optional, Tuple
+
+DEFAULT_STREAM_BOUNDARY = b"frameboundary"  # igual ao _STREAM_BOUNDARY do firmware
+DECODE_FLAGS = {
+    1: cv2.IMREAD_COLOR,
+    2: cv2.IMREAD_REDUCED_COLOR_2,
+    4: cv2.IMREAD_REDUCED_COLOR_4,
+    8: cv2.IMREAD_REDUCED_COLOR_8,
+}
+
+
+def decode_jpeg(data: bytes, reduction: int = 1) -> Optional[np.ndarray]:
+    """Descodifica um JPEG, opcionalmente reduzido a 1/2, 1/4 ou 1/8 durante o próprio decode."""
+    return cv2.imdecode(np.frombuffer(data, dtype=np.uint8), DECODE_FLAGS.get(reduction, cv2.IMREAD_COLOR))
+
+
+class ESP32StreamReader:
+    """
+    Leitor do /stream MJPEG da ESP32-CAM com uma única ligação HTTP persistente.
+    A thread de prefetch lê e descodifica os frames e guarda só o mais recente;
+    read() nunca faz I/O de rede: devolve logo um frame novo se houver, ou espera
+    até read_timeout pelo próximo. Se a ligação cair, a thread volta a ligar.
+    """
+
+    def __init__(
+        self,
+        stream_url: str,
+        connect_timeout: float = 5.0,
+        read_timeout: float = 5.0,
+        reconnect_delay: float = 1.0,
+        first_frame_timeout: float = 5.0,
+        decode_reduction: int = 1,
+    ):
+        self.stream_url = stream_url
+        self.decode_reduction = decode_reduction
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self.reconnect_delay = reconnect_delay
+        self._width = 640
+        self._height = 480
+
+        self._cond = threading.Condition()
+        self._frame: Optional[np.ndarray] = None
+        self._jpeg: Optional[bytes] = None
+        self._read_jpeg: Optional[bytes] = None
+        self._frame_seq = 0
+        self._read_seq = 0
+        self._stop = threading.Event()
+        self._response = None
+
+        self.frames_received = 0
+        self.frames_skipped = 0    # frames substituídos antes de serem lidos
+        self.decode_errors = 0
+        self.reconnects = 0
+        self._recv_times = []
+
+        self._thread = threading.Thread(target=self._prefetch_loop, name="esp32-stream", daemon=True)
+        self._thread.start()
+
+        with self._cond:
+            self._cond.wait_for(lambda: self._frame is not None, timeout=first_frame_timeout)
+            self._opened = self._frame is not None
+        if self._opened:
+            print(f"[INFO] ESP32 stream conectado: {self.stream_url} ({self._width}x{self._height})")
+        else:
+            print(f"[ERRO] Sem frames do stream ESP32 em {first_frame_timeout:.0f}s: {self.stream_url}")
+            self.release()
+
+    # ---------------- prefetch ----------------
+    def _prefetch_loop(self):
+        while not self._stop.is_set():
+            try:
+                with urllib.request.urlopen(self.stream_url, timeout=self.connect_timeout) as response:
+                    self._response = response
+                    boundary = self._parse_boundary(response.headers.get("Content-Type", ""))
+                    while not self._stop.is_set():
+                        data = self._read_part(response, boundary)
+                        self._publish(data)
+            except Exception as e:
+                if self._stop.is_set():
+                    break
+                self.reconnects += 1
+                print(f"[WARN] Stream ESP32 interrompido ({e}); a religar em {self.reconnect_delay:.1f}s")
+                self._stop.wait(self.reconnect_delay)
+            finally:
+                self._response = None
+
+    @staticmethod
+    def _parse_boundary(content_type: str) -> bytes:
+        for param in content_type.split(";"):
+            key, _, value = param.strip().partition("=")
+            if key.lower() == "boundary" and value:
+                return value.strip('"').encode("latin-1")
+        return DEFAULT_STREAM_BOUNDARY
+
+    @staticmethod
+    def _read_part(response, boundary: bytes) -> bytes:
+        """Lê a próxima parte JPEG do multipart (boundary, headers, corpo)."""
+        markers = {b"--" + boundary.lstrip(b"-"), boundary}
+        while True:
+            line = response.readline()
+            if not line:
+                raise ConnectionError("stream terminou")
+            if line.strip() in markers:
+                break
+
+        headers: Dict[bytes, bytes] = {}
+        while True:
+            line = response.readline()
+            if not line:
+                raise ConnectionError("stream terminou")
+            line = line.strip()
+            if not line:
+                break
+            key, _, value = line.partition(b":")
+            headers[key.strip().lower()] = value.strip()
+
+        length = headers.get(b"content-length")
+        if length is not None:
+            size = int(length)
+            data = response.read(size)
+            if len(data) < size:
+                raise ConnectionError("frame truncado")
+            return data
+
+        # Sem Content-Length: ler até ao fim do JPEG (marcador EOI)
+        chunks = []
+        while True:
+            line = response.readline()
+            if not line:
+                raise ConnectionError("stream terminou")
+            chunks.append(line)
+            if line.rstrip(b"\r\n").endswith(b"\xff\xd9"):
+                return b"".join(chunks).rstrip(b"\r\n")
+
+    def _publish(self, data: bytes):
+        frame = decode_jpeg(data, self.decode_reduction)
+        if frame is None:
+            self.decode_errors += 1
+            return
+        now = time.time()
+        with self._cond:
+            if self._frame_seq > self._read_seq and self._frame is not None:
+                self.frames_skipped += 1
+            self._frame = frame
+            self._jpeg = data
+            self._frame_seq += 1
+            self._height, self._width = frame.shape[:2]
+            self.frames_received += 1
+            self._recv_times.append(now)
+            if len(self._recv_times) > 30:
+                self._recv_times.pop(0)
+            self._cond.notify_all()
+
+    # ---------------- API compatível com cv2.VideoCapture ----------------
+    def read(self) -> Tuple[bool, Optional[np.ndarray]]:
+        if not self._opened:
+            return False, None
+        with self._cond:
+            if not self._cond.wait_for(lambda: self._frame_seq > self._read_seq or self._stop.is_set(), timeout=self.read_timeout):
+                print(f"[WARN] Sem frames novos do stream ESP32 há {self.read_timeout:.0f}s")
+                return False, None
+            if self._stop.is_set():
+                return False, None
+            self._read_seq = self._frame_seq
+            self._read_jpeg = self._jpeg
+            return True, self._frame
+
+    def isOpened(self) -> bool:
+        return self._opened
+
+    def get(self, prop_id: int) -> float:
+        if prop_id == cv2.CAP_PROP_FRAME_WIDTH:
+            return float(self._width)
+        elif prop_id == cv2.CAP_PROP_FRAME_HEIGHT:
+            return float(self._height)
+        elif prop_id == cv2.CAP_PROP_FPS:
+            return float(self.measured_fps())
+        return 0.0
+
+    def set(self, prop_id: int, value: float) -> bool:
+        return False
+
+    def set_decode_reduction(self, reduction: int) -> bool:
+        """Aplica-se aos próximos frames descodificados pela thread de prefetch."""
+        self.decode_reduction = reduction
+        return True
+
+    def last_encoded(self) -> Optional[bytes]:
+        """JPEG original do último frame devolvido por read()."""
+        return self._read_jpeg
+
+    def measured_fps(self) -> float:
+        with self._cond:
+            times = list(self._recv_times)
+        if len(times) < 2 or times[-1] <= times[0]:
+            return 0.0
+        return (len(times) - 1) / (times[-1] - times[0])
+
+    def stats(self) -> Dict[str, float]:
+        return {
+            "frames_received": self.frames_received,
+            "frames_skipped": self.frames_skipped,
+            "decode_errors": self.decode_errors,
+            "reconnects": self.reconnects,
+            "fps": round(self.measured_fps(), 2),
+        }
+
+    def release(self):
+        self._opened = False
+        if self._stop.is_set():
+            return
+        self._stop.set()
+        response = self._response
+        if response is not None:
+            try:
+                response.close()
+            except Exception:
+                pass
+        with self._cond:
+            self._cond.notify_all()
+        print("[INFO] ESP32 stream fechado")
 
 
 class ESP32CaptureWrapper:
@@ -14,11 +240,12 @@ class ESP32CaptureWrapper:
     Classe que simula cv2.VideoCapture mas usa endpoint /capture da ESP32-CAM.
     """
     
-    def __init__(self, esp32_url: str, fps: int = 10):
+    def __init__(self, esp32_url: str, fps: int = 10, decode_reduction: int = 1):
         """
         Args:
             esp32_url: URL base da ESP32 (ex: http://10.254.177.15)
             fps: Frames por segundo desejados
+            decode_reduction: 1, 2, 4 ou 8 (IMREAD_REDUCED_COLOR_*)
         """
         self.base_url = esp32_url.rstrip('/')
         self.capture_url = f"{self.base_url}/capture"
@@ -28,6 +255,8 @@ class ESP32CaptureWrapper:
         self._width = 640
         self._height = 480
         self._opened = False
+        self.decode_reduction = decode_reduction
+        self._jpeg: Optional[bytes] = None
         
         # Testa se consegue capturar
         try:
@@ -47,12 +276,12 @@ class ESP32CaptureWrapper:
             with urllib.request.urlopen(self.capture_url, timeout=5) as response:
                 img_data = response.read()
             
-            img_array = np.frombuffer(img_data, dtype=np.uint8)
-            frame = cv2.imdecode(img_array, cv2.IMREAD_COLOR)
+            frame = decode_jpeg(img_data, self.decode_reduction)
             
             if frame is None:
                 return False, None
             
+            self._jpeg = img_data
             return True, frame
             
         except Exception as e:
@@ -97,6 +326,14 @@ class ESP32CaptureWrapper:
     def set(self, prop_id: int, value: float) -> bool:
         """Compatibilidade com cv2.VideoCapture.set() (não implementado)"""
         return False
+
+    def set_decode_reduction(self, reduction: int) -> bool:
+        self.decode_reduction = reduction
+        return True
+
+    def last_encoded(self) -> Optional[bytes]:
+        """JPEG original do último frame capturado."""
+        return self._jpeg
     
     def release(self):
         """Liberta recursos"""
@@ -104,32 +341,44 @@ class ESP32CaptureWrapper:
         print("[INFO] ESP32 Wrapper fechado")
 
 
-def get_video_capture(source):
+def _esp32_urls(source: str) -> Tuple[str, str]:
+    """(base_url, stream_url) a partir de http://ip, http://ip/stream ou http://ip/capture."""
+    url = source.rstrip('/')
+    tail = url.rsplit('/', 1)[-1]
+    if tail in ("stream", "capture"):
+        url = url.rsplit('/', 1)[0]
+    return url, f"{url}/stream"
+
+
+def get_video_capture(source, mode: str = "auto", decode_reduction: int = 1):
     """
     Factory function que retorna VideoCapture apropriado.
     
     Args:
         source: Pode ser um arquivo, número de câmera, URL RTSP, ou URL ESP32
+        mode: para fontes http: "auto" (stream persistente, fallback /capture),
+              "stream", "capture" ou "opencv" (cv2.VideoCapture nativo)
+        decode_reduction: decode JPEG reduzido (1, 2, 4, 8) nos leitores ESP32
     
     Returns:
         Objeto compatível com cv2.VideoCapture
     """
-    # Se for string e começar com http e contiver "10.254.177" (IP da ESP32)
     if isinstance(source, str) and source.startswith('http'):
-        # Tenta primeiro com OpenCV nativo
-        cap = cv2.VideoCapture(source)
-        if cap.isOpened():
-            # Testa se consegue ler frame
-            ret, _ = cap.read()
-            if ret:
-                print("[INFO] Usando cv2.VideoCapture nativo para stream")
+        mode = (mode or "auto").strip().lower()
+        base_url, stream_url = _esp32_urls(source)
+
+        if mode == "opencv":
+            print("[INFO] Usando cv2.VideoCapture nativo para stream")
+            return cv2.VideoCapture(source)
+
+        if mode in ("auto", "stream"):
+            cap = ESP32StreamReader(stream_url, decode_reduction=decode_reduction)
+            if cap.isOpened() or mode == "stream":
                 return cap
-            cap.release()
-        
-        # Se falhar, usa o wrapper HTTP
-        print("[INFO] Stream MJPEG falhou, usando ESP32 HTTP Capture Wrapper")
-        base_url = source.rsplit('/', 1)[0]  # Remove /stream ou /capture
-        return ESP32CaptureWrapper(base_url, fps=10)
+
+        # Fallback: pedidos individuais ao /capture
+        print("[INFO] Usando ESP32 HTTP Capture Wrapper (/capture)")
+        return ESP32CaptureWrapper(base_url, fps=10, decode_reduction=decode_reduction)
     
     # Para arquivos locais ou outras fontes, usa OpenCV normal
     return cv2.VideoCapture(source)
@@ -0,0 +1,141 @@
+"""
+Buffer circular de frames recentes de uma câmara + escolha do crop mais nítido para o ALPR.
+
+Quando uma vaga fica ocupada o carro muitas vezes ainda está em movimento e o frame da
+transição está tremido. Em vez de mandar esse crop ao OCR, o SharpestCropSelector avalia a
+vaga nos N frames seguintes (variância do Laplaciano, barata) e entrega só o melhor:
+mais leituras com o mesmo número de chamadas OCR.
+
+    captura -> FrameRingBuffer.push() -> SharpestCropSelector.on_frame() -> emit(vaga, crop)
+    inferência (vaga entrou) -> SharpestCropSelector.start(vaga, seq do frame)
+
+Os frames ficam em arrays NumPy pré-alocados (sem alocação por frame). push() e on_frame()
+correm na thread de captura; start() pode ser chamado de outra thread.
+"""
+import threading
+from typing import Callable, Dict, List, Optional, Tuple
+
+import cv2
+import numpy as np
+
+
+def laplacian_sharpness(image: np.ndarray) -> float:
+    """Variância do Laplaciano em tons de cinzento (maior = mais nítido)."""
+    if image.size == 0:
+        return 0.0
+    gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY) if image.ndim == 3 else image
+    return float(cv2.Laplacian(gray, cv2.CV_64F).var())
+
+
+class FrameRingBuffer:
+    """
+    Últimos `capacity` frames num único array (capacity, H, W, 3) alocado no primeiro push.
+    Cada frame tem um número de sequência crescente; get(seq) devolve None se já foi reescrito.
+    """
+
+    def __init__(self, capacity: int):
+        self.capacity = max(1, capacity)
+        self._frames: Optional[np.ndarray] = None
+        self._encoded: List[Optional[bytes]] = [None] * self.capacity
+        self._seqs = np.full(self.capacity, -1, dtype=np.int64)
+        self._next_seq = 0
+
+    def push(self, frame: np.ndarray, encoded: Optional[bytes] = None) -> int:
+        if self._frames is None or self._frames.shape[1:] != frame.shape:
+            self._frames = np.empty((self.capacity,) + frame.shape, dtype=frame.dtype)
+            self._seqs[:] = -1
+        seq = self._next_seq
+        slot = seq % self.capacity
+        np.copyto(self._frames[slot], frame)
+        self._encoded[slot] = encoded
+        self._seqs[slot] = seq
+        self._next_seq += 1
+        return seq
+
+    @property
+    def latest_seq(self) -> int:
+        return self._next_seq - 1
+
+    @property
+    def oldest_seq(self) -> int:
+        return max(0, self._next_seq - self.capacity)
+
+    def get(self, seq: int) -> Optional[np.ndarray]:
+        """View do frame (válida até ser reescrito; não guardar)."""
+        if self._frames is None or seq < 0:
+            return None
+        slot = seq % self.capacity
+        return self._frames[slot] if self._seqs[slot] == seq else None
+
+    def encoded(self, seq: int) -> Optional[bytes]:
+        slot = seq % self.capacity
+        return self._encoded[slot] if self._seqs[slot] == seq else None
+
+
+class SharpestCropSelector:
+    """
+    Trabalhos pendentes de ALPR por vaga. Cada trabalho avalia os frames [seq, seq + frames)
+    e, quando termina, chama emit(spot_index, best_seq, score, scored) com o frame mais nítido.
+    """
+
+    def __init__(
+        self,
+        ring: FrameRingBuffer,
+        bboxes: List[Optional[Tuple[int, int, int, int]]],
+        frames: int,
+        emit: Callable[[int, int, float, int], None],
+    ):
+        self.ring = ring
+        self.bboxes = bboxes
+        self.frames = max(1, frames)
+        self.emit = emit
+        self._lock = threading.Lock()
+        self._jobs: Dict[int, Dict[str, float]] = {}
+
+    def start(self, spot_index: int, seq: int):
+        with self._lock:
+            if spot_index not in self._jobs and self.bboxes[spot_index] is not None:
+                self._jobs[spot_index] = {"start": seq, "next": seq, "best_seq": -1, "best": -1.0, "scored": 0}
+
+    def cancel(self, spot_index: int):
+        with self._lock:
+            self._jobs.pop(spot_index, None)
+
+    def pending(self) -> List[int]:
+        with self._lock:
+            return list(self._jobs)
+
+    def on_frame(self):
+        """Avalia os frames novos no buffer para cada trabalho pendente (thread de captura)."""
+        with self._lock:
+            jobs = list(self._jobs.items())
+        if not jobs:
+            return
+
+        latest = self.ring.latest_seq
+        oldest = self.ring.oldest_seq
+        finished = []
+        for spot_index, job in jobs:
+            x0, y0, x1, y1 = self.bboxes[spot_index]
+            end = int(job["start"]) + self.frames
+            # frames que já saíram do buffer (inferência atrasada) são saltados
+            seq = max(int(job["next"]), oldest)
+            while seq <= latest and seq < end:
+                frame = self.ring.get(seq)
+                if frame is not None:
+                    score = laplacian_sharpness(frame[y0:y1, x0:x1])
+                    job["scored"] += 1
+                    if score > job["best"]:
+                        job["best"], job["best_seq"] = score, seq
+                seq += 1
+            job["next"] = seq
+            if seq >= end:
+                finished.append((spot_index, job))
+
+        for spot_index, job in finished:
+            with self._lock:
+                if self._jobs.get(spot_index) is not job:
+                    continue  # cancelado entretanto
+                del self._jobs[spot_index]
+            if job["best_seq"] >= 0:
+                self.emit(spot_index, int(job["best_seq"]), float(job["best"]), int(job["scored"]))
@@ -2,6 +2,14 @@
 import React from 'react';
 import Card from '../components/common/Card';
 
+// plate_verified_at: last time (epoch seconds) the spot's appearance confirmed the same car
+// after a confident read; only shown while plate_track.state is 'verified'
+const formatVerifiedAgo = (epochSeconds) => {
+    const minutes = Math.floor((Date.now() / 1000 - epochSeconds) / 60);
+    if (minutes < 1) return 'just now';
+    return minutes === 1 ? '1 minute ago' : `${minutes} minutes ago`;
+};
+
 export default function LiveMonitor() {
     const [spots, setSpots] = React.useState({});
     const [wsStatus, setWsStatus] = React.useState('Connecting...');
@@ -181,6 +189,11 @@ export default function LiveMonitor() {
                                                 {plate && (
                                                     <div style={{ fontSize: '0.875rem', marginTop: '0.5rem', paddingTop: '0.5rem', borderTop: '1px solid rgba(255,255,255,0.2)' }}>
                                                         <strong>License Plate:</strong> <code style={{ color: 'white', backgroundColor: 'rgba(0,0,0,0.3)', padding: '0.2rem 0.5rem', borderRadius: '4px', marginLeft: '0.25rem' }}>{plate}</code>
+                                                        {spot.plate_track?.state === 'verified' && spot.plate_verified_at && (
+                                                            <div style={{ fontSize: '0.75rem', marginTop: '0.25rem', opacity: 0.8 }}>
+                                                                Verified {formatVerifiedAgo(spot.plate_verified_at)}
+                                                            </div>
+                                                        )}
                                                     </div>
                                                 )}
                                                 {spot.reservation?.plate && (
@@ -9,19 +9,20 @@ import numpy as np
 import json
 import math
 import traceback
+import urllib.request
 from pathlib import Path
-from collections import defaultdict, deque
+from collections import OrderedDict, deque
 import threading
+import multiprocessing
+import queue
 import asyncio
 import time
-from concurrent.futures import ThreadPoolExecutor, Future
+from concurrent.futures import Future
 from datetime import datetime, timezone, timedelta
 from dotenv import load_dotenv
 load_dotenv()
 
 import torch
-from PIL import Image
-import torchvision.transforms as T
 import asyncpg
 from asyncpg import exceptions as pg_exceptions
 
@@ -31,15 +32,27 @@ except ImportError:  # pragma: no cover - fallback when package missing
     ALPR = None
 
 from fastapi import FastAPI, WebSocket, WebSocketDisconnect, HTTPException, Request, UploadFile, File, Form, Header
-from fastapi.responses import JSONResponse, HTMLResponse, StreamingResponse
+from fastapi.responses import JSONResponse, HTMLResponse, Response, StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
 from pydantic import BaseModel, Field
 from starlette.middleware.sessions import SessionMiddleware
 import jwt
 import hashlib
 
-from spot_classifier import SpotClassifier
-from esp32_capture_wrapper import get_video_capture
+from spot_vision import extract_spot_crop
+from camera_registry import CameraConfig, load_camera_registry
+from camera_worker import load_camera_spots, run_camera_worker
+from plate_index import CONFUSABLE_COST, PlateIndex
+from plate_tracker import PlateTracker
+from alpr_service import (
+    AlprResultCache,
+    AlprService,
+    QueueFullError,
+    draw_plate_detections,
+    normalize_confidence,
+    perceptual_hash,
+    plate_detections,
+)
 
 try:
     from supabaseStorage import SupabaseStorageService
@@ -48,11 +61,17 @@ except ImportError:
 
 # Novo módulo de autenticação v2.0
 try:
-    from auth_routes import router as auth_router, set_db_pool as set_auth_db_pool, set_refresh_reservations_callback
+    from auth_routes import (
+        router as auth_router,
+        set_db_pool as set_auth_db_pool,
+        set_refresh_reservations_callback,
+        set_refresh_users_callback,
+    )
 except ImportError:
     auth_router = None
     set_auth_db_pool = None
     set_refresh_reservations_callback = None
+    set_refresh_users_callback = None
 
 
 # ------------------------------------------------------------
@@ -60,13 +79,45 @@ except ImportError:
 # ------------------------------------------------------------
 VIDEO_SOURCE = os.getenv("VIDEO_SOURCE", "video.mp4")            # pode ser 0, ficheiro ou RTSP
 SPOTS_FILE = Path(os.getenv("SPOTS_FILE", "parking_spots.json"))
+CAMERAS_FILE = os.getenv("CAMERAS_FILE", "")                       # registo multi-câmara (JSON); vazio = VIDEO_SOURCE/SPOTS_FILE
+CAMERA_PIPELINE_MODE = os.getenv("CAMERA_PIPELINE_MODE", "thread")  # "thread" ou "process" (um processo por câmara)
+ESP32_CAPTURE_MODE = os.getenv("ESP32_CAPTURE_MODE", "auto")      # fontes http: "auto", "stream", "capture" ou "opencv"
+ALPR_SHARPNESS_FRAMES = int(os.getenv("ALPR_SHARPNESS_FRAMES", 8))  # frames avaliados após a entrada; o mais nítido vai ao ALPR (0 = frame da entrada)
+ALPR_FRAME_BUFFER = int(os.getenv("ALPR_FRAME_BUFFER", 16))         # frames no buffer circular por câmara (>= ALPR_SHARPNESS_FRAMES)
+PLATE_TRACK_INTERVAL = float(os.getenv("PLATE_TRACK_INTERVAL", "10"))          # s entre verificações da aparência das vagas ocupadas (0 = sem seguimento)
+PLATE_TRACK_MAX_CHANGE = float(os.getenv("PLATE_TRACK_MAX_CHANGE", "0.35"))    # distância de aparência (0-1) acima da qual se volta a ler a matrícula
+PLATE_TRACK_MIN_CONF = float(os.getenv("PLATE_TRACK_MIN_CONF", "0.8"))         # confiança do OCR para manter a leitura sem reler
+PLATE_TRACK_RETRY_SECONDS = float(os.getenv("PLATE_TRACK_RETRY_SECONDS", "30"))  # espera antes de reler uma leitura fraca (duplica a cada tentativa)
+PLATE_TRACK_MAX_RETRIES = int(os.getenv("PLATE_TRACK_MAX_RETRIES", "3"))       # releituras de uma leitura fraca por estacionamento
+DECODE_REDUCTION = os.getenv("DECODE_REDUCTION", "auto")         # JPEG ESP32: "auto" ou 1/2/4/8 (IMREAD_REDUCED_COLOR_*)
+DECODE_MIN_SPOT_SIZE = int(os.getenv("DECODE_MIN_SPOT_SIZE", 64))  # lado mínimo (px) das vagas no frame reduzido
+CAPTURE_BACKOFF_INITIAL = float(os.getenv("CAPTURE_BACKOFF_INITIAL", 1.0))  # segundos até à 1ª nova tentativa (duplica a cada falha)
+CAPTURE_BACKOFF_MAX = float(os.getenv("CAPTURE_BACKOFF_MAX", 30.0))          # teto do backoff de religação
+CAPTURE_STALE_SECONDS = float(os.getenv("CAPTURE_STALE_SECONDS", 5.0))      # sem frames há mais do que isto = estado antigo
+CAPTURE_MAX_READ_FAILURES = int(os.getenv("CAPTURE_MAX_READ_FAILURES", 3))   # leituras falhadas seguidas antes de religar
+FILE_PLAYBACK = os.getenv("FILE_PLAYBACK", "realtime")            # ficheiros: "realtime" (ao FPS do vídeo) ou "max" (sem pacing)
+BENCHMARK_FRAMES = int(os.getenv("BENCHMARK_FRAMES", 0))           # com FILE_PLAYBACK=max: frames a correr antes do relatório (0 = contínuo)
+CAMERA_RESULTS_QUEUE_SIZE = 16
 MODEL_FILE = Path(os.getenv("MODEL_FILE", "spot_classifier.pth"))
 
 DEVICE_NAME = os.getenv("DEVICE", "auto")                       # "cpu", "cuda" ou "auto"
-SPOT_THRESHOLD = float(os.getenv("SPOT_THRESHOLD", 0.65))
+SPOT_BACKEND = os.getenv("SPOT_BACKEND", "auto")                 # "auto", "torch", "torchscript" ou "onnx"
+SPOT_INTRA_OP_THREADS = int(os.getenv("SPOT_INTRA_OP_THREADS", 0))  # 0 = default do runtime
+SPOT_INTER_OP_THREADS = int(os.getenv("SPOT_INTER_OP_THREADS", 0))
+SPOT_THRESHOLD = float(os.getenv("SPOT_THRESHOLD", 0.65))            # p(ocupado) para livre -> ocupado
+SPOT_EXIT_THRESHOLD = float(os.getenv("SPOT_EXIT_THRESHOLD", 0.45))  # p(ocupado) abaixo do qual ocupado -> livre
+SPOT_MIN_DWELL_SECONDS = float(os.getenv("SPOT_MIN_DWELL_SECONDS", 2.0))  # tempo mínimo num estado antes de mudar
 HISTORY_LEN = int(os.getenv("HISTORY_LEN", 3))
-PROCESS_EVERY_N_FRAMES = int(os.getenv("PROCESS_EVERY_N_FRAMES", 2))  # 1 em cada N frames
+PROCESS_EVERY_N_FRAMES = int(os.getenv("PROCESS_EVERY_N_FRAMES", 2))  # 1 em cada N frames (scheduler "fixed")
+INFERENCE_SCHEDULER = os.getenv("INFERENCE_SCHEDULER", "adaptive")   # "adaptive" ou "fixed"
+INFERENCE_MIN_INTERVAL = float(os.getenv("INFERENCE_MIN_INTERVAL", 0.1))   # segundos (taxa máxima)
+INFERENCE_MAX_INTERVAL = float(os.getenv("INFERENCE_MAX_INTERVAL", 2.0))   # segundos (taxa mínima sem atividade)
+INFERENCE_CPU_BUDGET = float(os.getenv("INFERENCE_CPU_BUDGET", 0.5))       # fração do tempo de CPU da thread de inferência
+INFERENCE_ACTIVITY_WINDOW = float(os.getenv("INFERENCE_ACTIVITY_WINDOW", 30))  # segundos de atividade recente
 IMG_SIZE = 64  # tamanho da imagem de input para a CNN
+STREAM_JPEG_QUALITY = int(os.getenv("STREAM_JPEG_QUALITY", 80))   # qualidade JPEG do /video_feed (1-100)
+STREAM_MAX_WIDTH = int(os.getenv("STREAM_MAX_WIDTH", 960))        # largura máxima do /video_feed (0 = original)
+STREAM_MAX_FPS = float(os.getenv("STREAM_MAX_FPS", 10))           # frames/s máximos anotados + codificados
 PARKING_RATE_PER_HOUR = float(os.getenv("PARKING_RATE_PER_HOUR", 1.50))  # tarifa por hora
 
 def _str_to_bool(value: str) -> bool:
@@ -80,10 +131,35 @@ def _parse_providers(value: str) -> List[str]:
     return [p for p in providers if p]
 
 
+# Modo incremental: só reclassifica vagas cuja ROI mudou desde a última inferência
+INCREMENTAL_INFERENCE = _str_to_bool(os.getenv("INCREMENTAL_INFERENCE", "false"))
+CHANGE_GATE_DELTA = float(os.getenv("CHANGE_GATE_DELTA", 4.0))        # diferença média absoluta (0-255)
+FULL_REFRESH_SECONDS = float(os.getenv("FULL_REFRESH_SECONDS", 30))   # reclassificação total a cada K segundos
+
 ENABLE_ALPR = _str_to_bool(os.getenv("ENABLE_ALPR", "true"))
 ALPR_DETECTOR_MODEL = os.getenv("ALPR_DETECTOR_MODEL", "yolo-v9-s-608-license-plate-end2end")
 ALPR_OCR_MODEL = os.getenv("ALPR_OCR_MODEL", "cct-s-v1-global-model")
 ALPR_WORKERS = max(1, int(os.getenv("ALPR_WORKERS", "1")))
+GATE_ALPR_WORKERS = max(1, int(os.getenv("GATE_ALPR_WORKERS", "1")))  # ALPR das cancelas em paralelo (/api/entry, /api/exit)
+GATE_ALPR_QUEUE = max(0, int(os.getenv("GATE_ALPR_QUEUE", "4")))        # pedidos à espera antes de responder 503
+PLATE_FUZZY_MAX_DISTANCE = float(os.getenv("PLATE_FUZZY_MAX_DISTANCE", "0.5"))  # orçamento de edição (O/0, I/1, B/8... = 0.5); 0 desliga
+PLATE_FUZZY_ALLOW_EDITS = _str_to_bool(os.getenv("PLATE_FUZZY_ALLOW_EDITS", "false"))  # aceitar orçamentos > 0.5 (trocas não confundíveis: outro carro)
+GATE_ANNOTATE = os.getenv("GATE_ANNOTATE", "eager")                    # "eager" (desenha antes do upload) ou "lazy" (só quando pedida)
+GATE_ANNOTATED_CACHE = max(0, int(os.getenv("GATE_ANNOTATED_CACHE", "32")))  # imagens anotadas em cache (modo lazy)
+ALPR_WARMUP = _str_to_bool(os.getenv("ALPR_WARMUP", "true"))            # carregar e aquecer o ALPR no arranque
+ALPR_EXECUTOR = os.getenv("ALPR_EXECUTOR", "thread")                    # "thread" ou "process" (um modelo ALPR por processo)
+ALPR_INTRA_OP_THREADS = int(os.getenv("ALPR_INTRA_OP_THREADS", "0"))    # threads ONNX por worker do pool (0 = omissão)
+ALPR_BATCH_WINDOW_MS = float(os.getenv("ALPR_BATCH_WINDOW_MS", "50"))   # janela para juntar crops num batch
+ALPR_MAX_BATCH = max(1, int(os.getenv("ALPR_MAX_BATCH", "16")))          # crops máximos por batch
+ALPR_CACHE_MAX_DISTANCE = int(os.getenv("ALPR_CACHE_MAX_DISTANCE", "6"))  # bits de diferença (pHash 64 bits) para reutilizar; -1 desliga
+ALPR_CACHE_TTL = float(os.getenv("ALPR_CACHE_TTL", "600"))                # segundos que uma leitura pode ser reutilizada
+ALPR_CACHE_PER_SPOT = int(os.getenv("ALPR_CACHE_PER_SPOT", "4"))          # leituras guardadas por vaga
+ALPR_CACHE_SIZE = int(os.getenv("ALPR_CACHE_SIZE", "256"))                # leituras guardadas no total
+ALPR_CASCADE = _str_to_bool(os.getenv("ALPR_CASCADE", "false"))         # detetor pequeno primeiro, o grande só com baixa confiança
+ALPR_CASCADE_DETECTOR_MODEL = os.getenv("ALPR_CASCADE_DETECTOR_MODEL", "yolo-v9-t-384-license-plate-end2end")
+ALPR_CASCADE_OCR_MODEL = os.getenv("ALPR_CASCADE_OCR_MODEL", "")         # vazio = mesmo OCR do nível completo (partilhado)
+ALPR_CASCADE_MIN_DET_CONF = float(os.getenv("ALPR_CASCADE_MIN_DET_CONF", "0.6"))  # abaixo disto usa o detetor grande
+ALPR_CASCADE_MIN_OCR_CONF = float(os.getenv("ALPR_CASCADE_MIN_OCR_CONF", "0.8"))  # idem para a confiança média do OCR
 ALPR_EVENT_BUFFER = int(os.getenv("ALPR_EVENT_BUFFER", "40"))
 ALPR_DETECTOR_PROVIDERS = _parse_providers(os.getenv("ALPR_DETECTOR_PROVIDERS", "CPUExecutionProvider"))
 ALPR_OCR_PROVIDERS = _parse_providers(os.getenv("ALPR_OCR_PROVIDERS", "CPUExecutionProvider"))
@@ -102,6 +178,11 @@ if ENABLE_ALPR and ALPR is None:
     print("[WARN] fast_alpr nao encontrado; ALPR desativado.")
     ENABLE_ALPR = False
 
+if PLATE_FUZZY_MAX_DISTANCE > CONFUSABLE_COST and not PLATE_FUZZY_ALLOW_EDITS:
+    # uma troca não confundível (AB12CE -> AB12CD) é outra matrícula: cobrar/abrir a cancela a outro utilizador
+    print(f"[WARN] PLATE_FUZZY_MAX_DISTANCE={PLATE_FUZZY_MAX_DISTANCE} requer PLATE_FUZZY_ALLOW_EDITS=true; a usar {CONFUSABLE_COST}.")
+    PLATE_FUZZY_MAX_DISTANCE = CONFUSABLE_COST
+
 
 # ------------------------------------------------------------
 # FASTAPI
@@ -133,19 +214,26 @@ g_spot_status: Dict[str, Any] = {}
 g_spot_meta: Dict[str, Dict[str, Any]] = {}
 g_lock = threading.Lock()
 g_frame_lock = threading.Lock()
-g_last_frame_jpeg: Optional[bytes] = None
+g_camera_spot_status: Dict[str, Dict[str, Any]] = {}  # camera_id -> estado das vagas dessa câmara (g_lock)
+g_stream_frames: Dict[str, Tuple[int, bytes]] = {}    # camera_id -> (seq, JPEG) (g_frame_lock)
+g_stream_viewers: Dict[str, int] = {}                 # camera_id -> clientes do /video_feed (g_frame_lock)
 g_plate_lock = threading.Lock()
-g_plate_memory: Dict[str, Dict[str, Any]] = {}
+g_plate_memory: Dict[str, Dict[str, Any]] = {}  # vaga -> última leitura + estado do seguimento ("track", "verified_at")
 g_plate_events: deque = deque(maxlen=ALPR_EVENT_BUFFER)
 g_plate_events_lock = threading.Lock()
 g_alpr_pending_lock = threading.Lock()
 g_alpr_pending = set()
+g_annotated_cache_lock = threading.Lock()
+g_annotated_cache: "OrderedDict[Tuple[int, str], bytes]" = OrderedDict()  # (sessão, entry/exit) -> JPEG anotado (LRU)
 g_reservations_lock = threading.Lock()
 g_active_reservations: Dict[str, Dict[str, Any]] = {}
 g_recent_violations: Dict[str, float] = {}  # Cache de violações recentes: key -> timestamp
 g_recent_violations_lock = threading.Lock()
 g_users_lock = threading.Lock()
 g_users: Dict[str, Dict[str, Any]] = {}
+g_plate_index = PlateIndex(max_edits=int(PLATE_FUZZY_MAX_DISTANCE))  # matrículas de g_users (pesquisa aproximada)
+g_cameras: Optional[List[CameraConfig]] = None
+g_camera_monitors: Dict[str, "CameraMonitor"] = {}
 db_pool: Optional[asyncpg.Pool] = None
 
 # Supabase Storage Service
@@ -164,9 +252,38 @@ if SupabaseStorageService and SUPABASE_URL and SUPABASE_KEY:
         supabase_storage = None
 
 
-alpr_executor: Optional[ThreadPoolExecutor] = ThreadPoolExecutor(max_workers=ALPR_WORKERS) if ENABLE_ALPR else None
-_alpr_instance_lock = threading.Lock()
-_alpr_instance: Optional["ALPR"] = None
+ALPR_BUILD_KWARGS: Dict[str, Any] = {  # argumentos do build_alpr (servidor e workers do pool)
+    "detector_model": ALPR_DETECTOR_MODEL,
+    "ocr_model": ALPR_OCR_MODEL,
+    "detector_providers": ALPR_DETECTOR_PROVIDERS or None,
+    "ocr_providers": ALPR_OCR_PROVIDERS or None,
+    "ocr_device": ALPR_OCR_DEVICE,
+    "cascade_detector_model": ALPR_CASCADE_DETECTOR_MODEL if ALPR_CASCADE else None,
+    "cascade_ocr_model": ALPR_CASCADE_OCR_MODEL or None,
+    "cascade_min_det_conf": ALPR_CASCADE_MIN_DET_CONF,
+    "cascade_min_ocr_conf": ALPR_CASCADE_MIN_OCR_CONF,
+}
+# Único ALPR do processo: modelo, aquecimento, batcher/pool do monitor e executor das cancelas
+alpr_engine = AlprService(
+    ALPR_BUILD_KWARGS,
+    enabled=ENABLE_ALPR,
+    workers=ALPR_WORKERS,
+    executor=ALPR_EXECUTOR,
+    intra_op_threads=ALPR_INTRA_OP_THREADS,
+    batch_window=ALPR_BATCH_WINDOW_MS / 1000.0,
+    max_batch=ALPR_MAX_BATCH,
+    request_workers=GATE_ALPR_WORKERS,
+    request_queue=GATE_ALPR_QUEUE,
+    warmup=ALPR_WARMUP,
+)
+plate_tracker: Optional[PlateTracker] = (
+    PlateTracker(PLATE_TRACK_MAX_CHANGE, PLATE_TRACK_MIN_CONF, PLATE_TRACK_RETRY_SECONDS, PLATE_TRACK_MAX_RETRIES)
+    if ENABLE_ALPR and PLATE_TRACK_INTERVAL > 0 else None
+)
+alpr_cache: Optional[AlprResultCache] = (
+    AlprResultCache(ALPR_CACHE_MAX_DISTANCE, ALPR_CACHE_TTL, ALPR_CACHE_PER_SPOT, ALPR_CACHE_SIZE)
+    if ENABLE_ALPR and ALPR_CACHE_MAX_DISTANCE >= 0 else None
+)
 
 # Loop principal do FastAPI (para usar no thread)
 event_loop: Optional[asyncio.AbstractEventLoop] = None
@@ -229,52 +346,25 @@ def get_torch_device() -> torch.device:
     return torch.device("cpu")
 
 
-def load_spots(spots_path: Path):
-    if not spots_path.exists():
-        raise FileNotFoundError(f"Spots nÃ£o encontrados: {spots_path}")
-
-    with open(spots_path, "r", encoding="utf-8") as f:
-        payload = json.load(f)
-
-    spots_raw = payload["spots"]
-    result = []
-
-    for s in spots_raw:
-        pts = np.array([[p["x"], p["y"]] for p in s["points"]], dtype=np.float32)
-        result.append({
-            "name": s["name"],
-            "points": pts,
-            "reserved": bool(s.get("reserved", False)),
-            "authorized": s.get("authorized_plates", []) or [],
-        })
-
-    ref = payload.get("reference_size")
-    reference_size = (
-        (int(ref["width"]), int(ref["height"]))
-        if ref else None
-    )
-
-    return result, reference_size
-
-
 def update_spot_meta_cache(spots: List[Dict[str, Any]]):
+    """Atualiza a meta das vagas indicadas (as vagas das outras câmaras mantêm-se)."""
     global g_spot_meta
-    g_spot_meta = {
+    meta = dict(g_spot_meta)
+    meta.update({
         spot["name"]: {
             "reserved": bool(spot.get("reserved", False)),
             "authorized": list(spot.get("authorized", []) or []),
         }
         for spot in spots
-    }
+    })
+    g_spot_meta = meta
 
 
 def ensure_spot_meta_loaded():
     if g_spot_meta:
         return
-    if not SPOTS_FILE.exists():
-        return
     try:
-        spots, _ = load_spots(SPOTS_FILE)
+        spots = load_all_camera_spots()
     except Exception:
         return
     update_spot_meta_cache(spots)
@@ -321,6 +411,8 @@ async def refresh_users_cache() -> List[Dict[str, Any]]:
         g_users.clear()
         for row in payload:
             g_users[row["plate_norm"]] = dict(row)
+        plates = list(g_users)
+    g_plate_index.sync(plates)
     return payload
 
 
@@ -403,103 +495,6 @@ async def ensure_user_loaded(plate_norm: str) -> Optional[Dict[str, Any]]:
     return get_user_by_plate_norm(plate_norm)
 
 
-def scale_spots(spots, ref_size, frame_size):
-    fw, fh = frame_size
-
-    if ref_size:
-        sx = fw / ref_size[0]
-        sy = fh / ref_size[1]
-        print(f"[INFO] Escala vagas: sx={sx:.3f}, sy={sy:.3f}")
-    else:
-        sx = sy = 1.0
-        print("[WARN] reference_size ausente, assumindo escala 1:1")
-
-    scaled = []
-    for spot in spots:
-        pts = spot["points"].copy()
-        pts[:, 0] *= sx
-        pts[:, 1] *= sy
-
-        pts_int = np.round(pts).astype(np.int32)
-
-        scaled.append({
-            "name": spot["name"],
-            "points": pts_int,
-            "reserved": bool(spot.get("reserved", False)),
-            "authorized": spot.get("authorized", []) or [],
-        })
-
-    return scaled
-
-
-def build_batch(frame, scaled_spots, transform):
-    h, w = frame.shape[:2]
-    meta = []
-    tensors = []
-
-    for spot in scaled_spots:
-        name = spot["name"]
-        pts = spot["points"]
-
-        mask = np.zeros((h, w), dtype=np.uint8)
-        cv2.fillPoly(mask, [pts], 255)
-
-        cropped = cv2.bitwise_and(frame, frame, mask=mask)
-        x, y, w_box, h_box = cv2.boundingRect(pts)
-        crop = cropped[y:y + h_box, x:x + w_box]
-
-        if crop.size == 0:
-            continue
-
-        crop = cv2.cvtColor(crop, cv2.COLOR_BGR2RGB)
-        img = Image.fromarray(crop)
-        tensors.append(transform(img))
-        meta.append((name, pts))
-
-    if not tensors:
-        return meta, None
-
-    return meta, torch.stack(tensors, dim=0)
-
-
-def get_alpr_instance() -> Optional["ALPR"]:
-    if not ENABLE_ALPR or ALPR is None:
-        return None
-    global _alpr_instance
-    if _alpr_instance is not None:
-        return _alpr_instance
-
-    with _alpr_instance_lock:
-        if _alpr_instance is not None:
-            return _alpr_instance
-        try:
-            print("[INFO] Inicializando ALPR...")
-            _alpr_instance = ALPR(
-                detector_model=ALPR_DETECTOR_MODEL,
-                ocr_model=ALPR_OCR_MODEL,
-                detector_providers=ALPR_DETECTOR_PROVIDERS or None,
-                ocr_providers=ALPR_OCR_PROVIDERS or None,
-                ocr_device=ALPR_OCR_DEVICE,
-            )
-        except Exception as exc:  # pragma: no cover - falha de inicializaï¿½ï¿½o
-            print(f"[WARN] Falha ao inicializar ALPR: {exc}")
-            return None
-    return _alpr_instance
-
-
-def _normalize_confidence(value: Any) -> Optional[float]:
-    if value is None:
-        return None
-    if isinstance(value, (int, float)):
-        return float(value)
-    if isinstance(value, (list, tuple)):
-        vals = [float(v) for v in value if v is not None]
-        if not vals:
-            return None
-        return sum(vals) / len(vals)
-    return None
-
-
 def normalize_plate_text(plate: Optional[str]) -> Optional[str]:
     if not plate:
         return None
@@ -513,6 +508,42 @@ def get_user_by_plate_norm(plate_norm: str) -> Optional[Dict[str, Any]]:
         return dict(info) if info else None
 
 
+def register_user_plate(name: Optional[str], plate: str, plate_norm: str):
+    """Veículo adicionado: atualiza g_users e o índice aproximado sem recarregar tudo."""
+    with g_users_lock:
+        g_users[plate_norm] = {"name": name, "plate": plate, "plate_norm": plate_norm}
+    g_plate_index.add(plate_norm)
+
+
+def unregister_user_plate(plate_norm: str):
+    with g_users_lock:
+        g_users.pop(plate_norm, None)
+    g_plate_index.remove(plate_norm)
+
+
+def match_registered_plate(plate_norm: Optional[str]) -> Optional[str]:
+    """
+    plate_norm de um veículo registado para uma leitura do ALPR: exata, ou a mais próxima dentro
+    de PLATE_FUZZY_MAX_DISTANCE (tolerante a O/0, I/1, B/8...). None se não houver (ou se for ambígua).
+    """
+    if not plate_norm:
+        return None
+    if plate_norm in g_plate_index:
+        return plate_norm
+    if PLATE_FUZZY_MAX_DISTANCE <= 0:
+        return None
+    start = time.perf_counter()
+    match = g_plate_index.best_match(plate_norm, PLATE_FUZZY_MAX_DISTANCE)
+    if match is None:
+        return None
+    registered, distance = match
+    print(
+        f"[INFO] Matrícula lida {plate_norm} associada a {registered} "
+        f"(distância {distance:.1f}, {1e6 * (time.perf_counter() - start):.0f} µs)"
+    )
+    return registered
+
+
 def get_session_user(request: Request) -> Optional[Dict[str, Any]]:
     user = request.session.get("user")
     if not user:
@@ -600,6 +631,11 @@ async def apply_reservation_fines(expired_reservations: List[Dict]):
                 print(f"[ERROR] Falha ao aplicar multa: {e}")
 
 
+def reservation_spot(cache_key: str, info: Dict[str, Any]) -> str:
+    """Vaga de uma reserva em cache (chave 'spot_date'; o nome da vaga pode conter '_')."""
+    return info.get("spot") or cache_key.rsplit("_", 1)[0]
+
+
 def get_reservation_info(name: str) -> Optional[Dict[str, Any]]:
     """
     Busca informação de reserva para uma vaga.
@@ -618,7 +654,7 @@ def get_reservation_info(name: str) -> Optional[Dict[str, Any]]:
         
         # Fallback: procurar por spot name em todas as reservas de hoje
         for key, res_info in g_active_reservations.items():
-            res_spot = res_info.get("spot") or key.split("_")[0]
+            res_spot = reservation_spot(key, res_info)
             res_date = res_info.get("reservation_date", "")
             if res_spot == name and res_date == today_str:
                 return dict(res_info)
@@ -879,53 +915,19 @@ async def notify_reservation_violation(
         print(f"[ERROR] Failed to create violation notification: {e}")
 
 
-def extract_spot_crop(frame: np.ndarray, pts: np.ndarray, expand_ratio: float = 1.5) -> Optional[np.ndarray]:
-    """
-    Extrai o crop de uma vaga do frame.
-    expand_ratio: fator de expansão da área (1.5 = 50% maior) para dar mais contexto ao ALPR.
-    """
-    x, y, w, h = cv2.boundingRect(pts)
-    if w <= 0 or h <= 0:
-        return None
-    
-    # Calcular centro e nova dimensão expandida
-    cx, cy = x + w // 2, y + h // 2
-    new_w = int(w * expand_ratio)
-    new_h = int(h * expand_ratio)
-    
-    # Calcular novos limites com clipping para não sair do frame
-    x1 = max(0, cx - new_w // 2)
-    y1 = max(0, cy - new_h // 2)
-    x2 = min(frame.shape[1], x1 + new_w)
-    y2 = min(frame.shape[0], y1 + new_h)
-    
-    crop = frame[y1:y2, x1:x2]
-    if crop.size == 0:
-        return None
-    return crop.copy()
-
-
-def _run_alpr_job(name: str, crop: np.ndarray):
-    alpr = get_alpr_instance()
-    if alpr is None:
-        return name, None
-    try:
-        results = alpr.predict(crop)
-    except Exception as exc:
-        print(f"[WARN] ALPR falhou para {name}: {exc}")
-        return name, None
-
+def _alpr_event(name: str, results) -> Optional[Dict[str, Any]]:
+    """Evento de matrícula de uma vaga a partir dos resultados do ALPR (None se nada lido)."""
     if not results:
-        return name, None
+        return None
 
     first = results[0] if isinstance(results, (list, tuple)) else results
     plate = getattr(first.ocr, "text", None) if getattr(first, "ocr", None) else None
     ocr_conf = (
-        _normalize_confidence(getattr(first.ocr, "confidence", None))
+        normalize_confidence(getattr(first.ocr, "confidence", None))
         if getattr(first, "ocr", None) else None
     )
     det_conf = (
-        _normalize_confidence(getattr(first.detection, "confidence", None))
+        normalize_confidence(getattr(first.detection, "confidence", None))
         if getattr(first, "detection", None) else None
     )
     
@@ -939,7 +941,7 @@ def _run_alpr_job(name: str, crop: np.ndarray):
         "det_conf": det_conf,
         "timestamp": time.time(),
     }
-    return name, event
+    return event
 
 async def update_session_spot(plate: str, spot: str):
     """
@@ -1021,19 +1023,31 @@ async def update_session_spot(plate: str, spot: str):
         except Exception as e:
             print(f"[ERROR] update_session_spot falhou: {e}")
 
-def _handle_alpr_future(future: Future):
+def _handle_alpr_future(future: Future, crop_hash: Optional[int] = None):
+    """Resultado de uma vaga de um batch do AlprBatcher: (vaga, resultados do fast-alpr)."""
+    name = None
     try:
-        name, event = future.result()
+        name, results = future.result()
+        event = _alpr_event(name, results)
     except Exception as exc:  # pragma: no cover
         print(f"[WARN] ALPR future erro: {exc}")
         return
     finally:
-        with g_alpr_pending_lock:
-            g_alpr_pending.discard(name)
+        if name is not None:
+            with g_alpr_pending_lock:
+                g_alpr_pending.discard(name)
 
+    if plate_tracker is not None:
+        plate_tracker.on_read(name, event)
     if not event or not event.get("plate"):
         return
+    if alpr_cache is not None and crop_hash is not None:
+        alpr_cache.store(name, crop_hash, event)
+    _apply_alpr_event(name, event)
+
 
+def _apply_alpr_event(name: str, event: Dict[str, Any]):
+    """Aplica uma leitura de matrícula à vaga: sessões, reservas/violações, memória e broadcast."""
     meta = g_spot_meta.get(name, {})
     base_reserved = bool(meta.get("reserved", False))
     authorized = meta.get("authorized", []) or []
@@ -1095,12 +1109,15 @@ def _handle_alpr_future(future: Future):
             event_loop
         )
 
+    track = plate_tracker.snapshot(name) if plate_tracker is not None else None
     with g_plate_lock:
         g_plate_memory[event["spot"]] = {
             "plate": event["plate"],
             "ocr_conf": event.get("ocr_conf"),
             "det_conf": event.get("det_conf"),
             "timestamp": event.get("timestamp"),
+            "verified_at": track["verified_at"] if track else None,
+            "track": track,
             "violation": violation,
             "reserved": reserved,
             "reservation": event.get("reservation"),
@@ -1130,18 +1147,40 @@ def _handle_alpr_future(future: Future):
         )
 
 
-def schedule_alpr(name: str, crop: Optional[np.ndarray]):
-    if not ENABLE_ALPR or crop is None or alpr_executor is None:
+def schedule_alpr(name: str, crop: Optional[np.ndarray], use_cache: bool = True):
+    """
+    Pede a leitura da matrícula de uma vaga. use_cache=False para releituras de leituras
+    fracas (a cache devolveria a mesma leitura).
+    """
+    if not ENABLE_ALPR or crop is None or alpr_engine.batcher is None:
         return
+    with g_alpr_pending_lock:
+        if name in g_alpr_pending:
+            return
+
+    crop_hash = perceptual_hash(crop) if alpr_cache is not None and crop.size else None
+    if crop_hash is not None and use_cache:
+        cached = alpr_cache.lookup(name, crop_hash)
+        if cached is not None:
+            # o mesmo carro voltou a ser visto na vaga: reutilizar a leitura sem correr o ALPR
+            cached.update(timestamp=time.time(), cached=True)
+            print(f"[INFO] ALPR cache: {name} -> {cached['plate']} (distância {cached['cache_distance']})")
+            if plate_tracker is not None:
+                plate_tracker.on_read(name, cached)
+            alpr_engine.executor.submit(_apply_alpr_event, name, cached)
+            return
+
     with g_alpr_pending_lock:
         if name in g_alpr_pending:
             return
         g_alpr_pending.add(name)
-    future = alpr_executor.submit(_run_alpr_job, name, crop)
-    future.add_done_callback(_handle_alpr_future)
+    future = alpr_engine.submit_crop(name, crop)
+    future.add_done_callback(lambda f: _handle_alpr_future(f, crop_hash))
 
 
 def clear_plate_for_spot(name: str):
+    if plate_tracker is not None:
+        plate_tracker.clear(name)
     with g_plate_lock:
         g_plate_memory.pop(name, None)
     with g_alpr_pending_lock:
@@ -1207,181 +1246,435 @@ def annotate_frame(frame: np.ndarray, scaled_spots, state: Dict[str, Any]) -> np
     return annotated
 
 
-def store_frame(frame: np.ndarray):
-    ok, buf = cv2.imencode(".jpg", frame)
+def annotate_stale_banner(frame: np.ndarray, text: str):
+    """Faixa no topo do frame a indicar que é o último frame válido de uma fonte em baixo."""
+    cv2.rectangle(frame, (0, 0), (frame.shape[1], 32), (0, 0, 160), -1)
+    cv2.putText(frame, text, (10, 22), cv2.FONT_HERSHEY_SIMPLEX, 0.6, (255, 255, 255), 2, cv2.LINE_AA)
+
+
+def store_frame(camera_id: str, frame: np.ndarray):
+    ok, buf = cv2.imencode(".jpg", frame, [cv2.IMWRITE_JPEG_QUALITY, STREAM_JPEG_QUALITY])
     if not ok:
         return
     data = buf.tobytes()
     with g_frame_lock:
-        global g_last_frame_jpeg
-        g_last_frame_jpeg = data
+        seq = g_stream_frames.get(camera_id, (0, None))[0] + 1
+        g_stream_frames[camera_id] = (seq, data)
 
 
-# ------------------------------------------------------------
-# LOOP PRINCIPAL EM THREAD SEPARADA
-# ------------------------------------------------------------
-def parking_monitor_loop():
-    global g_spot_status, g_spot_meta
+def _register_stream_viewer(camera_id: str, delta: int):
+    with g_frame_lock:
+        count = max(0, g_stream_viewers.get(camera_id, 0) + delta)
+        g_stream_viewers[camera_id] = count
+        if count == 0:
+            # sem viewers o frame deixa de ser atualizado: não servir um frame antigo ao próximo cliente
+            g_stream_frames.pop(camera_id, None)
+    monitor = g_camera_monitors.get(camera_id)
+    if monitor is not None:
+        monitor.viewers.value = count
+    print(f"[INFO] /video_feed [{camera_id}]: {count} viewer(s) ativo(s)")
+
+
+def scale_spots_for_display(scaled_spots, factor: float):
+    """Polígonos das vagas na resolução do stream (o frame é reduzido antes de anotar)."""
+    if factor == 1.0:
+        return scaled_spots
+    display = []
+    for spot in scaled_spots:
+        pts = np.round(spot["points"].astype(np.float32) * factor).astype(np.int32)
+        display.append({"name": spot["name"], "points": pts, "reserved": spot.get("reserved", False)})
+    return display
 
-    print("[INFO] Iniciando monitor de estacionamento...")
 
-    # carregar modelo
-    device = get_torch_device()
-    model = SpotClassifier().to(device)
-    model.load_state_dict(torch.load(MODEL_FILE, map_location=device))
-    model.eval()
-
-    # transform
-    transform = T.Compose([
-        T.Resize((IMG_SIZE, IMG_SIZE)),
-        T.ToTensor(),
-        T.Normalize([0.5]*3, [0.5]*3)
-    ])
-
-    # carregar vagas
-    spots, ref = load_spots(SPOTS_FILE)
-    update_spot_meta_cache(spots)
+# ------------------------------------------------------------
+# MONITORIZAÇÃO POR CÂMARA
+# ------------------------------------------------------------
+def get_cameras() -> List[CameraConfig]:
+    global g_cameras
+    if g_cameras is None:
+        g_cameras = load_camera_registry(CAMERAS_FILE, VIDEO_SOURCE, SPOTS_FILE)
+    return g_cameras
+
+
+def load_all_camera_spots() -> List[Dict[str, Any]]:
+    """Vagas de todas as câmaras; os nomes têm de ser únicos (são a chave de reservas e sessões)."""
+    spots: List[Dict[str, Any]] = []
+    owners: Dict[str, str] = {}
+    for camera in get_cameras():
+        camera_spots, _ = load_camera_spots(camera)
+        for spot in camera_spots:
+            other = owners.setdefault(spot["name"], camera.camera_id)
+            if other != camera.camera_id:
+                raise ValueError(
+                    f"Vaga '{spot['name']}' repetida nas câmaras {other} e {camera.camera_id} "
+                    f"(renomear ou usar \"qualify_names\": true)"
+                )
+        spots.extend(camera_spots)
+    return spots
 
-    # abrir vÃ­deo / stream
-    source_is_file = isinstance(VIDEO_SOURCE, str) and Path(VIDEO_SOURCE).is_file()
-    cap = get_video_capture(VIDEO_SOURCE)  # Usa o wrapper inteligente
-    if not cap.isOpened():
-        print(f"[ERRO] NÃ£o abriu vÃ­deo/stream: {VIDEO_SOURCE}")
-        return
 
-    fw = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))
-    fh = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
-    print(f"[INFO] VÃ­deo: {fw}x{fh}")
+def camera_worker_settings(device: torch.device) -> Dict[str, Any]:
+    """Configuração enviada a cada worker de câmara (tem de ser picklable)."""
+    return {
+        "capture_mode": ESP32_CAPTURE_MODE,
+        "file_playback": FILE_PLAYBACK,
+        "benchmark_frames": BENCHMARK_FRAMES,
+        "decode_reduction": DECODE_REDUCTION,
+        "alpr_sharpness_frames": ALPR_SHARPNESS_FRAMES if ENABLE_ALPR else 0,
+        "alpr_frame_buffer": ALPR_FRAME_BUFFER,
+        "plate_track_interval": PLATE_TRACK_INTERVAL if plate_tracker is not None else 0.0,
+        "decode_min_spot_size": DECODE_MIN_SPOT_SIZE,
+        "capture_backoff_initial": CAPTURE_BACKOFF_INITIAL,
+        "capture_backoff_max": CAPTURE_BACKOFF_MAX,
+        "capture_stale_seconds": CAPTURE_STALE_SECONDS,
+        "capture_max_read_failures": CAPTURE_MAX_READ_FAILURES,
+        "backend": SPOT_BACKEND,
+        "model_file": MODEL_FILE,
+        "device": str(device),
+        "intra_op_threads": SPOT_INTRA_OP_THREADS,
+        "inter_op_threads": SPOT_INTER_OP_THREADS,
+        "history_len": HISTORY_LEN,
+        "enter_threshold": SPOT_THRESHOLD,
+        "exit_threshold": SPOT_EXIT_THRESHOLD,
+        "min_dwell": SPOT_MIN_DWELL_SECONDS,
+        "incremental": INCREMENTAL_INFERENCE,
+        "change_gate_delta": CHANGE_GATE_DELTA,
+        "full_refresh_seconds": FULL_REFRESH_SECONDS,
+        "scheduler": INFERENCE_SCHEDULER,
+        "process_every_n": PROCESS_EVERY_N_FRAMES,
+        "min_interval": INFERENCE_MIN_INTERVAL,
+        "max_interval": INFERENCE_MAX_INTERVAL,
+        "cpu_budget": INFERENCE_CPU_BUDGET,
+        "activity_window": INFERENCE_ACTIVITY_WINDOW,
+        "stream_max_width": STREAM_MAX_WIDTH,
+        "stream_max_fps": STREAM_MAX_FPS,
+    }
 
-    scaled_spots = scale_spots(spots, ref, (fw, fh))
-    spot_lookup = {spot["name"]: spot for spot in scaled_spots}
 
-    history = defaultdict(lambda: deque(maxlen=HISTORY_LEN))
-    frame_i = 0
-    current_state: Dict[str, Any] = {}
-    last_occupancy: Dict[str, bool] = {spot["name"]: False for spot in scaled_spots}
+class CameraMonitor:
+    """
+    Lado do servidor de uma câmara. O worker (camera_worker.py) faz captura e inferência
+    numa thread ou num processo próprio; aqui recebem-se os resultados, aplica-se a lógica
+    de reservas/ALPR, junta-se o estado ao g_spot_status global e anota-se o stream.
+    """
 
-    while True:
-        ret, frame = cap.read()
-        if not ret:
-            if source_is_file:
-                print("[INFO] Reiniciando vÃ­deo para loop.")
-                cap.set(cv2.CAP_PROP_POS_FRAMES, 0)
-                frame_i = 0
+    def __init__(self, camera: CameraConfig, mode: str, settings: Dict[str, Any]):
+        self.camera = camera
+        self.camera_id = camera.camera_id
+        self.mode = "process" if mode == "process" else "thread"
+        self.settings = settings
+
+        if self.mode == "process":
+            ctx = multiprocessing.get_context("spawn")
+            self.results = ctx.Queue(maxsize=CAMERA_RESULTS_QUEUE_SIZE)
+            self.frames = ctx.Queue(maxsize=2)
+            self.crop_requests = ctx.Queue()
+            self.viewers = ctx.Value("i", 0)
+            self.stop_event = ctx.Event()
+        else:
+            self.results = queue.Queue(maxsize=CAMERA_RESULTS_QUEUE_SIZE)
+            self.frames = queue.Queue(maxsize=2)
+            self.crop_requests = queue.Queue()
+            self.viewers = multiprocessing.Value("i", 0)
+            self.stop_event = threading.Event()
+
+        self.running = False
+        self.worker = None
+        self.spots: List[Dict[str, Any]] = []
+        self.spot_lookup: Dict[str, Dict[str, Any]] = {}
+        self.frame_size: Optional[Tuple[int, int]] = None
+        self.last_occupancy: Dict[str, bool] = {}
+        self.rereads: Dict[str, str] = {}  # vaga -> motivo da releitura pedida ao worker
+        self.last_stats: Dict[str, Any] = {}
+        self.last_scheduler: Optional[Dict[str, Any]] = None
+        self.last_health: Optional[Dict[str, Any]] = None
+        self.last_benchmark: Optional[Dict[str, Any]] = None
+        self._display = {"factor": None, "spots": []}
+
+    # ---------------- arranque / paragem ----------------
+    def start(self):
+        args = (self.camera, self.settings, self.results, self.frames, self.viewers, self.stop_event)
+        if self.mode == "process":
+            ctx = multiprocessing.get_context("spawn")
+            self.worker = ctx.Process(
+                target=run_camera_worker,
+                args=args,
+                kwargs={"crop_requests": self.crop_requests},
+                name=f"camera-{self.camera_id}",
+                daemon=True,
+            )
+        else:
+            self.worker = threading.Thread(
+                target=run_camera_worker,
+                args=args,
+                kwargs={"include_frame": True, "crop_requests": self.crop_requests},
+                name=f"camera-{self.camera_id}",
+                daemon=True,
+            )
+        self.running = True
+        self.worker.start()
+        threading.Thread(target=self._results_loop, name=f"{self.camera_id}-results", daemon=True).start()
+        threading.Thread(target=self._frames_loop, name=f"{self.camera_id}-frames", daemon=True).start()
+        print(f"[INFO] Câmara '{self.camera_id}' iniciada ({self.mode}): {self.camera.source}")
+
+    def stop(self):
+        self.stop_event.set()
+
+    def stats_snapshot(self) -> Dict[str, Any]:
+        return self.last_stats
+
+    def scheduler_snapshot(self) -> Optional[Dict[str, Any]]:
+        return self.last_scheduler
+
+    def health_snapshot(self) -> Dict[str, Any]:
+        """Saúde da fonte reportada pelo worker (ver CaptureSupervisor.health())."""
+        if not self.running:
+            return {"state": "stopped", "online": False, "stale": True}
+        if self.last_health is None:
+            return {"state": "connecting", "online": False, "stale": True}
+        return self.last_health
+
+    def is_stale(self) -> bool:
+        return bool(self.health_snapshot().get("stale", True))
+
+    # ---------------- mensagens do worker ----------------
+    def _results_loop(self):
+        while True:
+            try:
+                message = self.results.get(timeout=1.0)
+            except queue.Empty:
+                if not self.running:
+                    break
                 continue
-            print("[INFO] Fim do vÃ­deo / stream terminou.")
-            break
+            kind = message.get("type")
+            try:
+                if kind == "ready":
+                    self._on_ready(message)
+                elif kind == "result":
+                    self.last_stats = message.get("stats") or {}
+                    self.last_scheduler = message.get("scheduler")
+                    self.publish(message)
+                elif kind == "alpr_crop":
+                    self._on_alpr_crop(message)
+                elif kind == "benchmark":
+                    self.last_benchmark = message.get("report")
+                elif kind == "health":
+                    self.last_health = message.get("health")
+                elif kind == "error":
+                    print(f"[ERRO] Câmara '{self.camera_id}': {message.get('error')}")
+                elif kind == "stopped":
+                    self.running = False
+                    break
+            except Exception:
+                print(f"[WARN] Câmara '{self.camera_id}': falha ao processar mensagem '{kind}':")
+                traceback.print_exc()
 
-        frame_i += 1
+    def _frames_loop(self):
+        while True:
+            try:
+                packet = self.frames.get(timeout=1.0)
+            except queue.Empty:
+                if not self.running:
+                    break
+                continue
+            try:
+                self.render(packet)
+            except Exception:
+                print(f"[WARN] Câmara '{self.camera_id}': falha no render:")
+                traceback.print_exc()
+
+    def _on_ready(self, message: Dict[str, Any]):
+        self.spots = message["spots"]
+        self.spot_lookup = {spot["name"]: spot for spot in self.spots}
+        self.frame_size = tuple(message["frame_size"])
+        self.last_occupancy = {spot["name"]: False for spot in self.spots}
+        update_spot_meta_cache(self.spots)
+
+    def _on_alpr_crop(self, message: Dict[str, Any]):
+        """Crop mais nítido escolhido pelo worker (entrada ou releitura); ignora se a vaga já saiu."""
+        name = message["spot"]
+        reason = self.rereads.pop(name, None)
+        if self.last_occupancy.get(name):
+            schedule_alpr(name, message["crop"], use_cache=reason != "low_confidence")
+
+    def _check_plate_track(self, name: str, signature):
+        """Aparência atual de uma vaga ocupada: mantém a matrícula ou pede um crop para reler."""
+        reason = plate_tracker.check(name, signature)
+        if reason is None:
+            track = plate_tracker.snapshot(name)
+            with g_plate_lock:
+                plate_info = g_plate_memory.get(name)
+                if plate_info is not None and track is not None:
+                    plate_info["track"] = track
+                    plate_info["verified_at"] = track["verified_at"]
+            return
+        print(f"[INFO] Vaga {name}: nova leitura da matrícula ({reason})")
+        self.rereads[name] = reason
+        self.crop_requests.put((name, False))
+
+    # ---------------- estado das vagas ----------------
+    def publish(self, result: Dict[str, Any]):
+        """Aplica reservas/debug/ALPR ao resultado do worker e publica o novo estado."""
+        global g_spot_status
+        frame = result.get("frame")
+        crops = result.get("crops") or {}
+        alpr_pending = set(result.get("alpr_pending") or ())
+        signatures = result.get("signatures") or {}
+        probs = result["probs"]
+        classified = result["classified"]
+        smoothed = result["occupied"]
+        spot_lookup = self.spot_lookup
+        last_occupancy = self.last_occupancy
 
-        # Reservas são atualizadas quando criadas/canceladas via API (não polling)
+        prune_expired_reservations()
+        with g_reservations_lock:
+            reservations_snapshot = {
+                spot: dict(info) for spot, info in g_active_reservations.items()
+            }
 
-        recompute = (frame_i == 1) or (frame_i % PROCESS_EVERY_N_FRAMES == 0)
+        state: Dict[str, Any] = {}
 
-        if recompute:
-            prune_expired_reservations()
-            with g_reservations_lock:
-                reservations_snapshot = {
-                    spot: dict(info) for spot, info in g_active_reservations.items()
+        for i, spot in enumerate(self.spots):
+            if not classified[i]:
+                continue
+            name = spot["name"]
+            pts = spot["points"]
+            p_occ = float(probs[i])
+            occ_final = bool(smoothed[i])
+
+            # Check for debug override
+            if name in g_debug_spot_overrides:
+                occ_final = g_debug_spot_overrides[name]
+
+            spot_meta = spot_lookup.get(name, {})
+
+            # Find reservation for this spot for today
+            # Cache keys are now "spot_date" format (e.g., "vaga01_2024-12-13")
+            from datetime import date
+            today_str = date.today().isoformat()
+            today_cache_key = f"{name}_{today_str}"
+            reservation_info = reservations_snapshot.get(today_cache_key)
+
+            # Fallback: search by spot name in case of old cache format
+            if not reservation_info:
+                for cache_key, res_info in reservations_snapshot.items():
+                    res_spot = reservation_spot(cache_key, res_info)
+                    res_date = res_info.get("reservation_date", "")
+                    if res_spot == name and res_date == today_str:
+                        reservation_info = res_info
+                        break
+
+            is_reserved = bool(spot_meta.get("reserved", False) or reservation_info)
+
+            state[name] = {
+                "occupied": occ_final,
+                "prob": p_occ,
+                "reserved": is_reserved,
+                "authorized": list(spot_meta.get("authorized", []) or []),
+                "violation": False,
+                "camera": self.camera_id,
+            }
+            if reservation_info:
+                state[name]["reservation"] = {
+                    "expires_at": reservation_info.get("expires_at"),
+                    "plate": reservation_info.get("plate_raw"),
                 }
+            else:
+                state[name]["reservation"] = None
+
+            prev_occ = last_occupancy.get(name, False)
+            if plate_tracker is not None and occ_final and prev_occ and name in signatures:
+                self._check_plate_track(name, signatures[name])
+
+            with g_plate_lock:
+                plate_info = g_plate_memory.get(name)
+            if plate_info:
+                state[name]["plate"] = plate_info.get("plate")
+                state[name]["plate_conf"] = plate_info.get("ocr_conf")
+                state[name]["plate_timestamp"] = plate_info.get("timestamp")
+                state[name]["plate_verified_at"] = plate_info.get("verified_at")
+                state[name]["plate_track"] = plate_info.get("track")
+                state[name]["violation"] = bool(plate_info.get("violation"))
+            else:
+                state[name]["plate"] = None
+                state[name]["plate_conf"] = None
+                state[name]["plate_timestamp"] = None
+                state[name]["plate_verified_at"] = None
+                state[name]["plate_track"] = None
+                state[name]["violation"] = False
+
+            if occ_final and not prev_occ and plate_tracker is not None:
+                plate_tracker.start(name)  # um estacionamento novo: o ALPR corre uma vez
+            if occ_final and not prev_occ and name in alpr_pending:
+                pass  # o worker envia o crop mais nítido dos próximos frames (alpr_crop)
+            elif occ_final and not prev_occ:
+                crop = crops.get(name)
+                if crop is None and frame is not None:
+                    crop = extract_spot_crop(frame, pts)
+                if crop is None and name in g_debug_spot_overrides:
+                    # Vaga forçada via debug em modo process (sem frame): o worker recorta-a
+                    print(f"[INFO] Vaga {name}: ocupação forçada (debug), crop para o ALPR pedido ao worker")
+                    self.crop_requests.put((name, True))
+                else:
+                    # Ativar ALPR para todas as vagas quando ficam ocupadas
+                    schedule_alpr(name, crop)
+            elif not occ_final:
+                clear_plate_for_spot(name)
+                self.rereads.pop(name, None)
+            last_occupancy[name] = occ_final
+
+        # atualizar estado global (vista única de todas as câmaras)
+        with g_lock:
+            g_camera_spot_status[self.camera_id] = state
+            merged: Dict[str, Any] = {}
+            for camera_state in g_camera_spot_status.values():
+                merged.update(camera_state)
+            g_spot_status = merged
+            current_state = merged
+
+        # broadcast via websocket
+        if event_loop is not None:
+            asyncio.run_coroutine_threadsafe(
+                ws_manager.broadcast(current_state),
+                event_loop
+            )
 
-            meta, batch = build_batch(frame, scaled_spots, transform)
-
-            state: Dict[str, Any] = {}
-
-            if batch is not None:
-                batch = batch.to(device)
-                with torch.no_grad():
-                    preds = model(batch)
-                    probs = torch.softmax(preds, dim=1).cpu().numpy()
-
-                for i, (name, pts) in enumerate(meta):
-                    p_occ = float(probs[i][1])
-                    occ_raw = (p_occ >= SPOT_THRESHOLD)
+    # ---------------- stream ----------------
+    def render(self, packet: Dict[str, Any]):
+        """Anota o frame (já reduzido pelo worker) com o último estado publicado e codifica."""
+        if self.frame_size is None:
+            return
+        frame = packet["frame"]
+        factor = frame.shape[1] / self.frame_size[0]
+        if self._display["factor"] != factor:
+            self._display = {"factor": factor, "spots": scale_spots_for_display(self.spots, factor)}
+        with g_lock:
+            state = g_camera_spot_status.get(self.camera_id, {})
+        annotated = annotate_frame(frame, self._display["spots"], state)
+        if packet.get("stale"):
+            age = time.time() - packet["timestamp"]
+            annotate_stale_banner(annotated, f"SEM SINAL - ultimo frame ha {age:.0f}s")
+        store_frame(self.camera_id, annotated)
 
-                    history[name].append(1 if occ_raw else 0)
-                    occ_final = (sum(history[name]) > len(history[name]) / 2)
-                    
-                    # Check for debug override
-                    if name in g_debug_spot_overrides:
-                        occ_final = g_debug_spot_overrides[name]
 
-                    spot_meta = spot_lookup.get(name, {})
-                    
-                    # Find reservation for this spot for today
-                    # Cache keys are now "spot_date" format (e.g., "vaga01_2024-12-13")
-                    from datetime import date
-                    today_str = date.today().isoformat()
-                    today_cache_key = f"{name}_{today_str}"
-                    reservation_info = reservations_snapshot.get(today_cache_key)
-                    
-                    # Fallback: search by spot name in case of old cache format
-                    if not reservation_info:
-                        for cache_key, res_info in reservations_snapshot.items():
-                            res_spot = res_info.get("spot") or cache_key.split("_")[0]
-                            res_date = res_info.get("reservation_date", "")
-                            if res_spot == name and res_date == today_str:
-                                reservation_info = res_info
-                                break
-                    
-                    is_reserved = bool(spot_meta.get("reserved", False) or reservation_info)
-
-                    state[name] = {
-                        "occupied": occ_final,
-                        "prob": p_occ,
-                        "reserved": is_reserved,
-                        "authorized": list(spot_meta.get("authorized", []) or []),
-                        "violation": False,
-                    }
-                    if reservation_info:
-                        state[name]["reservation"] = {
-                            "expires_at": reservation_info.get("expires_at"),
-                            "plate": reservation_info.get("plate_raw"),
-                        }
-                    else:
-                        state[name]["reservation"] = None
-
-                    with g_plate_lock:
-                        plate_info = g_plate_memory.get(name)
-                    if plate_info:
-                        state[name]["plate"] = plate_info.get("plate")
-                        state[name]["plate_conf"] = plate_info.get("ocr_conf")
-                        state[name]["plate_timestamp"] = plate_info.get("timestamp")
-                        state[name]["violation"] = bool(plate_info.get("violation"))
-                    else:
-                        state[name]["plate"] = None
-                        state[name]["plate_conf"] = None
-                        state[name]["plate_timestamp"] = None
-                        state[name]["violation"] = False
-
-                    prev_occ = last_occupancy.get(name, False)
-                    if occ_final and not prev_occ:
-                        crop_pts = spot_lookup.get(name, {}).get("points", pts)
-                        crop = extract_spot_crop(frame, crop_pts)
-                        # Ativar ALPR para todas as vagas quando ficam ocupadas
-                        schedule_alpr(name, crop)
-                    elif not occ_final:
-                        clear_plate_for_spot(name)
-                    last_occupancy[name] = occ_final
-
-            current_state = state
-
-            # atualizar estado global
-            with g_lock:
-                g_spot_status = current_state
-
-            # broadcast via websocket
-            if event_loop is not None:
-                asyncio.run_coroutine_threadsafe(
-                    ws_manager.broadcast(current_state),
-                    event_loop
-                )
+# ------------------------------------------------------------
+# ARRANQUE DA MONITORIZAÇÃO (uma thread/processo por câmara)
+# ------------------------------------------------------------
+def parking_monitor_loop():
+    print("[INFO] Iniciando monitor de estacionamento...")
 
-        annotated = annotate_frame(frame, scaled_spots, current_state)
-        store_frame(annotated)
+    try:
+        cameras = get_cameras()
+        update_spot_meta_cache(load_all_camera_spots())
+    except Exception as exc:
+        print(f"[ERRO] Falha ao carregar câmaras/vagas: {exc}")
+        return
 
-    cap.release()
-    print("[INFO] Monitor parado.")
+    settings = camera_worker_settings(get_torch_device())
+    for camera in cameras:
+        monitor = CameraMonitor(camera, CAMERA_PIPELINE_MODE, settings)
+        g_camera_monitors[camera.camera_id] = monitor
+        monitor.start()
 
 
 # ------------------------------------------------------------
@@ -1399,12 +1692,17 @@ def parking_status():
         result = {}
         for spot_name, spot_data in g_spot_status.items():
             result[spot_name] = dict(spot_data)
+
+    # Estado de câmaras sem frames recentes é o último conhecido: assinalar
+    stale_cameras = {camera_id for camera_id, monitor in g_camera_monitors.items() if monitor.is_stale()}
+    for spot_data in result.values():
+        spot_data["stale"] = spot_data.get("camera") in stale_cameras
     
     # Add reservation info for today's reservations
     with g_reservations_lock:
         for cache_key, reservation_info in g_active_reservations.items():
             reservation_date = reservation_info.get("reservation_date", "")
-            spot_name = reservation_info.get("spot") or cache_key.split("_")[0]
+            spot_name = reservation_spot(cache_key, reservation_info)
             
             # Only mark as reserved if reservation is for today
             if reservation_date == today:
@@ -1430,16 +1728,28 @@ def parking_status():
 
 
 @app.get("/video_feed")
-async def video_feed():
+async def video_feed(camera: Optional[str] = None):
+    cameras = get_cameras()
+    camera_id = camera or cameras[0].camera_id
+    if camera_id not in {c.camera_id for c in cameras}:
+        raise HTTPException(status_code=404, detail=f"Câmara desconhecida: {camera_id}")
+    poll_interval = min(0.05, 1.0 / STREAM_MAX_FPS) if STREAM_MAX_FPS > 0 else 0.05
+
     async def frame_generator():
-        while True:
-            with g_frame_lock:
-                frame = g_last_frame_jpeg
-            if frame is None:
-                await asyncio.sleep(0.05)
-                continue
-            yield b"--frame\r\nContent-Type: image/jpeg\r\n\r\n" + frame + b"\r\n"
-            await asyncio.sleep(0.05)
+        _register_stream_viewer(camera_id, +1)
+        last_seq = -1
+        try:
+            while True:
+                with g_frame_lock:
+                    seq, frame = g_stream_frames.get(camera_id, (0, None))
+                if frame is None or seq == last_seq:
+                    await asyncio.sleep(poll_interval)
+                    continue
+                last_seq = seq
+                yield b"--frame\r\nContent-Type: image/jpeg\r\n\r\n" + frame + b"\r\n"
+                await asyncio.sleep(poll_interval)
+        finally:
+            _register_stream_viewer(camera_id, -1)
 
     return StreamingResponse(
         frame_generator(),
@@ -1460,9 +1770,72 @@ async def get_config():
     return {
         "parking_rate_per_hour": PARKING_RATE_PER_HOUR,
         "currency": "EUR",
+        "inference_scheduler": {
+            camera_id: monitor.scheduler_snapshot() for camera_id, monitor in g_camera_monitors.items()
+        },
+    }
+
+
+@app.get("/api/cameras")
+async def list_cameras():
+    """Câmaras registadas e respetivas vagas (nomes qualificados)."""
+    result = []
+    for camera in get_cameras():
+        monitor = g_camera_monitors.get(camera.camera_id)
+        result.append({
+            "id": camera.camera_id,
+            "mode": monitor.mode if monitor else None,
+            "running": bool(monitor and monitor.running),
+            "health": monitor.health_snapshot() if monitor else None,
+            "spots": [spot["name"] for spot in monitor.spots] if monitor else [],
+            "video_feed": f"/video_feed?camera={camera.camera_id}",
+        })
+    return result
+
+
+@app.get("/api/monitor/stats")
+async def monitor_stats():
+    """Contadores de throughput por estágio do pipeline de cada câmara."""
+    return {
+        "running": any(monitor.running for monitor in g_camera_monitors.values()),
+        "cameras": {
+            camera_id: {
+                "mode": monitor.mode,
+                "running": monitor.running,
+                "capture": monitor.health_snapshot(),
+                "stages": monitor.stats_snapshot(),
+                "benchmark": monitor.last_benchmark,
+            }
+            for camera_id, monitor in g_camera_monitors.items()
+        },
     }
 
 
+@app.get("/healthz")
+async def healthz():
+    """Readiness: 200 só depois de os modelos ALPR estarem carregados e aquecidos (503 antes)."""
+    alpr = alpr_engine.readiness()
+    ready = alpr["state"] in ("ready", "lazy", "disabled")
+    return JSONResponse(
+        status_code=200 if ready else 503,
+        content={"status": "ok" if ready else alpr["state"], "alpr": alpr, "database": db_pool is not None},
+    )
+
+
+@app.get("/api/alpr/stats")
+async def alpr_stats():
+    """
+    Contadores do ALPR: estado do modelo, latência por origem (monitor, cancelas, ESP32 das
+    vagas), batches do AlprBatcher, fila das cancelas, cascata, cache por pHash, índice de
+    matrículas e seguimento por vaga (verificações mantidas vs releituras).
+    """
+    stats = alpr_engine.stats()
+    stats["cache"] = alpr_cache.stats() if alpr_cache else None
+    stats["plate_index"] = g_plate_index.stats()
+    stats["plate_tracker"] = plate_tracker.stats() if plate_tracker else None
+    return stats
+
+
 # Debug endpoint to manually override spot status for testing
 g_debug_spot_overrides: Dict[str, bool] = {}  # spot_name -> occupied (True/False)
 
@@ -2044,7 +2417,7 @@ async def mobile_cancel_reservation(spot_name: str, authorization: Optional[str]
     with g_reservations_lock:
         # Look for any reservation that matches this spot
         for cache_key, res_info in g_active_reservations.items():
-            res_spot = res_info.get("spot") or cache_key.split("_")[0]
+            res_spot = reservation_spot(cache_key, res_info)
             if res_spot == resolved_spot:
                 # Check ownership by user_id OR plate_norm
                 owns_reservation = (
@@ -2236,6 +2609,7 @@ async def mobile_add_vehicle(payload: VehiclePayload, authorization: Optional[st
             """,
             user_id, plate, plate_norm
         )
+    register_user_plate(user.get("name"), plate, plate_norm)
     
     return {"plate": plate, "message": "Veiculo adicionado com sucesso."}
 
@@ -2299,6 +2673,7 @@ async def mobile_delete_vehicle(plate: str, authorization: Optional[str] = Heade
         
         if result == "DELETE 0":
             raise HTTPException(status_code=404, detail="Veiculo nao encontrado.")
+    unregister_user_plate(plate_norm)
     
     return {"plate": plate, "message": "Veiculo removido com sucesso."}
 
@@ -2413,37 +2788,55 @@ async def mobile_delete_card(card_id: int, authorization: Optional[str] = Header
     return {"card_id": card_id, "message": "Cartao removido com sucesso."}
 # Função auxiliar para processar imagem e detectar matrícula
 # ------------------------------------------------------------
-async def process_plate_image(image_bytes: bytes) -> Tuple[Optional[str], Optional[bytes]]:
+async def process_plate_image(image_bytes: bytes) -> Tuple[Optional[str], Optional[bytes], List[Dict[str, Any]]]:
     """
     Processa uma imagem e extrai a matrícula usando fast-alpr.
-    Retorna uma tupla: (matrícula detectada, imagem anotada em bytes)
-    ou (None, None) se não detectar nada.
+    Retorna uma tupla: (matrícula detectada, imagem anotada em bytes, deteções)
+    ou (None, None, []) se não detectar nada. Com GATE_ANNOTATE=lazy não há imagem anotada
+    (None): as deteções (caixas e confianças) ficam na sessão e a imagem é desenhada a pedido.
+    Corre no executor limitado do alpr_engine (fora do event loop).
     """
+    return await run_alpr_request(_process_plate_image_sync, image_bytes)
+
+
+async def run_alpr_request(fn, *args):
+    """Corre fn no executor limitado do alpr_engine; com a fila cheia responde 503 + Retry-After."""
+    try:
+        future = alpr_engine.submit(fn, *args)
+    except QueueFullError as exc:
+        print(f"[WARN] ALPR sobrecarregado: pedido recusado (Retry-After {exc.retry_after}s)")
+        raise HTTPException(
+            status_code=503,
+            detail="ALPR ocupado, tente novamente.",
+            headers={"Retry-After": str(exc.retry_after)},
+        )
+    return await asyncio.wrap_future(future)
+
+
+def _process_plate_image_sync(image_bytes: bytes) -> Tuple[Optional[str], Optional[bytes], List[Dict[str, Any]]]:
     try:
         # Converter bytes para numpy array
         nparr = np.frombuffer(image_bytes, np.uint8)
         img = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
         
         if img is None:
-            return None, None
-        
-        # Obter instância ALPR
-        alpr = get_alpr_instance()
-        if alpr is None:
-            return None, None
+            return None, None, []
         
-        # Executar detecção
-        results = alpr.predict(img)
+        # Executar detecção (None se o ALPR não estiver disponível)
+        results = alpr_engine.recognize(img, "gate")
         
         if not results:
-            return None, None
+            return None, None, []
         
         # Pegar o primeiro resultado
         first = results[0] if isinstance(results, (list, tuple)) else results
         plate_text = getattr(first.ocr, "text", None) if getattr(first, "ocr", None) else None
+        detections = plate_detections(results)
+        if GATE_ANNOTATE == "lazy":
+            return plate_text, None, detections
         
-        # Desenhar as predições na imagem
-        annotated_img = alpr.draw_predictions(img)
+        # Desenhar as deteções já calculadas na imagem (sem segunda inferência)
+        annotated_img = draw_plate_detections(img, detections)
         
         # Converter imagem anotada de volta para bytes (JPEG)
         success, buffer = cv2.imencode('.jpg', annotated_img)
@@ -2452,11 +2845,11 @@ async def process_plate_image(image_bytes: bytes) -> Tuple[Optional[str], Option
         else:
             annotated_bytes = None
         
-        return plate_text, annotated_bytes
+        return plate_text, annotated_bytes, detections
         
     except Exception as e:
         print(f"[ERRO] Falha ao processar imagem ALPR: {e}")
-        return None, None
+        return None, None, []
 
 
 @app.post("/api/entry")
@@ -2472,7 +2865,7 @@ async def api_entry(camera_id: str = Form(...), image: UploadFile = File(...)):
     image_bytes = await image.read()
     
     # Processar com ALPR e obter imagem anotada
-    plate, annotated_image_bytes = await process_plate_image(image_bytes)
+    plate, annotated_image_bytes, detections = await process_plate_image(image_bytes)
     
     if not plate:
         raise HTTPException(status_code=400, detail="Nenhuma matricula detectada na imagem.")
@@ -2481,16 +2874,21 @@ async def api_entry(camera_id: str = Form(...), image: UploadFile = File(...)):
     upload_bytes = annotated_image_bytes if annotated_image_bytes else image_bytes
     
     if db_pool:
+        plate_norm = normalize_plate_text(plate)
+        # Leitura com um carácter trocado pelo OCR (O/0, B/8...): usar a matrícula registada
+        plate_norm = match_registered_plate(plate_norm) or plate_norm
+
         async with db_pool.acquire() as conn:
             # Verificar se já existe uma sessão aberta para esta matrícula
             existing_session = await conn.fetchrow(
                 """
                 SELECT id, entry_time, camera_id
                 FROM public.parking_sessions
-                WHERE plate = $1 AND status = 'open'
+                WHERE (plate_norm = $1 OR plate = $2) AND status = 'open'
                 ORDER BY entry_time DESC
                 LIMIT 1
                 """,
+                plate_norm,
                 plate,
             )
             
@@ -2516,9 +2914,6 @@ async def api_entry(camera_id: str = Form(...), image: UploadFile = File(...)):
                     print(f"[WARN] Falha ao fazer upload da imagem: {e}")
                     # Não bloqueia o fluxo caso falhe o upload
             
-            # Criar nova entrada com a URL da imagem
-            plate_norm = normalize_plate_text(plate)
-            
             # Procurar user_id pelo veículo registado
             user_id = None
             vehicle_row = await conn.fetchrow(
@@ -2533,10 +2928,13 @@ async def api_entry(camera_id: str = Form(...), image: UploadFile = File(...)):
                 user_id = vehicle_row["user_id"]
                 print(f"[INFO] Veículo {plate} associado ao user_id: {user_id}")
             
+            # GATE_ANNOTATE=lazy: as deteções vão no mesmo INSERT (ver migrations/add_detections_columns.sql)
+            lazy = GATE_ANNOTATE == "lazy"
             row = await conn.fetchrow(
-                """
-                INSERT INTO public.parking_sessions (user_id, plate, plate_norm, camera_id, status, entry_image_url)
-                VALUES ($1, $2, $3, $4, 'open', $5)
+                f"""
+                INSERT INTO public.parking_sessions (user_id, plate, plate_norm, camera_id, status, entry_image_url
+                    {", entry_detections" if lazy else ""})
+                VALUES ($1, $2, $3, $4, 'open', $5{", $6::jsonb" if lazy else ""})
                 RETURNING id, entry_time
                 """,
                 user_id,
@@ -2544,6 +2942,7 @@ async def api_entry(camera_id: str = Form(...), image: UploadFile = File(...)):
                 plate_norm,
                 camera_id,
                 image_url,
+                *([json.dumps(detections)] if lazy else []),
             )
         return JSONResponse({
             "session_id": row["id"],
@@ -2570,13 +2969,15 @@ async def api_exit(camera_id: str = Form(...), image: UploadFile = File(...)):
     image_bytes = await image.read()
     
     # Processar com ALPR e obter imagem anotada
-    plate, annotated_image_bytes = await process_plate_image(image_bytes)
+    plate, annotated_image_bytes, detections = await process_plate_image(image_bytes)
     
     if not plate:
         raise HTTPException(status_code=400, detail="Nenhuma matricula detectada na imagem.")
     
-    # Normalizar matrícula para comparação
-    plate_norm = normalize_plate_text(plate)
+    # Normalizar matrícula para comparação; leitura com um carácter trocado pelo OCR
+    # (O/0, B/8...): usar a matrícula registada para encontrar a sessão
+    read_plate_norm = normalize_plate_text(plate)
+    plate_norm = match_registered_plate(read_plate_norm) or read_plate_norm
     
     # Usar imagem anotada para upload, ou original se anotação falhou
     upload_bytes = annotated_image_bytes if annotated_image_bytes else image_bytes
@@ -2667,10 +3068,11 @@ async def api_exit(camera_id: str = Form(...), image: UploadFile = File(...)):
             print(f"[EXIT] ✅ Já pago (€{amount_paid:.2f}) - permitir saída")
         else:
             # NÃO ESTÁ PAGO - TENTAR PAGAMENTO AUTOMÁTICO
-            # Buscar user_id pelo veículo
+            # Buscar user_id pelo veículo: o cartão só é cobrado com a matrícula lida
+            # exatamente (nunca por correspondência aproximada)
             plate_user = await conn.fetchrow(
                 "SELECT user_id FROM public.parking_user_vehicles WHERE plate_norm = $1 LIMIT 1",
-                plate_norm
+                read_plate_norm
             )
             user_id = plate_user["user_id"] if plate_user else None
             
@@ -2745,15 +3147,17 @@ async def api_exit(camera_id: str = Form(...), image: UploadFile = File(...)):
                 print(f"[WARN] Falha ao fazer upload da imagem de saída: {e}")
         
         # ✅ ATUALIZAR SESSÃO - Fechar com status 'closed'
+        lazy = GATE_ANNOTATE == "lazy"
         await conn.execute(
-            """
+            f"""
             UPDATE public.parking_sessions
-            SET exit_time = $1, status = 'closed', exit_image_url = $2
+            SET exit_time = $1, status = 'closed', exit_image_url = $2{", exit_detections = $4::jsonb" if lazy else ""}
             WHERE id = $3
             """,
             exit_time,
             exit_image_url,
             session_id,
+            *([json.dumps(detections)] if lazy else []),
         )
         
         print(f"[EXIT] ✅ Saída autorizada: {plate} (vaga {session['spot']})")
@@ -2845,6 +3249,8 @@ async def parking_spot_occupied(
             }
         )
         
+    except HTTPException:
+        raise
     except Exception as e:
         print(f"[ERROR] /api/parking-spot-occupied: {e}")
         traceback.print_exc()
@@ -2856,7 +3262,15 @@ async def parking_spot_occupied(
 async def run_alpr_on_image(image_bytes: bytes) -> Optional[str]:
     """
     Executa ALPR numa imagem e retorna a matrícula detetada.
+    Usa o mesmo serviço ALPR das cancelas (fila limitada: 503 + Retry-After se estiver cheia).
     """
+    plate_text = await run_alpr_request(_recognize_spot_plate_sync, image_bytes)
+    if plate_text and len(plate_text) >= 6:
+        return plate_text.upper().replace(" ", "")
+    return None
+
+
+def _recognize_spot_plate_sync(image_bytes: bytes) -> Optional[str]:
     try:
         # Converter bytes para imagem OpenCV
         nparr = np.frombuffer(image_bytes, np.uint8)
@@ -2866,15 +3280,11 @@ async def run_alpr_on_image(image_bytes: bytes) -> Optional[str]:
             print("[ERROR] Falha ao descodificar imagem")
             return None
         
-        # Executar ALPR (usar a mesma lógica do alpr.py)
-        from alpr import recognize_plate_easyocr
-        
-        plate_text = recognize_plate_easyocr(img)
-        
-        if plate_text and len(plate_text) >= 6:
-            return plate_text.upper().replace(" ", "")
-        
-        return None
+        results = alpr_engine.recognize(img, "spot_sensor")
+        if not results:
+            return None
+        first = results[0] if isinstance(results, (list, tuple)) else results
+        return getattr(first.ocr, "text", None) if getattr(first, "ocr", None) else None
         
     except Exception as e:
         print(f"[ERROR] run_alpr_on_image: {e}")
@@ -3011,10 +3421,12 @@ async def get_session(session_id: int):
         raise HTTPException(status_code=503, detail="Base de dados indisponivel.")
     
     async with db_pool.acquire() as conn:
+        lazy = GATE_ANNOTATE == "lazy"
         session = await conn.fetchrow(
-            """
+            f"""
             SELECT id, plate, camera_id, entry_time, exit_time, 
                    amount_due, amount_paid, status, entry_image_url, exit_image_url
+                   {", entry_detections, exit_detections" if lazy else ""}
             FROM public.parking_sessions
             WHERE id = $1
             """,
@@ -3040,7 +3452,7 @@ async def get_session(session_id: int):
         for p in payments
     ]
     
-    return JSONResponse({
+    response = {
         "id": session["id"],
         "plate": session["plate"],
         "camera_id": session["camera_id"],
@@ -3052,7 +3464,74 @@ async def get_session(session_id: int):
         "entry_image_url": session["entry_image_url"],
         "exit_image_url": session["exit_image_url"],
         "payments": payment_list
-    })
+    }
+    if lazy:
+        # imagens originais + caixas; a versão anotada é desenhada a pedido
+        for kind in ("entry", "exit"):
+            raw = session[f"{kind}_detections"]
+            response[f"{kind}_detections"] = json.loads(raw) if raw else None
+            response[f"{kind}_annotated_url"] = (
+                f"/api/sessions/{session_id}/annotated/{kind}" if session[f"{kind}_image_url"] else None
+            )
+    return JSONResponse(response)
+
+
+def _render_annotated_session_image(image_url: str, detections: List[Dict[str, Any]]) -> Optional[bytes]:
+    """Descarrega a imagem original da cancela e desenha as deteções guardadas (GATE_ANNOTATE=lazy)."""
+    with urllib.request.urlopen(image_url, timeout=10) as response:
+        data = response.read()
+    img = cv2.imdecode(np.frombuffer(data, np.uint8), cv2.IMREAD_COLOR)
+    if img is None:
+        return None
+    ok, buffer = cv2.imencode(".jpg", draw_plate_detections(img, detections))
+    return buffer.tobytes() if ok else None
+
+
+@app.get("/api/sessions/{session_id}/annotated/{kind}")
+async def get_session_annotated_image(session_id: int, kind: str):
+    """
+    Imagem de entrada/saída com as deteções desenhadas. Com GATE_ANNOTATE=lazy é desenhada só
+    aqui, a partir da imagem original e das caixas guardadas, e fica em cache (LRU).
+    """
+    if kind not in ("entry", "exit"):
+        raise HTTPException(status_code=404, detail="Imagem inexistente (entry ou exit).")
+    key = (session_id, kind)
+    with g_annotated_cache_lock:
+        cached = g_annotated_cache.get(key)
+        if cached is not None:
+            g_annotated_cache.move_to_end(key)
+    if cached is not None:
+        return Response(content=cached, media_type="image/jpeg")
+
+    if GATE_ANNOTATE != "lazy":
+        raise HTTPException(status_code=404, detail="Imagens anotadas a pedido requerem GATE_ANNOTATE=lazy.")
+    if not db_pool:
+        raise HTTPException(status_code=503, detail="Base de dados indisponivel.")
+    async with db_pool.acquire() as conn:
+        session = await conn.fetchrow(
+            f"SELECT {kind}_image_url AS image_url, {kind}_detections AS detections "
+            "FROM public.parking_sessions WHERE id = $1",
+            session_id,
+        )
+    if not session or not session["image_url"]:
+        raise HTTPException(status_code=404, detail="Sessao sem imagem.")
+
+    detections = json.loads(session["detections"]) if session["detections"] else []
+    loop = asyncio.get_running_loop()
+    try:
+        annotated = await loop.run_in_executor(None, _render_annotated_session_image, session["image_url"], detections)
+    except Exception as exc:
+        print(f"[WARN] Falha ao desenhar imagem da sessão {session_id} ({kind}): {exc}")
+        annotated = None
+    if annotated is None:
+        raise HTTPException(status_code=502, detail="Imagem original indisponivel.")
+
+    if GATE_ANNOTATED_CACHE:
+        with g_annotated_cache_lock:
+            g_annotated_cache[key] = annotated
+            while len(g_annotated_cache) > GATE_ANNOTATED_CACHE:
+                g_annotated_cache.popitem(last=False)
+    return Response(content=annotated, media_type="image/jpeg")
 
 
 @app.get("/api/admin/stats")
@@ -4103,6 +4582,10 @@ async def websocket_endpoint(websocket: WebSocket):
 async def startup_event():
     global event_loop, db_pool
     event_loop = asyncio.get_running_loop()
+
+    # Carregar o ALPR enquanto se liga à base de dados (o /healthz só fica pronto depois)
+    if ENABLE_ALPR and ALPR_WARMUP:
+        threading.Thread(target=alpr_engine.warm_up, name="alpr-warmup", daemon=True).start()
     
     # Criar pool de conexões à base de dados
     if DATABASE_URL:
@@ -4124,6 +4607,8 @@ async def startup_event():
             if set_refresh_reservations_callback:
                 set_refresh_reservations_callback(refresh_reservations_cache)
                 print("[INFO] Callback de reservas registado.")
+            if set_refresh_users_callback:
+                set_refresh_users_callback(refresh_users_cache)
             
             await refresh_users_cache()
             await refresh_reservations_cache()
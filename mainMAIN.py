@@ -4,7 +4,7 @@ import cv2
 import numpy as np
 from fastapi import FastAPI, UploadFile, File, HTTPException
 from fastapi.responses import JSONResponse
-from fast_alpr import ALPR
+from alpr_service import AlprService, normalize_confidence
 from supabaseStorage import SupabaseStorageService
 from dotenv import load_dotenv
 import asyncpg
@@ -13,20 +13,6 @@ load_dotenv()
 
 app = FastAPI()
 
-def _normalize_confidence(value: Any) -> float | None:
-    """Convert confidence values (scalar or iterable) into a float average."""
-    if value is None:
-        return None
-    if isinstance(value, (int, float)):
-        return float(value)
-    if isinstance(value, (list, tuple)):
-        valid = [float(v) for v in value if v is not None]
-        if not valid:
-            return None
-        return sum(valid) / len(valid)
-    return None
-
-
 def serialize_alpr_result(result: Any) -> dict[str, Any]:
     """Map ALPRResult dataclasses to JSON-serializable dicts."""
     detection = getattr(result, "detection", None)
@@ -35,7 +21,7 @@ def serialize_alpr_result(result: Any) -> dict[str, Any]:
     bbox = getattr(detection, "bounding_box", None) if detection else None
     detection_dict = (
         {
-            "confidence": _normalize_confidence(getattr(detection, "confidence", None)),
+            "confidence": normalize_confidence(getattr(detection, "confidence", None)),
             "bounding_box": {
                 "x1": getattr(bbox, "x1", None),
                 "y1": getattr(bbox, "y1", None),
@@ -53,7 +39,7 @@ def serialize_alpr_result(result: Any) -> dict[str, Any]:
     ocr_dict = (
         {
             "text": getattr(ocr, "text", None),
-            "confidence": _normalize_confidence(ocr_conf_raw),
+            "confidence": normalize_confidence(ocr_conf_raw),
         }
         if ocr
         else None
@@ -81,12 +67,17 @@ async def get_db():
     return await asyncpg.connect(POSTGRES_URL)
 
 # ---------------- FAST ALPR --------------------------------
-alpr = ALPR(
-    detector_model="yolo-v9-s-608-license-plate-end2end",
-    ocr_model="cct-s-v1-global-model",
-    detector_providers=["CPUExecutionProvider"],
-    ocr_device="cpu",
-    ocr_providers=["CPUExecutionProvider"],
+# Mesmo serviço ALPR do main.py: o modelo é carregado uma vez, no primeiro pedido
+alpr_engine = AlprService(
+    {
+        "detector_model": "yolo-v9-s-608-license-plate-end2end",
+        "ocr_model": "cct-s-v1-global-model",
+        "detector_providers": ["CPUExecutionProvider"],
+        "ocr_device": "cpu",
+        "ocr_providers": ["CPUExecutionProvider"],
+    },
+    workers=0,
+    warmup=False,
 )
 
 
@@ -108,7 +99,7 @@ async def recognize_license_plate(
     if image is None:
         raise HTTPException(status_code=400, detail="Failed to decode image")
 
-    alpr_results = alpr.predict(image)
+    alpr_results = alpr_engine.recognize(image, "upload")
 
     detected_plate = None
     ocr_conf = None
@@ -119,10 +110,10 @@ async def recognize_license_plate(
 
         if first.ocr is not None:
             detected_plate = first.ocr.text
-            ocr_conf = _normalize_confidence(first.ocr.confidence)
+            ocr_conf = normalize_confidence(first.ocr.confidence)
 
         if first.detection is not None:
-            det_conf = _normalize_confidence(first.detection.confidence)
+            det_conf = normalize_confidence(first.detection.confidence)
 
     plate_for_filename = detected_plate.replace(" ", "") if detected_plate else "unknown"
 
@@ -0,0 +1,3 @@
+ALTER TABLE public.parking_sessions 
+ADD COLUMN IF NOT EXISTS entry_detections JSONB NULL,
+ADD COLUMN IF NOT EXISTS exit_detections JSONB NULL;
@@ -0,0 +1,441 @@
+"""
+Pipeline em estágios para o monitor de estacionamento.
+Captura, inferência e render/encode correm cada um na sua thread, ligados por filas
+"latest-frame-wins": se o consumidor estiver ocupado, o frame antigo é descartado e
+substituído pelo mais recente, em vez de acumular atraso.
+
+    captura ──(quando o scheduler decide)──> inferência
+        └───────────────────────────────────> render/encode (usa o último estado publicado)
+"""
+import threading
+import time
+import traceback
+from collections import deque
+from typing import Any, Callable, Dict, Optional
+
+import cv2
+import numpy as np
+
+
+class LatestFrameQueue:
+    """
+    Fila limitada em que put() por omissão não bloqueia: descarta os itens mais antigos.
+    put(..., block=True) espera por espaço em vez de descartar (modo benchmark, sem perdas).
+    """
+
+    def __init__(self, maxsize: int = 1):
+        self._items: deque = deque()
+        self._maxsize = max(1, maxsize)
+        self._cond = threading.Condition()
+        self._closed = False
+
+    def put(self, item: Any, block: bool = False) -> int:
+        """
+        Adiciona item e devolve o número de itens antigos descartados.
+        block=True: espera por espaço em vez de descartar (modo benchmark, sem perdas).
+        """
+        with self._cond:
+            if block:
+                self._cond.wait_for(lambda: len(self._items) < self._maxsize or self._closed)
+            dropped = 0
+            while len(self._items) >= self._maxsize:
+                self._items.popleft()
+                dropped += 1
+            self._items.append(item)
+            self._cond.notify()
+        return dropped
+
+    def get(self, timeout: Optional[float] = None) -> Optional[Any]:
+        """Devolve o próximo item, ou None se expirou o timeout / a fila foi fechada."""
+        with self._cond:
+            if not self._items and not self._closed:
+                self._cond.wait(timeout)
+            if self._items:
+                item = self._items.popleft()
+                self._cond.notify_all()
+                return item
+            return None
+
+    def close(self):
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+
+    @property
+    def closed(self) -> bool:
+        return self._closed
+
+    def __len__(self) -> int:
+        with self._cond:
+            return len(self._items)
+
+
+class StageStats:
+    """Contadores de throughput de um estágio (thread-safe)."""
+
+    def __init__(self, name: str, window: int = 60):
+        self.name = name
+        self._lock = threading.Lock()
+        self._done_at: deque = deque(maxlen=window)
+        self._latencies: deque = deque(maxlen=1000)
+        self.started_at = time.time()
+        self.processed = 0
+        self.dropped = 0
+        self.errors = 0
+        self.busy_seconds = 0.0
+        self.last_ms = 0.0
+
+    def record(self, elapsed: float):
+        with self._lock:
+            self.processed += 1
+            self.busy_seconds += elapsed
+            self.last_ms = elapsed * 1000.0
+            self._latencies.append(self.last_ms)
+            self._done_at.append(time.time())
+
+    def record_drop(self, count: int = 1):
+        if count <= 0:
+            return
+        with self._lock:
+            self.dropped += count
+
+    def record_error(self):
+        with self._lock:
+            self.errors += 1
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            now = time.time()
+            fps = 0.0
+            if len(self._done_at) >= 2:
+                span = self._done_at[-1] - self._done_at[0]
+                if span > 0:
+                    fps = (len(self._done_at) - 1) / span
+            uptime = max(now - self.started_at, 1e-9)
+            return {
+                "processed": self.processed,
+                "dropped": self.dropped,
+                "errors": self.errors,
+                "fps": round(fps, 2),
+                "avg_ms": round(self.busy_seconds * 1000.0 / self.processed, 2) if self.processed else 0.0,
+                "last_ms": round(self.last_ms, 2),
+                "utilization": round(min(self.busy_seconds / uptime, 1.0), 3),
+            }
+
+    def latency_percentiles(self, percentiles=(50, 95, 99)) -> Dict[str, float]:
+        """Percentis da latência (ms) das últimas 1000 execuções."""
+        with self._lock:
+            samples = np.asarray(self._latencies, dtype=np.float64)
+        if samples.size == 0:
+            return {}
+        return {f"p{p}_ms": round(float(np.percentile(samples, p)), 2) for p in percentiles}
+
+
+class FixedFrameScheduler:
+    """Inferência em 1 de cada N frames (comportamento de PROCESS_EVERY_N_FRAMES)."""
+
+    mode = "fixed"
+
+    def __init__(self, every_n: int = 1, source_fps: float = 0.0):
+        self.every_n = max(1, every_n)
+        self.source_fps = source_fps
+
+    def due(self, frame_i: int, now: float) -> bool:
+        return frame_i == 1 or frame_i % self.every_n == 0
+
+    def on_dispatch(self, now: float):
+        pass
+
+    def record(self, latency: float, transitions: int, now: float):
+        pass
+
+    def snapshot(self) -> Dict[str, Any]:
+        rate = self.source_fps / self.every_n if self.source_fps > 0 else None
+        return {"mode": self.mode, "every_n_frames": self.every_n, "rate_hz": rate}
+
+
+class AdaptiveRateScheduler:
+    """
+    Ajusta o intervalo entre inferências em função de:
+    - latência medida por batch (EWMA) e orçamento de CPU: intervalo >= latência / cpu_budget
+    - atividade recente (transições livre/ocupado): com atividade usa o intervalo mínimo,
+      sem atividade relaxa gradualmente até max_interval.
+    """
+
+    mode = "adaptive"
+
+    def __init__(
+        self,
+        min_interval: float = 0.1,
+        max_interval: float = 2.0,
+        cpu_budget: float = 0.5,
+        activity_window: float = 30.0,
+        relax_factor: float = 1.25,
+    ):
+        self.min_interval = max(0.01, min_interval)
+        self.max_interval = max(self.min_interval, max_interval)
+        self.cpu_budget = min(max(cpu_budget, 0.01), 1.0)
+        self.activity_window = activity_window
+        self.relax_factor = max(1.0, relax_factor)
+
+        self._lock = threading.Lock()
+        self.interval = self.min_interval
+        self.latency_ewma: Optional[float] = None
+        self.last_reason = "arranque"
+        self._last_dispatch = 0.0
+        self._last_logged_interval = self.interval
+        self._transitions: deque = deque()
+
+    def due(self, frame_i: int, now: float) -> bool:
+        with self._lock:
+            return frame_i == 1 or now - self._last_dispatch >= self.interval
+
+    def on_dispatch(self, now: float):
+        with self._lock:
+            self._last_dispatch = now
+
+    def record(self, latency: float, transitions: int, now: float):
+        with self._lock:
+            if self.latency_ewma is None:
+                self.latency_ewma = latency
+            else:
+                self.latency_ewma = 0.8 * self.latency_ewma + 0.2 * latency
+            for _ in range(transitions):
+                self._transitions.append(now)
+            while self._transitions and now - self._transitions[0] > self.activity_window:
+                self._transitions.popleft()
+
+            budget_floor = self.latency_ewma / self.cpu_budget
+            floor = max(self.min_interval, budget_floor)
+            if self._transitions:
+                target = floor
+                reason = f"atividade ({len(self._transitions)} transições em {self.activity_window:.0f}s)"
+            else:
+                target = min(self.max_interval, self.interval * self.relax_factor)
+                reason = "sem atividade"
+            if target < floor:
+                target = floor
+            if floor > self.min_interval and target == floor:
+                reason += f", limitado pelo orçamento de CPU ({self.latency_ewma * 1000:.0f} ms/batch)"
+
+            self.interval = target
+            self.last_reason = reason
+            changed = abs(target - self._last_logged_interval) > 0.2 * self._last_logged_interval
+            if changed:
+                print(
+                    f"[SCHED] Intervalo de inferência {self._last_logged_interval:.2f}s -> {target:.2f}s "
+                    f"({1.0 / target if target > 0 else float('inf'):.1f} Hz): {reason}"
+                )
+                self._last_logged_interval = target
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "mode": self.mode,
+                "interval_s": round(self.interval, 3),
+                "rate_hz": round(1.0 / self.interval, 2) if self.interval > 0 else None,
+                "latency_ms": round(self.latency_ewma * 1000.0, 2) if self.latency_ewma is not None else None,
+                "cpu_budget": self.cpu_budget,
+                "recent_transitions": len(self._transitions),
+                "reason": self.last_reason,
+            }
+
+
+def create_scheduler(
+    mode: str,
+    every_n: int = 1,
+    source_fps: float = 0.0,
+    min_interval: float = 0.1,
+    max_interval: float = 2.0,
+    cpu_budget: float = 0.5,
+    activity_window: float = 30.0,
+):
+    """mode "fixed" -> FixedFrameScheduler; qualquer outro valor -> AdaptiveRateScheduler."""
+    if (mode or "").strip().lower() == "fixed":
+        return FixedFrameScheduler(every_n, source_fps)
+    return AdaptiveRateScheduler(
+        min_interval=min_interval,
+        max_interval=max_interval,
+        cpu_budget=cpu_budget,
+        activity_window=activity_window,
+    )
+
+
+class MonitorPipeline:
+    """
+    Orquestra os três estágios do monitor.
+    - process_fn(packet): inferência + atualização de estado (thread de inferência);
+      pode devolver o número de transições livre/ocupado para o scheduler
+    - render_fn(packet): anotação + encode JPEG (thread de render)
+    - scheduler: decide em que frames corre a inferência (default: todos)
+    - should_render(): se devolver False o frame não chega ao estágio de render (ex.: sem viewers)
+    - on_capture(packet): chamado na thread de captura para cada frame lido, antes do despacho
+      (ex.: buffer circular de frames); pode acrescentar campos ao packet
+    - pace_fps > 0: a captura lê ao ritmo do ficheiro (reprodução "tempo real")
+    - max_frames > 0: pára depois de N frames capturados, deixa os estágios esvaziar e
+      report() dá FPS ponta-a-ponta e tempos por estágio (benchmark)
+    - lossless: a captura espera pelos estágios em vez de descartar frames (benchmark reprodutível)
+    Cada packet é um dict {"frame", "frame_i", "timestamp"}.
+    """
+
+    def __init__(
+        self,
+        cap,
+        process_fn: Callable[[Dict[str, Any]], None],
+        render_fn: Callable[[Dict[str, Any]], None],
+        loop_file: bool = False,
+        scheduler=None,
+        should_render: Optional[Callable[[], bool]] = None,
+        on_capture: Optional[Callable[[Dict[str, Any]], None]] = None,
+        pace_fps: float = 0.0,
+        max_frames: int = 0,
+        lossless: bool = False,
+        name: str = "monitor",
+    ):
+        self.cap = cap
+        self.process_fn = process_fn
+        self.render_fn = render_fn
+        self.loop_file = loop_file
+        self.scheduler = scheduler or FixedFrameScheduler(1)
+        self.should_render = should_render
+        self.on_capture = on_capture
+        self.pace_fps = pace_fps
+        self.max_frames = max_frames
+        self.lossless = lossless
+        self.name = name
+        self.frames_captured = 0
+        self._started_at: Optional[float] = None
+        self._finished_at: Optional[float] = None
+
+        self.infer_queue = LatestFrameQueue()
+        self.render_queue = LatestFrameQueue()
+        self.stats = {
+            "capture": StageStats("capture"),
+            "inference": StageStats("inference"),
+            "render": StageStats("render"),
+        }
+        self._stop = threading.Event()
+
+    # ---------------- estágios ----------------
+    def _capture_stage(self):
+        stats = self.stats["capture"]
+        last_encoded = getattr(self.cap, "last_encoded", None)
+        frame_interval = 1.0 / self.pace_fps if self.pace_fps > 0 else 0.0
+        next_frame_at = time.perf_counter()
+        frame_i = 0
+        try:
+            while not self._stop.is_set():
+                if self.max_frames and self.frames_captured >= self.max_frames:
+                    print(f"[INFO] [{self.name}] {self.frames_captured} frames capturados (benchmark); a terminar.")
+                    break
+                if frame_interval:
+                    delay = next_frame_at - time.perf_counter()
+                    if delay > 0:
+                        self._stop.wait(delay)
+                    # atrasado mais de um frame (ex.: depois de um loop): não acelerar para recuperar
+                    next_frame_at = max(next_frame_at + frame_interval, time.perf_counter() - frame_interval)
+                t0 = time.perf_counter()
+                ret, frame = self.cap.read()
+                if not ret:
+                    if self.loop_file:
+                        print("[INFO] Reiniciando vídeo para loop.")
+                        self.cap.set(cv2.CAP_PROP_POS_FRAMES, 0)
+                        frame_i = 0
+                        continue
+                    print("[INFO] Fim do vídeo / stream terminou.")
+                    break
+
+                frame_i += 1
+                self.frames_captured += 1
+                stats.record(time.perf_counter() - t0)
+                packet = {"frame": frame, "frame_i": frame_i, "timestamp": time.time()}
+                if last_encoded is not None:
+                    packet["encoded"] = last_encoded()  # JPEG original (decode completo a pedido)
+                if self.on_capture is not None:
+                    self.on_capture(packet)
+
+                if self.scheduler.due(frame_i, packet["timestamp"]):
+                    self.scheduler.on_dispatch(packet["timestamp"])
+                    self.stats["inference"].record_drop(self.infer_queue.put(packet, block=self.lossless))
+                if self.should_render is None or self.should_render():
+                    self.stats["render"].record_drop(self.render_queue.put(packet, block=self.lossless))
+        except Exception:
+            stats.record_error()
+            traceback.print_exc()
+        finally:
+            self.stop()
+
+    def _worker_stage(self, stage: str, queue: LatestFrameQueue, fn: Callable[[Dict[str, Any]], None]):
+        stats = self.stats[stage]
+        while True:
+            packet = queue.get(timeout=0.5)
+            if packet is None:
+                if queue.closed:
+                    break
+                continue
+            t0 = time.perf_counter()
+            result = None
+            try:
+                result = fn(packet)
+            except Exception:
+                stats.record_error()
+                print(f"[WARN] Estágio '{stage}' falhou:")
+                traceback.print_exc()
+            elapsed = time.perf_counter() - t0
+            stats.record(elapsed)
+            if stage == "inference":
+                self.scheduler.record(elapsed, int(result or 0), time.time())
+
+    # ---------------- controlo ----------------
+    def run(self):
+        """Arranca os três estágios e bloqueia até a captura terminar."""
+        threads = [
+            threading.Thread(target=self._capture_stage, name=f"{self.name}-capture", daemon=True),
+            threading.Thread(
+                target=self._worker_stage,
+                args=("inference", self.infer_queue, self.process_fn),
+                name=f"{self.name}-inference",
+                daemon=True,
+            ),
+            threading.Thread(
+                target=self._worker_stage,
+                args=("render", self.render_queue, self.render_fn),
+                name=f"{self.name}-render",
+                daemon=True,
+            ),
+        ]
+        self._started_at = time.perf_counter()
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        self._finished_at = time.perf_counter()
+
+    def stop(self):
+        self._stop.set()
+        self.infer_queue.close()
+        self.render_queue.close()
+
+    def stats_snapshot(self) -> Dict[str, Any]:
+        return {stage: stats.snapshot() for stage, stats in self.stats.items()}
+
+    def scheduler_snapshot(self) -> Dict[str, Any]:
+        return self.scheduler.snapshot()
+
+    def report(self) -> Dict[str, Any]:
+        """Resumo de uma execução terminada: FPS ponta-a-ponta e tempos por estágio."""
+        end = self._finished_at or time.perf_counter()
+        seconds = max(end - (self._started_at or end), 1e-9)
+        stages = {}
+        for stage, stats in self.stats.items():
+            stages[stage] = {**stats.snapshot(), **stats.latency_percentiles()}
+            stages[stage]["throughput_fps"] = round(stats.processed / seconds, 2)
+        return {
+            "frames": self.frames_captured,
+            "seconds": round(seconds, 3),
+            "fps": round(self.frames_captured / seconds, 2),
+            "inferences": self.stats["inference"].processed,
+            "pace_fps": self.pace_fps,
+            "lossless": self.lossless,
+            "stages": stages,
+        }
@@ -0,0 +1,173 @@
+"""
+Índice de matrículas registadas com pesquisa aproximada, tolerante a erros de OCR.
+
+O OCR confunde caracteres parecidos (O/0, I/1, B/8, S/5, ...) e uma só troca fazia falhar o
+lookup exato por plate_norm (utilizador não reconhecido na entrada, saída recusada). A
+distância entre matrículas é a distância de edição ponderada:
+
+- substituição entre caracteres confundíveis: 0.5
+- outra substituição, inserção ou remoção: 1.0
+
+Só pares letra/dígito contam como confundíveis (0/O, 1/I, 8/B, 5/S, 2/Z, 6/G): trocas entre
+letras (O/D, I/L, U/V...) dão matrículas válidas diferentes e não podem ser "corrigidas",
+porque a correspondência decide a que utilizador fica associada a sessão.
+
+Pesquisa: índice invertido de variantes por remoção (estilo SymSpell) sobre a forma canónica
+da matrícula (cada grupo de confundíveis reduzido a um carácter). Duas matrículas a distância
+<= orçamento têm no máximo floor(orçamento) edições não confundíveis, logo partilham uma
+variante com até essa quantidade de remoções; só esses candidatos são verificados com a
+distância ponderada. add()/remove() atualizam o índice sem o reconstruir.
+"""
+import threading
+import time
+from itertools import combinations
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple
+
+CONFUSABLE_GROUPS = ("0O", "1I", "8B", "5S", "2Z", "6G")  # só letra <-> dígito
+CONFUSABLE_COST = 0.5
+MAX_INDEX_EDITS = 2  # orçamentos acima de 2.x não são suportados pelo índice
+
+_CANONICAL = {ch: group[0] for group in CONFUSABLE_GROUPS for ch in group}
+
+
+def canonical_plate(plate: str) -> str:
+    return "".join(_CANONICAL.get(ch, ch) for ch in plate)
+
+
+def substitution_cost(a: str, b: str) -> float:
+    if a == b:
+        return 0.0
+    return CONFUSABLE_COST if _CANONICAL.get(a, a) == _CANONICAL.get(b, b) else 1.0
+
+
+def plate_distance(a: str, b: str) -> float:
+    """Levenshtein com substituições entre confundíveis a CONFUSABLE_COST."""
+    if a == b:
+        return 0.0
+    if len(a) < len(b):
+        a, b = b, a
+    previous = [float(j) for j in range(len(b) + 1)]
+    for i, ca in enumerate(a, 1):
+        current = [float(i)]
+        for j, cb in enumerate(b, 1):
+            current.append(min(
+                previous[j] + 1.0,
+                current[j - 1] + 1.0,
+                previous[j - 1] + substitution_cost(ca, cb),
+            ))
+        previous = current
+    return previous[-1]
+
+
+def deletion_variants(text: str, edits: int) -> Set[str]:
+    """text e todas as variantes com até `edits` caracteres removidos."""
+    variants = {text}
+    for count in range(1, min(edits, len(text)) + 1):
+        for positions in combinations(range(len(text)), count):
+            variants.add("".join(ch for i, ch in enumerate(text) if i not in positions))
+    return variants
+
+
+class PlateIndex:
+    """
+    best_match(matrícula, orçamento) devolve a matrícula registada mais próxima dentro do
+    orçamento, ou None se não houver nenhuma ou se houver empate (ambíguo).
+    """
+
+    def __init__(self, max_edits: int = 1):
+        self.max_edits = max(0, min(MAX_INDEX_EDITS, max_edits))
+        self._lock = threading.Lock()
+        self._plates: Set[str] = set()
+        self._variants: Dict[str, Set[str]] = {}  # variante canónica -> matrículas
+        self.lookups = 0
+        self.matches = 0
+        self.ambiguous = 0
+        self._lookup_seconds = 0.0
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._plates)
+
+    def __contains__(self, plate: str) -> bool:
+        with self._lock:
+            return plate in self._plates
+
+    # ---------------- atualização ----------------
+    def add(self, plate: str):
+        if not plate:
+            return
+        keys = deletion_variants(canonical_plate(plate), self.max_edits)
+        with self._lock:
+            if plate in self._plates:
+                return
+            self._plates.add(plate)
+            for key in keys:
+                self._variants.setdefault(key, set()).add(plate)
+
+    def remove(self, plate: str):
+        keys = deletion_variants(canonical_plate(plate), self.max_edits)
+        with self._lock:
+            if plate not in self._plates:
+                return
+            self._plates.discard(plate)
+            for key in keys:
+                bucket = self._variants.get(key)
+                if bucket is not None:
+                    bucket.discard(plate)
+                    if not bucket:
+                        del self._variants[key]
+
+    def sync(self, plates: Iterable[str]) -> Tuple[int, int]:
+        """Acerta o índice com o conjunto atual de matrículas; devolve (adicionadas, removidas)."""
+        wanted = {plate for plate in plates if plate}
+        with self._lock:
+            current = set(self._plates)
+        added = wanted - current
+        removed = current - wanted
+        for plate in added:
+            self.add(plate)
+        for plate in removed:
+            self.remove(plate)
+        return len(added), len(removed)
+
+    # ---------------- pesquisa ----------------
+    def candidates(self, plate: str, max_distance: float) -> List[Tuple[float, str]]:
+        """Matrículas a distância <= max_distance, ordenadas pela distância."""
+        edits = min(int(max_distance), self.max_edits)
+        keys = deletion_variants(canonical_plate(plate), edits)
+        with self._lock:
+            pool: Set[str] = set()
+            for key in keys:
+                pool.update(self._variants.get(key, ()))
+        found = []
+        for candidate in pool:
+            distance = plate_distance(plate, candidate)
+            if distance <= max_distance:
+                found.append((distance, candidate))
+        found.sort()
+        return found
+
+    def best_match(self, plate: str, max_distance: float) -> Optional[Tuple[str, float]]:
+        """(matrícula registada, distância) mais próxima; None se nenhuma ou empatadas."""
+        start = time.perf_counter()
+        found = self.candidates(plate, max_distance) if plate else []
+        match = None
+        ambiguous = len(found) > 1 and found[0][0] == found[1][0]
+        if found and not ambiguous:
+            match = (found[0][1], found[0][0])
+        with self._lock:
+            self.lookups += 1
+            self.matches += match is not None
+            self.ambiguous += ambiguous
+            self._lookup_seconds += time.perf_counter() - start
+        return match
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "plates": len(self._plates),
+                "lookups": self.lookups,
+                "matches": self.matches,
+                "ambiguous": self.ambiguous,
+                "avg_lookup_us": round(1e6 * self._lookup_seconds / self.lookups, 1) if self.lookups else 0.0,
+            }
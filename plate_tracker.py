@@ -0,0 +1,208 @@
+"""
+Seguimento da matrícula por vaga ocupada: o ALPR corre uma vez por estacionamento.
+
+Depois de uma leitura confiante a vaga guarda a matrícula enquanto a aparência do crop se
+mantiver estável. A assinatura de aparência é barata (histograma H-S + miniatura 16x16 em
+tons de cinzento, sobre o crop reduzido a 32x32) e é calculada pelo worker da câmara a cada
+PLATE_TRACK_INTERVAL segundos para as vagas ocupadas. O ALPR só volta a correr quando:
+
+- a assinatura muda de forma significativa em `confirm` verificações seguidas ("changed");
+- a última leitura teve confiança baixa ou não leu nada ("low_confidence"), com backoff
+  exponencial e no máximo `max_retries` tentativas;
+- uma leitura pedida não chegou passados retry_seconds ("stalled": crop perdido, fila cheia).
+
+    monitor (vaga entrou) -> tracker.start(vaga)
+    resultado do ALPR     -> tracker.on_read(vaga, evento)
+    assinatura periódica  -> tracker.check(vaga, assinatura) -> None | motivo para reler
+    vaga livre            -> tracker.clear(vaga)
+
+A referência adapta-se devagar (média exponencial) enquanto a vaga é verificada, para a
+luz ao longo do dia não ser confundida com outro carro.
+"""
+import threading
+import time
+from typing import Any, Dict, Optional
+
+import cv2
+import numpy as np
+
+SIGNATURE_SIZE = 32
+HIST_BINS = (16, 4)  # matiz x saturação
+THUMB_SIZE = 16
+_HIST_LEN = HIST_BINS[0] * HIST_BINS[1]
+
+
+def appearance_signature(crop: np.ndarray) -> Optional[np.ndarray]:
+    """Vetor float32: histograma H-S normalizado (soma 1) + miniatura normalizada (média 0, desvio 1)."""
+    if crop is None or crop.size == 0:
+        return None
+    small = cv2.resize(crop, (SIGNATURE_SIZE, SIGNATURE_SIZE), interpolation=cv2.INTER_AREA)
+    hsv = cv2.cvtColor(small, cv2.COLOR_BGR2HSV)
+    hist = cv2.calcHist([hsv], [0, 1], None, list(HIST_BINS), [0, 180, 0, 256]).ravel()
+    hist /= max(float(hist.sum()), 1e-6)
+    gray = cv2.cvtColor(small, cv2.COLOR_BGR2GRAY)
+    thumb = cv2.resize(gray, (THUMB_SIZE, THUMB_SIZE), interpolation=cv2.INTER_AREA).astype(np.float32).ravel()
+    thumb -= thumb.mean()
+    thumb /= max(float(thumb.std()), 1e-6)
+    return np.concatenate([hist, thumb]).astype(np.float32)
+
+
+def signature_distance(a: np.ndarray, b: np.ndarray) -> float:
+    """0 = igual, 1 = completamente diferente: o pior entre a cor (Bhattacharyya) e a forma (1 - NCC)."""
+    color = float(cv2.compareHist(a[:_HIST_LEN], b[:_HIST_LEN], cv2.HISTCMP_BHATTACHARYYA))
+    ta, tb = a[_HIST_LEN:], b[_HIST_LEN:]
+    denom = float(np.linalg.norm(ta) * np.linalg.norm(tb))
+    layout = (1.0 - float(np.dot(ta, tb)) / denom) / 2.0 if denom > 0 else 1.0
+    return min(1.0, max(color, layout))
+
+
+class SpotTrack:
+    """Estado do seguimento de uma vaga (ver PlateTracker)."""
+
+    def __init__(self, now: float):
+        self.state = "reading"  # reading | verified | low_confidence
+        self.requested_at = now  # último pedido de leitura (estado reading)
+        self.plate: Optional[str] = None
+        self.ocr_conf: Optional[float] = None
+        self.reference: Optional[np.ndarray] = None
+        self.read_at: Optional[float] = None
+        self.verified_at: Optional[float] = None  # última confirmação de uma leitura confiante
+        self.reads = 0
+        self.retries = 0
+        self.changes = 0
+        self.suspect = 0  # verificações seguidas acima do limiar
+        self.last_distance: Optional[float] = None
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            "state": self.state,
+            "read_at": self.read_at,
+            "verified_at": self.verified_at,
+            "reads": self.reads,
+            "changes": self.changes,
+            "distance": round(self.last_distance, 3) if self.last_distance is not None else None,
+        }
+
+
+class PlateTracker:
+    """
+    Tracks por vaga, protegidos por um lock (check() corre na thread de resultados de cada
+    câmara, on_read() nos callbacks do ALPR).
+    """
+
+    def __init__(
+        self,
+        max_change: float = 0.35,
+        min_conf: float = 0.8,
+        retry_seconds: float = 30.0,
+        max_retries: int = 3,
+        confirm: int = 2,
+        adapt: float = 0.1,
+    ):
+        self.max_change = max_change
+        self.min_conf = min_conf
+        self.retry_seconds = retry_seconds
+        self.max_retries = max(0, max_retries)
+        self.confirm = max(1, confirm)
+        self.adapt = min(1.0, max(0.0, adapt))
+        self._lock = threading.Lock()
+        self._tracks: Dict[str, SpotTrack] = {}
+        self.checks = 0
+        self.held = 0  # verificações em que a matrícula foi mantida sem ALPR
+        self.rereads: Dict[str, int] = {"changed": 0, "low_confidence": 0, "stalled": 0}
+
+    def start(self, spot: str, now: Optional[float] = None):
+        """Vaga ficou ocupada e o ALPR foi pedido."""
+        with self._lock:
+            self._tracks[spot] = SpotTrack(time.time() if now is None else now)
+
+    def clear(self, spot: str):
+        with self._lock:
+            self._tracks.pop(spot, None)
+
+    def on_read(self, spot: str, event: Optional[Dict[str, Any]], now: Optional[float] = None):
+        """Resultado do ALPR (None/sem matrícula = nada lido). A referência vem da próxima assinatura."""
+        now = time.time() if now is None else now
+        with self._lock:
+            track = self._tracks.get(spot)
+            if track is None:
+                return  # a vaga ficou livre entretanto
+            plate = event.get("plate") if event else None
+            ocr_conf = event.get("ocr_conf") if event else None
+            confident = bool(plate) and ocr_conf is not None and ocr_conf >= self.min_conf
+            if confident:
+                track.retries = 0
+            track.state = "verified" if confident else "low_confidence"
+            track.plate = plate or track.plate
+            track.ocr_conf = ocr_conf
+            track.reference = None
+            track.suspect = 0
+            track.read_at = now
+            track.verified_at = now if confident else None  # só leituras confiantes contam como verificadas
+            track.reads += 1
+
+    def check(self, spot: str, signature: Optional[np.ndarray], now: Optional[float] = None) -> Optional[str]:
+        """Compara a assinatura atual com a referência; devolve o motivo para reler ou None."""
+        if signature is None:
+            return None
+        now = time.time() if now is None else now
+        with self._lock:
+            track = self._tracks.get(spot)
+            if track is None:
+                return None
+            if track.state == "reading":
+                if now - track.requested_at < self.retry_seconds:
+                    return None
+                return self._reread(track, "stalled", now)
+            self.checks += 1
+            if track.reference is None:
+                track.reference = signature.copy()
+                track.last_distance = 0.0
+                self.held += 1
+                return None
+
+            distance = signature_distance(track.reference, signature)
+            track.last_distance = distance
+            if distance > self.max_change:
+                track.suspect += 1
+                if track.suspect >= self.confirm:
+                    track.changes += 1
+                    track.retries = 0
+                    track.suspect = 0
+                    return self._reread(track, "changed", now)
+                return None
+
+            track.suspect = 0
+            track.reference = (1.0 - self.adapt) * track.reference + self.adapt * signature
+            if track.state == "low_confidence" and track.retries < self.max_retries:
+                if now - (track.read_at or 0.0) >= self.retry_seconds * (2 ** track.retries):
+                    track.retries += 1
+                    return self._reread(track, "low_confidence", now)
+            if track.state == "verified":
+                track.verified_at = now
+            self.held += 1
+            return None
+
+    def _reread(self, track: SpotTrack, reason: str, now: float) -> str:
+        track.state = "reading"
+        track.requested_at = now
+        self.rereads[reason] += 1
+        return reason
+
+    def snapshot(self, spot: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            track = self._tracks.get(spot)
+            return track.snapshot() if track is not None else None
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            states: Dict[str, int] = {}
+            for track in self._tracks.values():
+                states[track.state] = states.get(track.state, 0) + 1
+            return {
+                "tracks": len(self._tracks),
+                "states": states,
+                "checks": self.checks,
+                "held": self.held,
+                "rereads": dict(self.rereads),
+            }
@@ -0,0 +1,178 @@
+"""
+Quantização INT8 do SpotClassifier.
+- fc1/fc2: quantização dinâmica (pesos int8, ativações quantizadas em runtime)
+- conv1..conv3: quantização estática, calibrada com crops do dataset_esp32
+
+O modelo só é gravado se a accuracy em labels.csv não cair mais do que --max-drop
+em relação ao modelo float. O ficheiro gerado é TorchScript e pode ser usado
+diretamente pelo main.py via MODEL_FILE (SPOT_BACKEND=auto escolhe torchscript).
+
+Uso:
+    python quantize_spot_classifier.py
+    python quantize_spot_classifier.py --max-drop 0.005 --output spot_classifier_int8.pt
+"""
+import argparse
+import copy
+import csv
+import random
+import sys
+import time
+from pathlib import Path
+from typing import List, Tuple
+
+import cv2
+import numpy as np
+import torch
+import torch.nn as nn
+from torch.ao.quantization import QConfigMapping, get_default_qconfig, quantize_dynamic
+from torch.ao.quantization.quantize_fx import prepare_fx, convert_fx
+
+from spot_classifier import IMG_SIZE, crops_to_tensor
+from spot_inference import load_eager_model, configure_torch_threads
+
+SEED = 42
+
+
+# ------------------------------------------------------------
+# Dataset
+# ------------------------------------------------------------
+def load_samples(csv_path: Path) -> List[Tuple[Path, int]]:
+    """
+    Lê labels.csv (path,label). Os caminhos são relativos à raiz do projeto.
+    Se nenhuma imagem do CSV existir, usa as pastas free/ e occupied/ do dataset.
+    """
+    samples: List[Tuple[Path, int]] = []
+    missing = 0
+    if csv_path.exists():
+        with open(csv_path, newline="", encoding="utf-8") as f:
+            for row in csv.DictReader(f):
+                path = Path(row["path"])
+                if not path.exists():
+                    path = csv_path.parent.parent / row["path"]
+                if not path.exists():
+                    missing += 1
+                    continue
+                samples.append((path, int(row["label"])))
+    if missing:
+        print(f"[WARN] {missing} imagens de {csv_path} não encontradas (ignoradas)")
+
+    if not samples:
+        dataset_dir = csv_path.parent
+        print(f"[WARN] Sem amostras válidas em {csv_path}; a usar {dataset_dir}/free e {dataset_dir}/occupied")
+        for folder, label in (("free", 0), ("occupied", 1)):
+            for path in sorted((dataset_dir / folder).glob("*.png")):
+                samples.append((path, label))
+    return samples
+
+
+def load_crops(samples: List[Tuple[Path, int]]) -> Tuple[np.ndarray, np.ndarray]:
+    """Mesmo pré-processamento do main.py: resize INTER_AREA para IMG_SIZE x IMG_SIZE (BGR uint8)."""
+    crops = np.empty((len(samples), IMG_SIZE, IMG_SIZE, 3), dtype=np.uint8)
+    labels = np.empty(len(samples), dtype=np.int64)
+    kept = 0
+    for path, label in samples:
+        img = cv2.imread(str(path), cv2.IMREAD_COLOR)
+        if img is None:
+            print(f"[WARN] Imagem ilegível: {path}")
+            continue
+        crops[kept] = cv2.resize(img, (IMG_SIZE, IMG_SIZE), interpolation=cv2.INTER_AREA)
+        labels[kept] = label
+        kept += 1
+    return crops[:kept], labels[:kept]
+
+
+# ------------------------------------------------------------
+# Quantização
+# ------------------------------------------------------------
+def quantize_model(model: nn.Module, calib_crops: np.ndarray, engine: str, batch_size: int):
+    torch.backends.quantized.engine = engine
+    static_qconfig = get_default_qconfig(engine)
+
+    # 1) fc1/fc2 -> Linear dinâmico
+    quantized = quantize_dynamic(copy.deepcopy(model), {nn.Linear}, dtype=torch.qint8)
+
+    # 2) convs (+ReLU fundido e MaxPool) -> estático, calibrado com o dataset.
+    # O SpotClassifier usa F.relu, mas o FX funde conv + F.relu num ConvReLU2d com um nn.ReLU
+    # lá dentro e exige o mesmo qconfig para esse tipo (sem ele o prepare_fx dá LookupError).
+    qconfig_mapping = (
+        QConfigMapping()
+        .set_object_type(nn.Conv2d, static_qconfig)
+        .set_object_type(nn.ReLU, static_qconfig)  # ReLU dos ConvReLU2d fundidos
+        .set_object_type(nn.MaxPool2d, static_qconfig)
+    )
+    example = crops_to_tensor(calib_crops[:1])
+    prepared = prepare_fx(quantized, qconfig_mapping, example_inputs=(example,))
+    with torch.inference_mode():
+        for start in range(0, len(calib_crops), batch_size):
+            prepared(crops_to_tensor(calib_crops[start:start + batch_size]))
+    return convert_fx(prepared)
+
+
+def evaluate(model, crops: np.ndarray, labels: np.ndarray, batch_size: int, tag: str) -> Tuple[float, List[float]]:
+    correct = 0
+    latencies: List[float] = []
+    with torch.inference_mode():
+        model(crops_to_tensor(crops[:batch_size]))  # warm-up
+        for batch_i, start in enumerate(range(0, len(crops), batch_size)):
+            batch = crops_to_tensor(crops[start:start + batch_size])
+            t0 = time.perf_counter()
+            logits = model(batch)
+            elapsed_ms = (time.perf_counter() - t0) * 1000.0
+            latencies.append(elapsed_ms)
+            preds = logits.argmax(dim=1).numpy()
+            correct += int((preds == labels[start:start + batch_size]).sum())
+            print(f"  [{tag}] batch {batch_i:03d} ({len(batch)} crops): {elapsed_ms:.2f} ms")
+    return correct / max(len(crops), 1), latencies
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Gera um SpotClassifier INT8 com gate de accuracy.")
+    parser.add_argument("--weights", default="spot_classifier.pth")
+    parser.add_argument("--csv", default="dataset_esp32/labels.csv")
+    parser.add_argument("--output", default="spot_classifier_int8.pt")
+    parser.add_argument("--max-drop", type=float, default=0.01, help="Queda máxima de accuracy permitida (0.01 = 1 p.p.)")
+    parser.add_argument("--calib-samples", type=int, default=256)
+    parser.add_argument("--batch-size", type=int, default=32)
+    parser.add_argument("--engine", default="x86", choices=torch.backends.quantized.supported_engines)
+    parser.add_argument("--threads", type=int, default=1, help="Threads intra-op na medição de latência")
+    args = parser.parse_args()
+
+    configure_torch_threads(args.threads, 1)
+
+    samples = load_samples(Path(args.csv))
+    crops, labels = load_crops(samples)
+    if len(crops) == 0:
+        print("[ERRO] Nenhuma imagem disponível para calibração/avaliação.")
+        sys.exit(1)
+    print(f"[INFO] {len(crops)} amostras ({int(labels.sum())} ocupadas)")
+
+    rng = random.Random(SEED)
+    calib_idx = rng.sample(range(len(crops)), min(args.calib_samples, len(crops)))
+
+    float_model = load_eager_model(Path(args.weights), torch.device("cpu"))
+    int8_model = quantize_model(float_model, crops[calib_idx], args.engine, args.batch_size)
+
+    print("[INFO] Avaliação do modelo float:")
+    float_acc, float_lat = evaluate(float_model, crops, labels, args.batch_size, "float")
+    print("[INFO] Avaliação do modelo INT8:")
+    int8_acc, int8_lat = evaluate(int8_model, crops, labels, args.batch_size, "int8")
+
+    float_ms = float(np.mean(float_lat))
+    int8_ms = float(np.mean(int8_lat))
+    print(f"[INFO] float: acc={float_acc:.4f} | {float_ms:.2f} ms/batch")
+    print(f"[INFO] int8:  acc={int8_acc:.4f} | {int8_ms:.2f} ms/batch | speedup x{float_ms / max(int8_ms, 1e-9):.2f}")
+
+    drop = float_acc - int8_acc
+    if drop > args.max_drop:
+        print(f"[ERRO] Queda de accuracy {drop:.4f} > {args.max_drop:.4f}; modelo INT8 NÃO gravado.")
+        sys.exit(1)
+
+    example = crops_to_tensor(crops[:1])
+    with torch.no_grad():
+        scripted = torch.jit.trace(int8_model, example)
+    torch.jit.save(scripted, args.output)
+    print(f"[INFO] Modelo INT8 gravado em {args.output} (usar com MODEL_FILE={args.output})")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,4 +1,6 @@
 # spot_classifier.py
+import numpy as np
+import torch
 import torch.nn as nn
 import torch.nn.functional as F
 
@@ -18,7 +20,19 @@ class SpotClassifier(nn.Module):
         x = self.pool(F.relu(self.conv1(x)))
         x = self.pool(F.relu(self.conv2(x)))
         x = self.pool(F.relu(self.conv3(x)))
-        x = x.view(x.size(0), -1)
+        x = torch.flatten(x, 1)  # funciona também com tensores channels_last (quantizados)
         x = F.relu(self.fc1(x))
         x = self.fc2(x)
         return x
+
+
+def crops_to_tensor(crops: np.ndarray) -> torch.Tensor:
+    """
+    Converte crops BGR uint8 (N, IMG_SIZE, IMG_SIZE, 3) no tensor de input da CNN.
+    Equivalente a T.ToTensor() + T.Normalize([0.5]*3, [0.5]*3) sobre imagens RGB.
+    """
+    rgb = crops[..., ::-1].transpose(0, 3, 1, 2)
+    batch = np.ascontiguousarray(rgb, dtype=np.float32)
+    batch *= 2.0 / 255.0
+    batch -= 1.0
+    return torch.from_numpy(batch)
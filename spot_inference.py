@@ -0,0 +1,223 @@
+"""
+Backends de inferência do SpotClassifier (eager PyTorch, TorchScript congelado e ONNX Runtime).
+Todos recebem o batch (N, 3, IMG_SIZE, IMG_SIZE) de build_batch e devolvem p(ocupado) por vaga.
+O backend "roi" (spot_roi_model.py) é a exceção: recebe o frame inteiro via predict_frame().
+
+Exportar o modelo treinado:
+    python spot_inference.py --format torchscript
+    python spot_inference.py --format onnx --weights spot_classifier.pth --output spot_classifier.onnx
+"""
+import argparse
+import inspect
+from abc import ABC, abstractmethod
+from pathlib import Path
+from typing import Optional
+
+import numpy as np
+import torch
+
+from spot_classifier import SpotClassifier, IMG_SIZE
+
+BACKENDS = ("torch", "torchscript", "onnx", "roi")
+TORCHSCRIPT_SUFFIXES = {".pt", ".ts", ".jit"}
+ONNX_SUFFIXES = {".onnx"}
+
+
+def configure_torch_threads(intra_threads: int = 0, inter_threads: int = 0):
+    """Define o número de threads intra-op / inter-op do PyTorch (0 = default do PyTorch)."""
+    if intra_threads > 0:
+        torch.set_num_threads(intra_threads)
+    if inter_threads > 0 and torch.get_num_interop_threads() != inter_threads:
+        try:
+            torch.set_num_interop_threads(inter_threads)
+        except RuntimeError as exc:
+            # Só pode ser definido antes de qualquer trabalho paralelo
+            print(f"[WARN] Não foi possível definir inter-op threads: {exc}")
+    print(f"[INFO] Torch threads: intra={torch.get_num_threads()}, inter={torch.get_num_interop_threads()}")
+
+
+def load_eager_model(weights: Path, device: torch.device) -> SpotClassifier:
+    model = SpotClassifier().to(device)
+    model.load_state_dict(torch.load(weights, map_location=device))
+    model.eval()
+    return model
+
+
+def _softmax_occupied(logits: np.ndarray) -> np.ndarray:
+    logits = logits - logits.max(axis=1, keepdims=True)
+    exp = np.exp(logits)
+    return exp[:, 1] / exp.sum(axis=1)
+
+
+class SpotInferenceBackend(ABC):
+    """Interface comum: predict(batch) -> np.ndarray (N,) com a probabilidade de ocupado."""
+
+    name = "base"
+
+    @abstractmethod
+    def predict(self, batch: torch.Tensor) -> np.ndarray:
+        """Batch (N, 3, IMG_SIZE, IMG_SIZE) de build_batch -> p(ocupado) por vaga."""
+
+
+class TorchEagerBackend(SpotInferenceBackend):
+    name = "torch"
+
+    def __init__(self, model_file: Path, device: torch.device):
+        self.device = device
+        self.model = load_eager_model(model_file, device)
+
+    def predict(self, batch: torch.Tensor) -> np.ndarray:
+        with torch.inference_mode():
+            logits = self.model(batch.to(self.device))
+            return torch.softmax(logits, dim=1)[:, 1].cpu().numpy()
+
+
+class TorchScriptBackend(SpotInferenceBackend):
+    """
+    TorchScript congelado (torch.jit.freeze + optimize_for_inference).
+    Aceita um ficheiro exportado (.pt/.ts) ou os pesos .pth, que são convertidos no arranque.
+    """
+
+    name = "torchscript"
+
+    def __init__(self, model_file: Path, device: torch.device):
+        self.device = device
+        if model_file.suffix in TORCHSCRIPT_SUFFIXES:
+            module = torch.jit.load(str(model_file), map_location=device)
+        else:
+            module = trace_model(load_eager_model(model_file, device), device)
+        # Módulos já congelados não têm o atributo "training"
+        if hasattr(module, "training"):
+            module = torch.jit.freeze(module.eval())
+        self.model = torch.jit.optimize_for_inference(module)
+
+    def predict(self, batch: torch.Tensor) -> np.ndarray:
+        with torch.inference_mode():
+            logits = self.model(batch.to(self.device))
+            return torch.softmax(logits, dim=1)[:, 1].cpu().numpy()
+
+
+class OnnxRuntimeBackend(SpotInferenceBackend):
+    name = "onnx"
+
+    def __init__(self, model_file: Path, intra_threads: int = 0, inter_threads: int = 0):
+        import onnxruntime as ort
+
+        if model_file.suffix not in ONNX_SUFFIXES:
+            model_file = model_file.with_suffix(".onnx")
+        if not model_file.exists():
+            raise FileNotFoundError(
+                f"Modelo ONNX não encontrado: {model_file} (exportar com: python spot_inference.py --format onnx)"
+            )
+
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        options.execution_mode = ort.ExecutionMode.ORT_SEQUENTIAL
+        if intra_threads > 0:
+            options.intra_op_num_threads = intra_threads
+        if inter_threads > 0:
+            options.inter_op_num_threads = inter_threads
+
+        self.session = ort.InferenceSession(
+            str(model_file), sess_options=options, providers=["CPUExecutionProvider"]
+        )
+        self.input_name = self.session.get_inputs()[0].name
+
+    def predict(self, batch: torch.Tensor) -> np.ndarray:
+        inputs = batch.cpu().numpy()
+        logits = self.session.run(None, {self.input_name: inputs})[0]
+        return _softmax_occupied(logits)
+
+
+def resolve_backend_name(name: str, model_file: Path) -> str:
+    """'auto' escolhe o backend pela extensão do MODEL_FILE ("roi" tem de ser pedido explicitamente)."""
+    name = (name or "auto").strip().lower()
+    if name != "auto":
+        if name not in BACKENDS:
+            raise ValueError(f"Backend desconhecido: {name} (opções: auto, {', '.join(BACKENDS)})")
+        return name
+    if model_file.suffix in ONNX_SUFFIXES:
+        return "onnx"
+    if model_file.suffix in TORCHSCRIPT_SUFFIXES:
+        return "torchscript"
+    return "torch"
+
+
+def create_backend(
+    name: str,
+    model_file: Path,
+    device: torch.device,
+    intra_threads: int = 0,
+    inter_threads: int = 0,
+) -> SpotInferenceBackend:
+    backend_name = resolve_backend_name(name, model_file)
+    configure_torch_threads(intra_threads, inter_threads)
+
+    if backend_name == "onnx":
+        backend = OnnxRuntimeBackend(model_file, intra_threads, inter_threads)
+    elif backend_name == "roi":
+        from spot_roi_model import RoiOccupancyBackend
+
+        backend = RoiOccupancyBackend(model_file, device)
+    elif backend_name == "torchscript":
+        backend = TorchScriptBackend(model_file, device)
+    else:
+        backend = TorchEagerBackend(model_file, device)
+
+    print(f"[INFO] Backend de inferência: {backend.name} ({model_file})")
+    return backend
+
+
+# ------------------------------------------------------------
+# Exportação
+# ------------------------------------------------------------
+def trace_model(model: torch.nn.Module, device: Optional[torch.device] = None):
+    example = torch.zeros(1, 3, IMG_SIZE, IMG_SIZE, device=device)
+    with torch.no_grad():
+        return torch.jit.trace(model, example)
+
+
+def export_torchscript(weights: Path, output: Path):
+    model = load_eager_model(weights, torch.device("cpu"))
+    # Guardado sem freeze: o congelamento é feito no arranque pelo TorchScriptBackend
+    torch.jit.save(trace_model(model), str(output))
+
+
+def export_onnx(weights: Path, output: Path, opset: int = 17):
+    model = load_eager_model(weights, torch.device("cpu"))
+    example = torch.zeros(1, 3, IMG_SIZE, IMG_SIZE)
+    kwargs = {}
+    if "dynamo" in inspect.signature(torch.onnx.export).parameters:
+        kwargs["dynamo"] = False
+    torch.onnx.export(
+        model,
+        example,
+        str(output),
+        input_names=["input"],
+        output_names=["logits"],
+        dynamic_axes={"input": {0: "batch"}, "logits": {0: "batch"}},
+        opset_version=opset,
+        **kwargs,
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Exporta o SpotClassifier para TorchScript ou ONNX.")
+    parser.add_argument("--format", choices=["torchscript", "onnx"], required=True)
+    parser.add_argument("--weights", default="spot_classifier.pth")
+    parser.add_argument("--output", default=None, help="Default: pesos com extensão .pt / .onnx")
+    parser.add_argument("--opset", type=int, default=17)
+    args = parser.parse_args()
+
+    weights = Path(args.weights)
+    if args.format == "onnx":
+        output = Path(args.output) if args.output else weights.with_suffix(".onnx")
+        export_onnx(weights, output, args.opset)
+    else:
+        output = Path(args.output) if args.output else weights.with_suffix(".pt")
+        export_torchscript(weights, output)
+    print(f"[INFO] Modelo exportado: {output}")
+
+
+if __name__ == "__main__":
+    main()
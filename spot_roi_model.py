@@ -0,0 +1,266 @@
+"""
+Motor de ocupação com tronco partilhado: um único forward da CNN sobre o frame inteiro
+(reduzido para input_width) e ROIAlign por vaga sobre o feature map, seguido de uma head
+pequena. O custo é dominado pelo backbone e praticamente não cresce com o número de vagas.
+
+    frame -> backbone (stride 8) -> feature map -> ROIAlign(bbox de cada vaga) + máscara do polígono -> head -> p(ocupado)
+
+Usar no main.py:
+    SPOT_BACKEND=roi MODEL_FILE=spot_roi_model.pth
+
+Treinar: python train_roi_model.py
+Benchmark (custo vs número de vagas): python spot_roi_model.py --spots 11 100 500
+"""
+import argparse
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Sequence, Tuple
+
+import cv2
+import numpy as np
+import torch
+import torch.nn as nn
+import torch.nn.functional as F
+from torchvision.ops import roi_align
+
+from spot_classifier import crops_to_tensor
+
+FEATURE_STRIDE = 8
+DEFAULT_INPUT_WIDTH = 640
+DEFAULT_ROI_SIZE = 7
+
+
+def _conv_block(in_ch: int, out_ch: int, stride: int) -> nn.Sequential:
+    return nn.Sequential(
+        nn.Conv2d(in_ch, out_ch, 3, stride=stride, padding=1, bias=False),
+        nn.BatchNorm2d(out_ch),
+        nn.ReLU(inplace=True),
+    )
+
+
+class SharedTrunkOccupancyNet(nn.Module):
+    """
+    images: (B, 3, H, W) normalizado como crops_to_tensor
+    rois:   (K, 5) float [batch_idx, x0, y0, x1, y1] em pixels da imagem de input
+    masks:  (K, 1, roi_size, roi_size) máscara do polígono de cada vaga dentro da sua bbox
+    devolve logits (K, 2): 0=livre, 1=ocupado
+    """
+
+    def __init__(self, width: int = 32, roi_size: int = DEFAULT_ROI_SIZE):
+        super().__init__()
+        self.width = width
+        self.roi_size = roi_size
+        self.backbone = nn.Sequential(
+            _conv_block(3, width // 2, 2),
+            _conv_block(width // 2, width, 2),
+            _conv_block(width, width, 1),
+            _conv_block(width, width * 2, 2),
+            _conv_block(width * 2, width * 2, 1),
+        )
+        feat_ch = width * 2
+        self.head_conv = nn.Conv2d(feat_ch + 1, feat_ch, 3, padding=1)
+        self.fc1 = nn.Linear(feat_ch * roi_size * roi_size, 128)
+        self.fc2 = nn.Linear(128, 2)
+
+    def forward(self, images: torch.Tensor, rois: torch.Tensor, masks: torch.Tensor) -> torch.Tensor:
+        features = self.backbone(images)
+        pooled = roi_align(
+            features,
+            rois,
+            output_size=self.roi_size,
+            spatial_scale=1.0 / FEATURE_STRIDE,
+            sampling_ratio=2,
+            aligned=True,
+        )
+        x = torch.cat([pooled * masks, masks], dim=1)
+        x = F.relu(self.head_conv(x))
+        x = torch.flatten(x, 1)
+        x = F.relu(self.fc1(x))
+        return self.fc2(x)
+
+
+# ------------------------------------------------------------
+# Geometria das vagas
+# ------------------------------------------------------------
+def input_size_for(frame_size: Tuple[int, int], input_width: int) -> Tuple[int, int]:
+    """Tamanho (w, h) da imagem de input, múltiplo do stride, mantendo o aspeto do frame."""
+    fw, fh = frame_size
+    width = min(input_width, fw) if input_width > 0 else fw
+    height = int(round(fh * width / fw))
+    return max(FEATURE_STRIDE, width // FEATURE_STRIDE * FEATURE_STRIDE), max(FEATURE_STRIDE, height // FEATURE_STRIDE * FEATURE_STRIDE)
+
+
+def spot_geometry(
+    spot_points: Sequence[np.ndarray],
+    frame_size: Tuple[int, int],
+    input_size: Tuple[int, int],
+    roi_size: int,
+) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Boxes (K, 4) em coordenadas do input e máscaras (K, 1, roi_size, roi_size) dos polígonos.
+    Calculado uma vez por configuração de vagas (como as ROIs de scale_spots).
+    """
+    sx = input_size[0] / frame_size[0]
+    sy = input_size[1] / frame_size[1]
+    boxes = np.zeros((len(spot_points), 4), dtype=np.float32)
+    masks = np.zeros((len(spot_points), 1, roi_size, roi_size), dtype=np.float32)
+
+    for i, pts in enumerate(spot_points):
+        scaled = np.asarray(pts, dtype=np.float32) * np.array([sx, sy], dtype=np.float32)
+        x0, y0 = scaled.min(axis=0)
+        x1, y1 = scaled.max(axis=0)
+        x0, y0 = max(float(x0), 0.0), max(float(y0), 0.0)
+        x1, y1 = min(float(x1), input_size[0]), min(float(y1), input_size[1])
+        if x1 - x0 < 1 or y1 - y0 < 1:
+            continue
+        boxes[i] = (x0, y0, x1, y1)
+
+        # máscara do polígono rasterizada na grelha roi_size x roi_size da bbox
+        grid = 8 * roi_size
+        local = (scaled - np.array([x0, y0], dtype=np.float32)) * np.array(
+            [grid / (x1 - x0), grid / (y1 - y0)], dtype=np.float32
+        )
+        canvas = np.zeros((grid, grid), dtype=np.uint8)
+        cv2.fillPoly(canvas, [np.round(local).astype(np.int32)], 255)
+        masks[i, 0] = cv2.resize(canvas, (roi_size, roi_size), interpolation=cv2.INTER_AREA) / 255.0
+
+    return boxes, masks
+
+
+def frame_to_tensor(frame: np.ndarray, input_size: Tuple[int, int]) -> torch.Tensor:
+    resized = cv2.resize(frame, input_size, interpolation=cv2.INTER_AREA)
+    return crops_to_tensor(resized[None])
+
+
+def rois_for_batch(boxes: np.ndarray, batch_idx: int = 0) -> torch.Tensor:
+    rois = np.empty((len(boxes), 5), dtype=np.float32)
+    rois[:, 0] = batch_idx
+    rois[:, 1:] = boxes
+    return torch.from_numpy(rois)
+
+
+# ------------------------------------------------------------
+# Checkpoints
+# ------------------------------------------------------------
+def save_roi_model(model: SharedTrunkOccupancyNet, path: Path, input_width: int):
+    torch.save(
+        {
+            "state_dict": model.state_dict(),
+            "input_width": input_width,
+            "roi_size": model.roi_size,
+            "width": model.width,
+        },
+        path,
+    )
+
+
+def load_roi_model(path: Path, device: torch.device) -> Tuple[SharedTrunkOccupancyNet, Dict[str, Any]]:
+    checkpoint = torch.load(path, map_location=device)
+    model = SharedTrunkOccupancyNet(width=checkpoint["width"], roi_size=checkpoint["roi_size"]).to(device)
+    model.load_state_dict(checkpoint["state_dict"])
+    model.eval()
+    return model, checkpoint
+
+
+class RoiOccupancyBackend:
+    """
+    Backend do SpotOccupancyClassifier que recebe o frame inteiro (predict_frame) em vez
+    do batch de crops. A geometria das vagas é cacheada por tamanho de frame.
+    """
+
+    name = "roi"
+
+    def __init__(self, model_file: Path, device: torch.device):
+        self.device = device
+        self.model, checkpoint = load_roi_model(model_file, device)
+        self.input_width = int(checkpoint["input_width"])
+        self._geometry_key = None
+        self._geometry = None
+
+    def _prepare(self, frame_size: Tuple[int, int], scaled_spots) -> Tuple[Tuple[int, int], torch.Tensor, torch.Tensor, np.ndarray]:
+        key = (frame_size, tuple(spot["name"] for spot in scaled_spots))
+        if key != self._geometry_key:
+            input_size = input_size_for(frame_size, self.input_width)
+            boxes, masks = spot_geometry(
+                [spot["points"] for spot in scaled_spots], frame_size, input_size, self.model.roi_size
+            )
+            valid = (boxes[:, 2] > boxes[:, 0]) & (boxes[:, 3] > boxes[:, 1])
+            rois = rois_for_batch(boxes[valid]).to(self.device)
+            self._geometry = (input_size, rois, torch.from_numpy(masks[valid]).to(self.device), valid)
+            self._geometry_key = key
+        return self._geometry
+
+    def predict_frame(self, frame: np.ndarray, scaled_spots) -> Tuple[np.ndarray, np.ndarray]:
+        """Devolve (probs (N,), valid (N,)) para as vagas de scaled_spots, num único forward."""
+        frame_size = (frame.shape[1], frame.shape[0])
+        input_size, rois, masks, valid = self._prepare(frame_size, scaled_spots)
+        probs = np.zeros(len(scaled_spots), dtype=np.float32)
+        if not valid.any():
+            return probs, valid
+        with torch.inference_mode():
+            logits = self.model(frame_to_tensor(frame, input_size).to(self.device), rois, masks)
+            probs[valid] = torch.softmax(logits, dim=1)[:, 1].cpu().numpy()
+        return probs, valid
+
+
+# ------------------------------------------------------------
+# Benchmark
+# ------------------------------------------------------------
+def _synthetic_spots(count: int, frame_size: Tuple[int, int], rng: np.random.Generator) -> List[np.ndarray]:
+    fw, fh = frame_size
+    spots = []
+    for _ in range(count):
+        w, h = rng.integers(40, 120), rng.integers(40, 100)
+        x, y = rng.integers(0, fw - w), rng.integers(0, fh - h)
+        spots.append(np.array([[x, y], [x + w, y], [x + w, y + h], [x, y + h]], dtype=np.int32))
+    return spots
+
+
+def benchmark(spot_counts: Sequence[int], input_width: int, repeats: int, threads: int):
+    from spot_classifier import SpotClassifier, IMG_SIZE
+    from spot_vision import build_batch, compute_spot_roi
+
+    torch.set_num_threads(threads)
+    rng = np.random.default_rng(0)
+    frame_size = (1280, 720)
+    frame = rng.integers(0, 255, (frame_size[1], frame_size[0], 3), dtype=np.uint8)
+    roi_model = SharedTrunkOccupancyNet().eval()
+    crop_model = SpotClassifier().eval()
+    input_size = input_size_for(frame_size, input_width)
+
+    print(f"[INFO] Frame {frame_size[0]}x{frame_size[1]}, input ROI {input_size[0]}x{input_size[1]}, {threads} thread(s)")
+    for count in spot_counts:
+        points = _synthetic_spots(count, frame_size, rng)
+        spots = []
+        for pts in points:
+            bbox, mask = compute_spot_roi(pts, frame_size)
+            spots.append({"name": str(len(spots)), "points": pts, "bbox": bbox, "mask": mask})
+        boxes, masks = spot_geometry(points, frame_size, input_size, roi_model.roi_size)
+        rois, masks_t = rois_for_batch(boxes), torch.from_numpy(masks)
+
+        with torch.inference_mode():
+            t0 = time.perf_counter()
+            for _ in range(repeats):
+                roi_model(frame_to_tensor(frame, input_size), rois, masks_t)
+            roi_ms = (time.perf_counter() - t0) * 1000.0 / repeats
+
+            t0 = time.perf_counter()
+            for _ in range(repeats):
+                _, batch = build_batch(frame, spots)
+                crop_model(batch)
+            crop_ms = (time.perf_counter() - t0) * 1000.0 / repeats
+        print(f"  {count:4d} vagas: tronco partilhado {roi_ms:7.2f} ms | crops {IMG_SIZE}x{IMG_SIZE} {crop_ms:7.2f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark do motor de ocupação com tronco partilhado.")
+    parser.add_argument("--spots", type=int, nargs="+", default=[11, 100, 500])
+    parser.add_argument("--input-width", type=int, default=DEFAULT_INPUT_WIDTH)
+    parser.add_argument("--repeats", type=int, default=10)
+    parser.add_argument("--threads", type=int, default=1)
+    args = parser.parse_args()
+    benchmark(args.spots, args.input_width, args.repeats, args.threads)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,346 @@
+"""
+Visão por computador das vagas, partilhada pelo main.py e pelos workers de câmara
+(camera_worker.py). Não importa o main.py para poder correr num processo separado.
+- ROIs pré-calculadas por vaga (scale_spots) e batch da CNN a partir de slices NumPy
+- política de decode JPEG reduzido (IMREAD_REDUCED_COLOR_2/4/8) a partir do tamanho das vagas
+- gate incremental por assinatura da ROI e suavização temporal com histerese
+"""
+import json
+from pathlib import Path
+from typing import Any, Dict, Optional, Tuple
+
+import cv2
+import numpy as np
+
+from spot_classifier import IMG_SIZE, crops_to_tensor
+
+SIGNATURE_SIZE = 16  # thumbnail SIGNATURE_SIZE x SIGNATURE_SIZE usado como assinatura da ROI
+DECODE_REDUCTIONS = (1, 2, 4, 8)  # fatores suportados pelo cv2.imdecode (IMREAD_REDUCED_COLOR_*)
+
+
+def load_spots(spots_path: Path):
+    if not spots_path.exists():
+        raise FileNotFoundError(f"Spots não encontrados: {spots_path}")
+
+    with open(spots_path, "r", encoding="utf-8") as f:
+        payload = json.load(f)
+
+    spots_raw = payload["spots"]
+    result = []
+
+    for s in spots_raw:
+        pts = np.array([[p["x"], p["y"]] for p in s["points"]], dtype=np.float32)
+        result.append({
+            "name": s["name"],
+            "points": pts,
+            "reserved": bool(s.get("reserved", False)),
+            "authorized": s.get("authorized_plates", []) or [],
+        })
+
+    ref = payload.get("reference_size")
+    reference_size = (
+        (int(ref["width"]), int(ref["height"]))
+        if ref else None
+    )
+
+    return result, reference_size
+
+
+def compute_spot_roi(pts: np.ndarray, frame_size: Tuple[int, int]):
+    """
+    Calcula a bounding box (recortada ao frame) e a máscara local do polígono.
+    Feito uma única vez por vaga, evita máscaras do tamanho do frame em cada recompute.
+    """
+    fw, fh = frame_size
+    x, y, w_box, h_box = cv2.boundingRect(pts)
+    x0, y0 = max(x, 0), max(y, 0)
+    x1, y1 = min(x + w_box, fw), min(y + h_box, fh)
+    if x1 <= x0 or y1 <= y0:
+        return None, None
+
+    mask = np.zeros((h_box, w_box), dtype=np.uint8)
+    cv2.fillPoly(mask, [pts - np.array([x, y], dtype=np.int32)], 255)
+    mask = np.ascontiguousarray(mask[y0 - y:y1 - y, x0 - x:x1 - x])
+    return (x0, y0, x1, y1), mask
+
+
+def reduced_frame_size(frame_size: Tuple[int, int], reduction: int) -> Tuple[int, int]:
+    """Tamanho do frame descodificado com IMREAD_REDUCED_COLOR_<reduction> (arredonda para cima, como o libjpeg)."""
+    fw, fh = frame_size
+    return -(-fw // reduction), -(-fh // reduction)
+
+
+def choose_decode_reduction(
+    scaled_spots,
+    min_spot_size: int = IMG_SIZE,
+    min_frame_width: int = 0,
+    frame_width: int = 0,
+    max_reduction: int = 8,
+) -> int:
+    """
+    Maior fator de redução do decode JPEG em que todas as vagas (já escaladas para a resolução
+    completa) continuam com pelo menos min_spot_size px no lado menor da bbox, e o frame com
+    pelo menos min_frame_width px de largura (ex.: input do backend roi).
+    """
+    sides = [
+        min(spot["bbox"][2] - spot["bbox"][0], spot["bbox"][3] - spot["bbox"][1])
+        for spot in scaled_spots
+        if spot["bbox"] is not None
+    ]
+    if not sides:
+        return 1
+    smallest = min(sides)
+    best = 1
+    for reduction in DECODE_REDUCTIONS:
+        if reduction > max_reduction:
+            break
+        if smallest / reduction < min_spot_size:
+            break
+        if min_frame_width and frame_width and frame_width / reduction < min_frame_width:
+            break
+        best = reduction
+    return best
+
+
+def scale_spots(spots, ref_size, frame_size, reduction: int = 1):
+    """
+    Escala as vagas de reference_size para frame_size (resolução completa da câmara).
+    reduction > 1: frames descodificados com IMREAD_REDUCED_COLOR_<reduction>; as vagas
+    ficam nas coordenadas do frame reduzido.
+    """
+    fw, fh = frame_size
+
+    if ref_size:
+        sx = fw / ref_size[0]
+        sy = fh / ref_size[1]
+        print(f"[INFO] Escala vagas: sx={sx:.3f}, sy={sy:.3f}")
+    else:
+        sx = sy = 1.0
+        print("[WARN] reference_size ausente, assumindo escala 1:1")
+
+    if reduction > 1:
+        sx /= reduction
+        sy /= reduction
+        fw, fh = reduced_frame_size(frame_size, reduction)
+        print(f"[INFO] Decode reduzido 1/{reduction}: vagas em {fw}x{fh}")
+
+    scaled = []
+    for spot in spots:
+        pts = spot["points"].copy()
+        pts[:, 0] *= sx
+        pts[:, 1] *= sy
+
+        pts_int = np.round(pts).astype(np.int32)
+        bbox, mask = compute_spot_roi(pts_int, (fw, fh))
+
+        scaled.append({
+            "name": spot["name"],
+            "points": pts_int,
+            "bbox": bbox,
+            "mask": mask,
+            "reserved": bool(spot.get("reserved", False)),
+            "authorized": spot.get("authorized", []) or [],
+        })
+
+    return scaled
+
+
+def build_batch(frame, scaled_spots):
+    """
+    Constrói o batch (N, 3, IMG_SIZE, IMG_SIZE) a partir das ROIs pré-calculadas em scale_spots.
+    Só toca nos pixels da bounding box de cada vaga.
+    """
+    meta = []
+    crops = np.empty((len(scaled_spots), IMG_SIZE, IMG_SIZE, 3), dtype=np.uint8)
+
+    for spot in scaled_spots:
+        bbox = spot.get("bbox")
+        if bbox is None:
+            continue
+        x0, y0, x1, y1 = bbox
+        roi = frame[y0:y1, x0:x1]
+        if roi.shape[:2] != spot["mask"].shape:
+            continue
+
+        masked = cv2.bitwise_and(roi, roi, mask=spot["mask"])
+        crops[len(meta)] = cv2.resize(masked, (IMG_SIZE, IMG_SIZE), interpolation=cv2.INTER_AREA)
+        meta.append((spot["name"], spot["points"]))
+
+    if not meta:
+        return meta, None
+
+    return meta, crops_to_tensor(crops[:len(meta)])
+
+
+def compute_spot_signatures(frame, scaled_spots) -> np.ndarray:
+    """
+    Assinatura barata de cada vaga: thumbnail em tons de cinzento da ROI mascarada.
+    Vagas sem ROI válida ficam com assinatura a zeros.
+    """
+    signatures = np.zeros((len(scaled_spots), SIGNATURE_SIZE, SIGNATURE_SIZE), dtype=np.float32)
+
+    for i, spot in enumerate(scaled_spots):
+        bbox = spot.get("bbox")
+        if bbox is None:
+            continue
+        x0, y0, x1, y1 = bbox
+        roi = frame[y0:y1, x0:x1]
+        if roi.shape[:2] != spot["mask"].shape:
+            continue
+
+        masked = cv2.bitwise_and(roi, roi, mask=spot["mask"])
+        thumb = cv2.resize(masked, (SIGNATURE_SIZE, SIGNATURE_SIZE), interpolation=cv2.INTER_AREA)
+        signatures[i] = cv2.cvtColor(thumb, cv2.COLOR_BGR2GRAY)
+
+    return signatures
+
+
+class SpotChangeGate:
+    """
+    Decide que vagas precisam de passar pela CNN.
+    Compara a assinatura atual com a da última classificação de cada vaga e força
+    uma reclassificação total a cada refresh_seconds.
+    """
+
+    def __init__(self, delta: float, refresh_seconds: float):
+        self.delta = delta
+        self.refresh_seconds = refresh_seconds
+        self.reference: Optional[np.ndarray] = None
+        self.last_full_refresh = 0.0
+
+    def select(self, signatures: np.ndarray, now: float) -> np.ndarray:
+        full = (
+            self.reference is None
+            or self.reference.shape != signatures.shape
+            or now - self.last_full_refresh >= self.refresh_seconds
+        )
+        if full:
+            self.last_full_refresh = now
+            return np.arange(len(signatures))
+
+        diff = np.abs(signatures - self.reference).mean(axis=(1, 2))
+        return np.flatnonzero(diff > self.delta)
+
+    def commit(self, indices: np.ndarray, signatures: np.ndarray):
+        if self.reference is None or self.reference.shape != signatures.shape:
+            self.reference = signatures.copy()
+        else:
+            self.reference[indices] = signatures[indices]
+
+
+class OccupancySmoother:
+    """
+    Suavização temporal da ocupação para todas as vagas de uma vez.
+    - votos num ring buffer NumPy [vagas x history_len] com maioria vetorizada
+    - histerese: uma vaga livre só vota "ocupado" com p >= enter_threshold e uma vaga
+      ocupada só vota "livre" com p < exit_threshold
+    - dwell mínimo: o estado só muda se o anterior durou pelo menos min_dwell segundos
+    """
+
+    def __init__(self, n_spots: int, history_len: int, enter_threshold: float, exit_threshold: float, min_dwell: float):
+        self.history_len = max(1, history_len)
+        self.enter_threshold = enter_threshold
+        self.exit_threshold = min(exit_threshold, enter_threshold)
+        self.min_dwell = max(0.0, min_dwell)
+
+        self.votes = np.zeros((n_spots, self.history_len), dtype=np.uint8)
+        self.filled = np.zeros(n_spots, dtype=np.int32)
+        self.cursor = np.zeros(n_spots, dtype=np.int32)
+        self.occupied = np.zeros(n_spots, dtype=bool)
+        self.since = np.full(n_spots, -np.inf)
+
+    def update(self, probs: np.ndarray, valid: np.ndarray, now: float) -> np.ndarray:
+        """probs (N,) com p(ocupado); valid (N,) indica as vagas já classificadas. Devolve ocupado (N,)."""
+        idx = np.flatnonzero(valid)
+        if idx.size == 0:
+            return self.occupied.copy()
+
+        thresholds = np.where(self.occupied[idx], self.exit_threshold, self.enter_threshold)
+        self.votes[idx, self.cursor[idx]] = probs[idx] >= thresholds
+        self.cursor[idx] = (self.cursor[idx] + 1) % self.history_len
+        self.filled[idx] = np.minimum(self.filled[idx] + 1, self.history_len)
+
+        majority = self.votes[idx].sum(axis=1) * 2 > self.filled[idx]
+        change = (majority != self.occupied[idx]) & (now - self.since[idx] >= self.min_dwell)
+        changed = idx[change]
+        self.occupied[changed] = majority[change]
+        self.since[changed] = now
+        return self.occupied.copy()
+
+
+
+def extract_spot_crop(frame: np.ndarray, pts: np.ndarray, expand_ratio: float = 1.5) -> Optional[np.ndarray]:
+    """
+    Extrai o crop de uma vaga do frame.
+    expand_ratio: fator de expansão da área (1.5 = 50% maior) para dar mais contexto ao ALPR.
+    """
+    x, y, w, h = cv2.boundingRect(pts)
+    if w <= 0 or h <= 0:
+        return None
+    
+    # Calcular centro e nova dimensão expandida
+    cx, cy = x + w // 2, y + h // 2
+    new_w = int(w * expand_ratio)
+    new_h = int(h * expand_ratio)
+    
+    # Calcular novos limites com clipping para não sair do frame
+    x1 = max(0, cx - new_w // 2)
+    y1 = max(0, cy - new_h // 2)
+    x2 = min(frame.shape[1], x1 + new_w)
+    y2 = min(frame.shape[0], y1 + new_h)
+    
+    crop = frame[y1:y2, x1:x2]
+    if crop.size == 0:
+        return None
+    return crop.copy()
+
+
+class SpotOccupancyClassifier:
+    """
+    Parte de visão do estágio de inferência de uma câmara: gate incremental (opcional),
+    batch da CNN, backend e suavização. classify() devolve arrays indexados como scaled_spots.
+    """
+
+    def __init__(self, backend, scaled_spots, smoother: OccupancySmoother, change_gate: Optional[SpotChangeGate] = None):
+        self.backend = backend
+        self.scaled_spots = scaled_spots
+        self.smoother = smoother
+        self.change_gate = change_gate
+        self.spot_index = {spot["name"]: i for i, spot in enumerate(scaled_spots)}
+        self.probs = np.zeros(len(scaled_spots), dtype=np.float32)
+        self.classified = np.zeros(len(scaled_spots), dtype=bool)
+
+    def classify(self, frame: np.ndarray, now: float) -> Dict[str, Any]:
+        if self.change_gate is not None:
+            signatures = compute_spot_signatures(frame, self.scaled_spots)
+            selected = self.change_gate.select(signatures, now)
+        else:
+            selected = np.arange(len(self.scaled_spots))
+
+        if hasattr(self.backend, "predict_frame"):
+            # tronco partilhado: um forward dá todas as vagas, por isso atualiza-as todas
+            if len(selected):
+                probs, valid = self.backend.predict_frame(frame, self.scaled_spots)
+                self.probs[valid] = probs[valid]
+                self.classified |= valid
+                selected = np.arange(len(self.scaled_spots))
+        else:
+            meta, batch = build_batch(frame, [self.scaled_spots[i] for i in selected])
+            if batch is not None:
+                probs = self.backend.predict(batch)
+                rows = [self.spot_index[name] for name, _ in meta]
+                self.probs[rows] = probs
+                self.classified[rows] = True
+
+        if self.change_gate is not None:
+            self.change_gate.commit(selected, signatures)
+
+        if self.classified.any():
+            occupied = self.smoother.update(self.probs, self.classified, now)
+        else:
+            occupied = np.zeros(len(self.scaled_spots), dtype=bool)
+        return {
+            "probs": self.probs.copy(),
+            "classified": self.classified.copy(),
+            "occupied": occupied,
+        }
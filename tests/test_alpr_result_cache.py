@@ -0,0 +1,69 @@
+import pytest
+
+import alpr_service
+from alpr_service import AlprResultCache
+
+EVENT = {"plate": "AA12BB", "ocr_conf": 0.9}
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = {"t": 1000.0}
+    monkeypatch.setattr(alpr_service.time, "time", lambda: now["t"])
+    return now
+
+
+def test_hit_within_max_distance(clock):
+    cache = AlprResultCache(max_distance=2)
+    cache.store("A1", 0b1111, EVENT)
+    event = cache.lookup("A1", 0b0111)
+    assert event["plate"] == "AA12BB" and event["cache_distance"] == 1
+    assert cache.stats()["hits"] == 1
+
+
+def test_miss_above_max_distance(clock):
+    cache = AlprResultCache(max_distance=2)
+    cache.store("A1", 0b1111, EVENT)
+    assert cache.lookup("A1", 0b1000) is None  # 3 bits
+    stats = cache.stats()
+    assert stats["misses"] == 1 and stats["nearest_distance_histogram"] == {3: 1}
+
+
+def test_other_spot_is_a_miss(clock):
+    cache = AlprResultCache()
+    cache.store("A1", 0b1111, EVENT)
+    assert cache.lookup("A2", 0b1111) is None
+
+
+def test_ttl_expiry(clock):
+    cache = AlprResultCache(ttl=60.0)
+    cache.store("A1", 0b1111, EVENT)
+    clock["t"] += 60.0
+    assert cache.lookup("A1", 0b1111) is not None
+    clock["t"] += 0.1
+    assert cache.lookup("A1", 0b1111) is None
+    stats = cache.stats()
+    assert stats["expired"] == 1 and stats["entries"] == 0
+
+
+def test_per_spot_eviction(clock):
+    cache = AlprResultCache(max_distance=0, per_spot=2)
+    for crop_hash in (1, 2, 3):
+        cache.store("A1", crop_hash, EVENT)
+    cache.store("A2", 1, EVENT)
+    assert cache.lookup("A1", 1) is None  # o mais antigo da vaga
+    assert cache.lookup("A1", 2) is not None and cache.lookup("A1", 3) is not None
+    assert cache.lookup("A2", 1) is not None
+    assert cache.stats()["evictions"] == 1
+
+
+def test_global_eviction_is_lru(clock):
+    cache = AlprResultCache(max_distance=0, max_entries=2)
+    cache.store("A1", 1, EVENT)
+    cache.store("A2", 1, EVENT)
+    assert cache.lookup("A1", 1) is not None  # A1 passa a ser o mais recente
+    cache.store("A3", 1, EVENT)
+    assert cache.lookup("A2", 1) is None
+    assert cache.lookup("A1", 1) is not None and cache.lookup("A3", 1) is not None
+    stats = cache.stats()
+    assert stats["entries"] == 2 and stats["evictions"] == 1
@@ -0,0 +1,68 @@
+from plate_index import CONFUSABLE_COST, PlateIndex, canonical_plate, plate_distance
+
+
+def test_distance_exact_and_symmetric():
+    assert plate_distance("AB12CD", "AB12CD") == 0.0
+    assert plate_distance("A812CD", "AB12CD") == plate_distance("AB12CD", "A812CD")
+
+
+def test_letter_digit_confusions_are_cheap():
+    for read, plate in [("A812CD", "AB12CD"), ("AB12C0", "AB12CO"), ("A1B2CD", "AIB2CD"),
+                        ("5B12CD", "SB12CD"), ("AB1ZCD", "AB12CD"), ("AB12CG", "AB12C6")]:
+        assert plate_distance(read, plate) == CONFUSABLE_COST
+
+
+def test_letter_letter_swaps_are_full_edits():
+    # O/D, I/L, U/V são matrículas diferentes, não erros de OCR
+    assert plate_distance("AB12C0", "AB12CD") == 1.0
+    assert plate_distance("AL12CD", "AI12CD") == 1.0
+    assert plate_distance("UB12CD", "VB12CD") == 1.0
+    assert canonical_plate("AL12CD") != canonical_plate("AI12CD")
+
+
+def test_insertion_and_deletion():
+    assert plate_distance("AB12CD", "AB12C") == 1.0
+    assert plate_distance("AB12CD", "XAB12CD") == 1.0
+
+
+def test_best_match_confusable_only():
+    index = PlateIndex(max_edits=0)
+    index.add("AB12CD")
+    assert index.best_match("A812CD", CONFUSABLE_COST) == ("AB12CD", CONFUSABLE_COST)
+    assert index.best_match("AB12CD", CONFUSABLE_COST) == ("AB12CD", 0.0)
+    assert index.best_match("AB12C0", CONFUSABLE_COST) is None  # D não é confundível com 0
+    assert index.best_match("AB12CE", CONFUSABLE_COST) is None
+    assert index.best_match("", CONFUSABLE_COST) is None
+
+
+def test_best_match_with_edits():
+    index = PlateIndex(max_edits=1)
+    index.add("AB12CD")
+    assert index.best_match("AB12CE", 1.0) == ("AB12CD", 1.0)
+    assert index.best_match("AB12CE", CONFUSABLE_COST) is None
+    assert index.best_match("AB12", 1.0) is None
+
+
+def test_tie_is_ambiguous():
+    index = PlateIndex(max_edits=0)
+    index.add("AB1200")
+    index.add("AB12OO")
+    assert index.best_match("AB120O", CONFUSABLE_COST) is None
+    stats = index.stats()
+    assert stats["lookups"] == 1 and stats["ambiguous"] == 1 and stats["matches"] == 0
+
+
+def test_add_remove_sync():
+    index = PlateIndex(max_edits=1)
+    index.add("AB12CD")
+    index.add("AB12CD")
+    assert len(index) == 1 and "AB12CD" in index
+    index.remove("AB12CD")
+    assert len(index) == 0
+    assert index.best_match("A812CD", CONFUSABLE_COST) is None
+    assert index._variants == {}
+
+    assert index.sync(["AB12CD", "XY34ZW", ""]) == (2, 0)
+    assert index.sync(["XY34ZW", "QQ99RR"]) == (1, 1)
+    assert "AB12CD" not in index
+    assert index.best_match("XY34ZW", CONFUSABLE_COST) == ("XY34ZW", 0.0)
@@ -0,0 +1,106 @@
+import numpy as np
+import pytest
+
+from plate_tracker import PlateTracker, appearance_signature, signature_distance
+
+
+def _crop(color, band_rows, band_value):
+    crop = np.full((120, 80, 3), color, np.uint8)
+    crop[band_rows] = band_value
+    return crop
+
+
+RED = appearance_signature(_crop((30, 30, 200), slice(20, 40), 20))
+BLUE = appearance_signature(_crop((200, 80, 30), slice(60, 90), 240))
+CONFIDENT = {"plate": "AA12BB", "ocr_conf": 0.95}
+WEAK = {"plate": "AA12BB", "ocr_conf": 0.4}
+
+
+@pytest.fixture
+def tracker():
+    return PlateTracker(max_change=0.35, min_conf=0.8, retry_seconds=10.0, max_retries=2, confirm=2)
+
+
+def test_signatures_differ():
+    assert signature_distance(RED, RED) == pytest.approx(0.0, abs=1e-6)
+    assert signature_distance(RED, BLUE) > 0.35
+
+
+def test_stalled_when_read_never_arrives(tracker):
+    tracker.start("A1", now=0.0)
+    assert tracker.check("A1", RED, now=5.0) is None
+    assert tracker.check("A1", RED, now=10.0) == "stalled"
+    # novo pedido: espera outra vez retry_seconds
+    assert tracker.check("A1", RED, now=15.0) is None
+    assert tracker.check("A1", RED, now=20.0) == "stalled"
+    assert tracker.stats()["rereads"]["stalled"] == 2
+
+
+def test_low_confidence_backoff_up_to_max_retries(tracker):
+    tracker.start("A1", now=0.0)
+    tracker.on_read("A1", WEAK, now=0.0)
+    assert tracker.snapshot("A1")["state"] == "low_confidence"
+    assert tracker.check("A1", RED, now=1.0) is None  # referência
+    assert tracker.check("A1", RED, now=9.0) is None
+    assert tracker.check("A1", RED, now=10.0) == "low_confidence"
+
+    tracker.on_read("A1", WEAK, now=10.0)
+    assert tracker.check("A1", RED, now=11.0) is None
+    assert tracker.check("A1", RED, now=29.0) is None  # backoff: 10 * 2**1
+    assert tracker.check("A1", RED, now=30.0) == "low_confidence"
+
+    tracker.on_read("A1", None, now=30.0)
+    assert tracker.check("A1", RED, now=31.0) is None
+    assert tracker.check("A1", RED, now=1000.0) is None  # max_retries esgotado
+    assert tracker.stats()["rereads"]["low_confidence"] == 2
+
+
+def test_confident_read_resets_retries(tracker):
+    tracker.start("A1", now=0.0)
+    tracker.on_read("A1", WEAK, now=0.0)
+    tracker.check("A1", RED, now=1.0)
+    assert tracker.check("A1", RED, now=10.0) == "low_confidence"
+    tracker.on_read("A1", CONFIDENT, now=10.0)
+    tracker.check("A1", RED, now=11.0)
+    assert tracker.check("A1", RED, now=1000.0) is None
+    assert tracker.snapshot("A1")["state"] == "verified"
+
+
+def test_changed_after_confirm_checks(tracker):
+    tracker.start("A1", now=0.0)
+    tracker.on_read("A1", CONFIDENT, now=0.0)
+    assert tracker.check("A1", RED, now=1.0) is None
+    # uma só verificação diferente (ex.: alguém a passar) não chega
+    assert tracker.check("A1", BLUE, now=2.0) is None
+    assert tracker.check("A1", RED, now=3.0) is None
+    assert tracker.check("A1", BLUE, now=4.0) is None
+    assert tracker.check("A1", BLUE, now=5.0) == "changed"
+    snapshot = tracker.snapshot("A1")
+    assert snapshot["state"] == "reading" and snapshot["changes"] == 1
+    assert tracker.stats()["rereads"]["changed"] == 1
+
+
+def test_verified_at_only_on_confident_reads(tracker):
+    tracker.start("A1", now=0.0)
+    assert tracker.snapshot("A1")["verified_at"] is None
+    tracker.on_read("A1", CONFIDENT, now=1.0)
+    assert tracker.snapshot("A1")["verified_at"] == 1.0
+    tracker.check("A1", RED, now=2.0)
+    tracker.check("A1", RED, now=5.0)
+    assert tracker.snapshot("A1")["verified_at"] == 5.0
+
+    tracker.on_read("A1", WEAK, now=6.0)
+    assert tracker.snapshot("A1")["verified_at"] is None
+    tracker.check("A1", RED, now=7.0)
+    tracker.check("A1", RED, now=8.0)
+    assert tracker.snapshot("A1")["verified_at"] is None
+
+
+def test_unknown_or_cleared_spot(tracker):
+    assert tracker.check("A1", RED, now=0.0) is None
+    tracker.on_read("A1", CONFIDENT, now=0.0)
+    assert tracker.snapshot("A1") is None
+    tracker.start("A1", now=0.0)
+    tracker.clear("A1")
+    assert tracker.snapshot("A1") is None
+    assert tracker.stats()["tracks"] == 0
@@ -0,0 +1,264 @@
+"""
+Treino do motor de ocupação com tronco partilhado (spot_roi_model.py).
+
+Reutiliza a geometria de parking_spots.json e os labels existentes em dataset_esp32:
+cada crop "<frame_id>_<vaga>.png" em free/ ou occupied/ passa a ser o label dessa vaga
+no frame completo <frame_id>. Os frames completos vêm de:
+  - "vid_fNNNNNN": frame NNNNNN do vídeo usado no collect_from_video.py (--video)
+  - outros ids:    dataset_esp32/frames/<frame_id>.jpg (gravado pelo collect_training_data.py)
+Vagas sem label num frame são ignoradas na loss.
+
+Opcionalmente (--teacher spot_classifier.pth) rotula frames extra do vídeo com o
+SpotClassifier atual, usando só previsões confiantes.
+
+Uso:
+    python train_roi_model.py
+    python train_roi_model.py --video video.mp4 --teacher spot_classifier.pth --teacher-frames 200
+    SPOT_BACKEND=roi MODEL_FILE=spot_roi_model.pth uvicorn main:app
+"""
+import argparse
+import random
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+import cv2
+import numpy as np
+import torch
+import torch.nn as nn
+
+from spot_roi_model import (
+    DEFAULT_INPUT_WIDTH,
+    SharedTrunkOccupancyNet,
+    frame_to_tensor,
+    input_size_for,
+    rois_for_batch,
+    save_roi_model,
+    spot_geometry,
+)
+from spot_vision import load_spots, scale_spots, build_batch
+
+# ============ CONFIGURAÇÕES ============
+DATASET_DIR = "dataset_esp32"
+SPOTS_FILE = "parking_spots.json"
+VIDEO_FILE = "video.mp4"
+MODEL_OUT = "spot_roi_model.pth"
+EPOCHS = 40
+BATCH_FRAMES = 4
+VAL_SPLIT = 0.2
+TEACHER_CONFIDENCE = 0.85
+SEED = 42
+IGNORE = -1
+
+
+# ============ DATASET ============
+def collect_crop_labels(dataset_dir: Path, spot_names: List[str]) -> Dict[str, Dict[str, int]]:
+    """{frame_id: {vaga: label}} a partir dos nomes dos crops em free/ e occupied/."""
+    labels: Dict[str, Dict[str, int]] = {}
+    for folder, label in (("free", 0), ("occupied", 1)):
+        for path in sorted((dataset_dir / folder).glob("*.*")):
+            if path.suffix.lower() not in (".png", ".jpg"):
+                continue
+            stem = path.stem
+            for name in spot_names:
+                if stem.endswith("_" + name):
+                    labels.setdefault(stem[: -len(name) - 1], {})[name] = label
+                    break
+    return labels
+
+
+def read_video_frame(cap: Optional[cv2.VideoCapture], index: int) -> Optional[np.ndarray]:
+    if cap is None:
+        return None
+    cap.set(cv2.CAP_PROP_POS_FRAMES, index)
+    ok, frame = cap.read()
+    return frame if ok else None
+
+
+def load_labelled_frames(
+    crop_labels: Dict[str, Dict[str, int]],
+    spot_names: List[str],
+    cap: Optional[cv2.VideoCapture],
+    frames_dir: Path,
+) -> List[Tuple[np.ndarray, np.ndarray]]:
+    samples = []
+    missing = 0
+    for frame_id, spot_labels in sorted(crop_labels.items()):
+        if frame_id.startswith("vid_f"):
+            frame = read_video_frame(cap, int(frame_id[len("vid_f"):]))
+        else:
+            frame = None
+            for ext in (".jpg", ".png"):
+                candidate = frames_dir / f"{frame_id}{ext}"
+                if candidate.exists():
+                    frame = cv2.imread(str(candidate), cv2.IMREAD_COLOR)
+                    break
+        if frame is None:
+            missing += 1
+            continue
+        labels = np.full(len(spot_names), IGNORE, dtype=np.int64)
+        for name, label in spot_labels.items():
+            labels[spot_names.index(name)] = label
+        samples.append((frame, labels))
+    if missing:
+        print(f"[WARN] {missing} frames rotulados sem imagem completa (ignorados)")
+    return samples
+
+
+def teacher_frames(teacher_path: Path, cap: cv2.VideoCapture, spots, ref, count: int) -> List[Tuple[np.ndarray, np.ndarray]]:
+    """Pseudo-labels do SpotClassifier atual em frames espaçados do vídeo."""
+    from spot_inference import TorchEagerBackend
+
+    teacher = TorchEagerBackend(teacher_path, torch.device("cpu"))
+    total = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+    fw = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))
+    fh = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
+    scaled = scale_spots(spots, ref, (fw, fh))
+    index = {spot["name"]: i for i, spot in enumerate(scaled)}
+
+    samples = []
+    for frame_i in np.linspace(0, max(total - 1, 0), num=count, dtype=int):
+        frame = read_video_frame(cap, int(frame_i))
+        if frame is None:
+            continue
+        meta, batch = build_batch(frame, scaled)
+        if batch is None:
+            continue
+        probs = teacher.predict(batch)
+        labels = np.full(len(scaled), IGNORE, dtype=np.int64)
+        for (name, _), p in zip(meta, probs):
+            if p >= TEACHER_CONFIDENCE:
+                labels[index[name]] = 1
+            elif p <= 1.0 - TEACHER_CONFIDENCE:
+                labels[index[name]] = 0
+        samples.append((frame, labels))
+    return samples
+
+
+def augment(frame: np.ndarray, rng: random.Random) -> np.ndarray:
+    """Augmentation fotométrica (não mexe na geometria, que é fixa por câmara)."""
+    alpha = rng.uniform(0.7, 1.3)   # contraste
+    beta = rng.uniform(-30, 30)     # brilho
+    out = cv2.convertScaleAbs(frame, alpha=alpha, beta=beta)
+    if rng.random() < 0.3:
+        out = cv2.GaussianBlur(out, (3, 3), 0)
+    return out
+
+
+# ============ TREINO ============
+def run_batch(model, frames, input_size, boxes, masks_t, device):
+    images = torch.cat([frame_to_tensor(f, input_size) for f in frames]).to(device)
+    rois = torch.cat([rois_for_batch(boxes, b) for b in range(len(frames))]).to(device)
+    masks = masks_t.repeat(len(frames), 1, 1, 1).to(device)
+    return model(images, rois, masks)
+
+
+def evaluate(model, samples, input_size, boxes, masks_t, device) -> float:
+    model.eval()
+    correct = total = 0
+    with torch.no_grad():
+        for start in range(0, len(samples), BATCH_FRAMES):
+            chunk = samples[start:start + BATCH_FRAMES]
+            logits = run_batch(model, [f for f, _ in chunk], input_size, boxes, masks_t, device)
+            labels = torch.from_numpy(np.concatenate([l for _, l in chunk])).to(device)
+            known = labels != IGNORE
+            correct += (logits.argmax(dim=1)[known] == labels[known]).sum().item()
+            total += known.sum().item()
+    return correct / total if total else 0.0
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Treina o motor de ocupação com tronco partilhado + ROIAlign.")
+    parser.add_argument("--spots", default=SPOTS_FILE)
+    parser.add_argument("--dataset", default=DATASET_DIR)
+    parser.add_argument("--video", default=VIDEO_FILE, help="Vídeo de onde vieram os crops vid_f* (collect_from_video.py)")
+    parser.add_argument("--teacher", default=None, help="Pesos do SpotClassifier para pseudo-labels (opcional)")
+    parser.add_argument("--teacher-frames", type=int, default=120)
+    parser.add_argument("--input-width", type=int, default=DEFAULT_INPUT_WIDTH)
+    parser.add_argument("--epochs", type=int, default=EPOCHS)
+    parser.add_argument("--output", default=MODEL_OUT)
+    args = parser.parse_args()
+
+    rng = random.Random(SEED)
+    torch.manual_seed(SEED)
+    device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
+
+    spots, ref = load_spots(Path(args.spots))
+    spot_names = [spot["name"] for spot in spots]
+    print(f"[INFO] {len(spots)} vagas em {args.spots}")
+
+    cap = cv2.VideoCapture(args.video) if Path(args.video).exists() else None
+    if cap is None:
+        print(f"[WARN] Vídeo {args.video} não encontrado; crops vid_f* serão ignorados")
+
+    dataset_dir = Path(args.dataset)
+    crop_labels = collect_crop_labels(dataset_dir, spot_names)
+    samples = load_labelled_frames(crop_labels, spot_names, cap, dataset_dir / "frames")
+    print(f"[INFO] {len(samples)} frames com labels manuais")
+
+    if args.teacher:
+        if cap is None:
+            print("[ERRO] --teacher precisa de --video")
+            return
+        extra = teacher_frames(Path(args.teacher), cap, spots, ref, args.teacher_frames)
+        print(f"[INFO] {len(extra)} frames com pseudo-labels do teacher ({args.teacher})")
+        samples.extend(extra)
+
+    if len(samples) < 2:
+        print("[ERRO] Frames insuficientes para treinar (usar --teacher ou recolher mais dados)")
+        return
+
+    # Todas as amostras vêm da mesma câmara: geometria calculada uma vez
+    frame_size = (samples[0][0].shape[1], samples[0][0].shape[0])
+    scaled = scale_spots(spots, ref, frame_size)
+    input_size = input_size_for(frame_size, args.input_width)
+    model = SharedTrunkOccupancyNet().to(device)
+    boxes, masks = spot_geometry([s["points"] for s in scaled], frame_size, input_size, model.roi_size)
+    masks_t = torch.from_numpy(masks)
+
+    rng.shuffle(samples)
+    n_val = max(1, int(len(samples) * VAL_SPLIT))
+    val_samples, train_samples = samples[:n_val], samples[n_val:]
+    known = np.concatenate([l for _, l in samples])
+    print(f"[INFO] Labels: {(known == 0).sum()} livres, {(known == 1).sum()} ocupadas | "
+          f"treino {len(train_samples)} frames, validação {len(val_samples)} frames")
+    if not (known != IGNORE).any():
+        print("[ERRO] Nenhuma vaga rotulada (o teacher não teve previsões confiantes?)")
+        return
+
+    criterion = nn.CrossEntropyLoss(ignore_index=IGNORE)
+    optimizer = torch.optim.Adam(model.parameters(), lr=1e-3, weight_decay=1e-4)
+    scheduler = torch.optim.lr_scheduler.StepLR(optimizer, step_size=15, gamma=0.5)
+    best_val_acc = -1.0
+
+    for epoch in range(1, args.epochs + 1):
+        model.train()
+        rng.shuffle(train_samples)
+        running_loss = 0.0
+        for start in range(0, len(train_samples), BATCH_FRAMES):
+            chunk = train_samples[start:start + BATCH_FRAMES]
+            logits = run_batch(model, [augment(f, rng) for f, _ in chunk], input_size, boxes, masks_t, device)
+            labels = torch.from_numpy(np.concatenate([l for _, l in chunk])).to(device)
+            if (labels == IGNORE).all():
+                continue
+            loss = criterion(logits, labels)
+            optimizer.zero_grad()
+            loss.backward()
+            optimizer.step()
+            running_loss += loss.item() * len(chunk)
+        scheduler.step()
+
+        val_acc = evaluate(model, val_samples, input_size, boxes, masks_t, device)
+        line = f"  Época {epoch:02d}/{args.epochs} | Loss: {running_loss / max(len(train_samples), 1):.4f} | Val: {val_acc:.1%}"
+        if val_acc > best_val_acc:
+            best_val_acc = val_acc
+            save_roi_model(model.cpu(), Path(args.output), args.input_width)
+            model.to(device)
+            line += " (novo melhor)"
+        print(line)
+
+    print(f"[INFO] Melhor val accuracy: {best_val_acc:.1%} | modelo: {args.output}")
+    print(f"[INFO] Usar com: SPOT_BACKEND=roi MODEL_FILE={args.output}")
+
+
+if __name__ == "__main__":
+    main()